@@ -0,0 +1,363 @@
+import hashlib
+import json
+from collections import namedtuple
+from datetime import timezone
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+import compression
+import wire
+from batch_aggregate import derive, merge_specs
+from pagination import decode_cursor, encode_cursor, page_params
+from result_cache import ResultCache
+from rollups import SAMPLE_TABLE, with_error
+from spatial import check_bin_params
+
+# Everything app.py and async_app.py have in common: configuration, the
+# row-level queries, and the parameter parsing, planning and response shaping
+# around each route. Nothing here does I/O or reads the request object, so
+# each app passes in request.args and runs the queries its own way.
+
+config = yaml.safe_load(Path("config.yml").read_text())
+DB_HOST = config['db']['host']
+DB_USER = config['db']['user']
+DB_PASSWORD = config['db']['passwd']
+DB_NAME = config['db']['db']
+DB_PORT = int(config['db'].get('port', 3306))
+POOL_CONFIG = config.get('pool') or {}
+CACHE_CONFIG = config.get('cache') or {}
+GEOCODER_CONFIG = config.get('geocoder') or {}
+COMPRESSION_CONFIG = config.get('compression') or {}
+# mysql: aggregates run as SQL against the rollups. memory: hovetl_crimes is
+# loaded into NumPy arrays and aggregates never touch the database.
+ENGINE = config.get('engine', 'mysql')
+if ENGINE not in ('mysql', 'memory'):
+    raise ValueError(f"engine must be 'mysql' or 'memory', not {ENGINE!r}")
+# Encodings this server can produce, in preference order
+ENCODINGS = compression.available(COMPRESSION_CONFIG.get('encodings', compression.ENCODINGS))
+COMPRESS_MIN_SIZE = COMPRESSION_CONFIG.get('min_size', compression.MIN_SIZE)
+GEOCODE_BATCH_TIMEOUT = GEOCODER_CONFIG.get('batch_timeout', 30)
+STREAM_BATCH_SIZE = 5000
+
+# Row-level queries that cannot be answered from a rollup
+LOCATION_QUERY = "SELECT Latitude, Longitude FROM hovetl_crimes WHERE City = %s"
+GEOCODE_POINTS_QUERY = "SELECT Latitude, Longitude FROM hovetl_crimes WHERE City = %s AND Sub_Category_Lower LIKE %s"
+# Keyset pages of the same rows: the rows after a CID, in CID order, see last_page()
+LOCATION_PAGE_QUERY = "SELECT CID, Latitude, Longitude FROM hovetl_crimes WHERE City = %s AND CID > %s ORDER BY CID LIMIT %s"
+GEOCODE_POINTS_PAGE_QUERY = (
+    "SELECT CID, Latitude, Longitude FROM hovetl_crimes"
+    " WHERE City = %s AND Sub_Category_Lower LIKE %s AND CID > %s ORDER BY CID LIMIT %s"
+)
+# The same points from the stratified sample, for approx=true
+SAMPLE_LOCATION_QUERY = f"SELECT Latitude, Longitude FROM {SAMPLE_TABLE} WHERE City = %s"
+SAMPLE_LOCATION_PAGE_QUERY = f"SELECT CID, Latitude, Longitude FROM {SAMPLE_TABLE} WHERE City = %s AND CID > %s ORDER BY CID LIMIT %s"
+SAMPLE_WEIGHTED_LOCATION_QUERY = f"SELECT Latitude, Longitude, Weight FROM {SAMPLE_TABLE} WHERE City = %s"
+
+# Endpoints whose successful responses depend only on the data version and
+# the query parameters, so clients can revalidate them with If-None-Match.
+CONDITIONAL_ENDPOINTS = {
+    'list_dimensions', 'crime_category_per_city', 'crime_over_years', 'crime_per_month',
+    'crimes_by_date_range', 'crime_comparison_per_year', 'crime_statistics_by_category',
+    'crime_rate_per_city', 'crime_by_day_of_week', 'crime_details_by_city_category',
+    'crime_location_density_by_city',
+}
+
+ORIENTS = ('records', 'columns')
+
+# A validated /crime_location_density_by_city request; the bin fields are
+# None unless mode is bins
+DensityRequest = namedtuple('DensityRequest', 'city stream mode fmt dtype approx scope after limit bin_size outlier_iqr bbox')
+# A validated /geocode_points request; args fill GEOCODE_POINTS_QUERY
+PointsRequest = namedtuple('PointsRequest', 'args scope fmt dtype after limit')
+
+
+def make_result_cache():
+    return ResultCache(
+        max_bytes=int(CACHE_CONFIG.get('max_mb', 64) * 1024 * 1024),
+        ttl=CACHE_CONFIG.get('ttl', 3600),
+    )
+
+
+def sub_category_args(city, sub_category):
+    # Parameters for GEOCODE_POINTS_QUERY and its page query
+    return (city, f"%{sub_category.lower()}%")
+
+
+def approx_requested(args):
+    # approx=true (or sample=true): answer from the stratified sample
+    return (args.get('approx') or args.get('sample') or '').lower() in ('true', '1')
+
+
+def spec_cache_key(spec, approx=False):
+    # Keyed by what is computed rather than by route, so /aggregate and the
+    # fixed routes share entries
+    return ResultCache.make_key('aggregate', {
+        'group_by': spec.group_by, 'filters': spec.filters, 'order_by': spec.order_by, 'limit': spec.limit,
+        'approx': approx,
+    })
+
+
+class SpecRun:
+    # Answers a list of aggregate specs from the result cache and plans the
+    # scans for the misses: the app runs each scan on its engine and hands the
+    # rows to answer(). Results are kept as (column names, row tuples) and
+    # shaped per request, see shape(). Misses that share filters are answered
+    # by one merged scan each.
+
+    def __init__(self, cache, specs, approx, version):
+        self.cache = cache
+        self.specs = specs
+        self.approx = approx
+        self.version = version
+        self.answers = [None] * len(specs)
+        self.misses = []
+        for i, spec in enumerate(specs):
+            result = cache.get(spec_cache_key(spec, approx), version)
+            if result is not None:
+                self.answers[i] = (result, 'hit')
+            else:
+                self.misses.append(i)
+        if approx:
+            # derive() cannot re-aggregate error bounds, so approximate specs
+            # each get their own scan
+            self.scans = [(specs[i], [member]) for member, i in enumerate(self.misses)]
+        else:
+            self.scans = merge_specs([specs[i] for i in self.misses])
+
+    def answer(self, members, names, rows):
+        for member in members:
+            i = self.misses[member]
+            result = with_error(names, rows) if self.approx else derive(names, rows, self.specs[i])
+            self.cache.put(spec_cache_key(self.specs[i], self.approx), self.version, result)
+            self.answers[i] = (result, 'miss')
+
+    @property
+    def cache_status(self):
+        return 'miss' if self.misses else 'hit'
+
+    @property
+    def result_key(self):
+        # Encoded bodies are stored with the result only when there is one
+        return spec_cache_key(self.specs[0], self.approx) if len(self.specs) == 1 else None
+
+
+def scan_args(scan):
+    # run_aggregate() arguments for one planned scan
+    return list(scan.group_by), list(scan.filters), list(scan.order_by), scan.limit
+
+
+def zero_variance(names, rows):
+    # The memory engine holds every row, so its approximate answers are exact:
+    # a Crime_Count_Var of 0 for rollups.with_error()
+    return names + ['Crime_Count_Var'], [row + (0,) for row in rows]
+
+
+def orient_error(args):
+    orient = args.get('orient')
+    if orient and orient not in ORIENTS:
+        return f"orient must be one of: {', '.join(ORIENTS)}"
+    return None
+
+
+def shape(result, args):
+    # orient=records (default): one dict per row. orient=columns: one array
+    # per column, without repeating the key names on every row.
+    names, rows = result
+    if args.get('orient') == 'columns':
+        columns = zip(*rows) if rows else [() for _ in names]
+        return {name: list(values) for name, values in zip(names, columns)}
+    return [dict(zip(names, row)) for row in rows]
+
+
+def bins_result(result):
+    # bin_points() output with its bins as (column names, row tuples), the
+    # form shape() and the result cache expect
+    bins = result['bins']
+    result['bins'] = (list(bins), list(zip(*bins.values())))
+    return result
+
+
+def point_format(args, accept_mimetypes):
+    # Returns (format, dtype) for row-level point responses; raises
+    # ValueError for bad parameters and LookupError when the format is unavailable.
+    fmt = wire.negotiate(args.get('format'), accept_mimetypes)
+    dtype = args.get('dtype', 'float64')
+    if dtype not in wire.DTYPES:
+        raise ValueError(f"dtype must be one of: {', '.join(wire.DTYPES)}")
+    return fmt, wire.DTYPES[dtype]
+
+
+def parse_bbox(value):
+    if not value:
+        return None
+    bbox = tuple(float(v) for v in value.split(','))
+    if len(bbox) != 4 or not all(np.isfinite(bbox)) or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise ValueError(value)
+    return bbox
+
+
+def density_request(args, accept_mimetypes, cities):
+    # Validates /crime_location_density_by_city; raises ValueError (400) or
+    # LookupError (406) with a message fit for the client.
+    city = args.get('city')
+    if not city:
+        raise ValueError("Please provide a city parameter.")
+    if city not in cities:
+        raise ValueError(f"Sorry, we do not have data for the city '{city}'. Supported cities are: {', '.join(cities)}.")
+    stream = args.get('stream')
+    if stream and stream not in ('json', 'ndjson'):
+        raise ValueError("stream must be 'json' or 'ndjson'.")
+    mode = args.get('mode', 'points')
+    if mode not in ('points', 'bins'):
+        raise ValueError("mode must be 'points' or 'bins'.")
+    fmt, dtype = point_format(args, accept_mimetypes)
+    if fmt != 'json' and (mode == 'bins' or stream):
+        raise ValueError("Binary formats are only available for unstreamed points.")
+    if (mode == 'bins' or stream) and ('limit' in args or 'cursor' in args):
+        raise ValueError("limit and cursor page through points; streams and bins are not paged.")
+    approx = approx_requested(args)
+    scope = ('crime_location_density_by_city', city) + (('approx',) if approx else ())
+    after, limit = page_params(args, scope)
+    bin_size = outlier_iqr = bbox = None
+    if mode == 'bins':
+        try:
+            bin_size = float(args.get('bin_size', 0.01))
+            outlier_iqr = float(args.get('outlier_iqr', 1.5))
+            bbox = parse_bbox(args.get('bbox'))
+        except ValueError:
+            raise ValueError("bin_size and outlier_iqr must be numbers and bbox must be min_lat,min_lon,max_lat,max_lon.")
+        check_bin_params(bin_size, outlier_iqr)
+    return DensityRequest(city, stream, mode, fmt, dtype, approx, scope, after, limit, bin_size, outlier_iqr, bbox)
+
+
+def density_queries(params):
+    # (all points, keyset page) queries for a density request
+    if params.approx:
+        return SAMPLE_LOCATION_QUERY, SAMPLE_LOCATION_PAGE_QUERY
+    return LOCATION_QUERY, LOCATION_PAGE_QUERY
+
+
+def bins_cache_params(params):
+    return {
+        'city': params.city, 'mode': params.mode, 'bin_size': params.bin_size, 'outlier_iqr': params.outlier_iqr,
+        'bbox': params.bbox, 'approx': params.approx,
+    }
+
+
+def points_request(args, accept_mimetypes):
+    # Validates /geocode_points, raising like density_request()
+    city = args.get('city')
+    sub_category = args.get('sub_category')
+    if not city or not sub_category:
+        raise ValueError("Please provide both city and sub-category parameters.")
+    fmt, dtype = point_format(args, accept_mimetypes)
+    scope = ('geocode_points', city, sub_category.lower())
+    after, limit = page_params(args, scope)
+    return PointsRequest(sub_category_args(city, sub_category), scope, fmt, dtype, after, limit)
+
+
+def geocode_request(args):
+    # (city, query args, cursor scope, CID to continue after) for /geocode;
+    # raises ValueError with a message fit for the client
+    city = args.get('city')
+    sub_category = args.get('sub_category')
+    if not city or not sub_category:
+        raise ValueError("Please provide both city and sub-category parameters.")
+    scope = ('geocode', city, sub_category.lower())
+    cursor = args.get('cursor')
+    after = decode_cursor(cursor, scope) if cursor else 0
+    return city, sub_category_args(city, sub_category), scope, after
+
+
+def last_page(rows, limit):
+    # A keyset page is read with one extra row to tell a full page from the
+    # last one without another round trip: returns up to `limit`
+    # (Latitude, Longitude) rows and the CID to continue from, or None.
+    last_cid = rows[limit - 1][0] if len(rows) > limit else None
+    return [row[1:] for row in rows[:limit]], last_cid
+
+
+def next_cursor(last_cid, scope):
+    return encode_cursor(last_cid, scope) if last_cid else None
+
+
+def point_records(rows):
+    return [{'Latitude': lat, 'Longitude': lon} for lat, lon in rows]
+
+
+def binary_headers(sqltime, cursor=None):
+    headers = {'X-Columns': 'Latitude,Longitude', 'X-Sqltime': str(sqltime)}
+    if cursor:
+        headers['X-Next-Cursor'] = cursor
+    return headers
+
+
+def stream_mimetype(fmt):
+    return 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+
+
+def stream_head(req):
+    # The JSON stream is one response object written out around its records
+    return f'{{"code": 1, "msg": "Success", "req": {json.dumps(req)}, "data": ['
+
+
+def stream_chunk(names, rows, fmt, first):
+    # One fetched batch of a stream: NDJSON lines, or the records of the JSON
+    # array with the separating comma for all but the first batch
+    records = [dict(zip(names, row)) for row in rows]
+    if fmt == 'ndjson':
+        return '\n'.join(json.dumps(record) for record in records) + '\n'
+    chunk = json.dumps(records)[1:-1]
+    return chunk if first else ',' + chunk
+
+
+def stream_tail(sqltime):
+    return f'], "sqltime": {sqltime}}}'
+
+
+def request_etag(endpoint, args, version):
+    params = sorted((name, value) for name, value in args.items(multi=True) if name != 'key')
+    digest = hashlib.sha1(repr((endpoint, version, params)).encode()).hexdigest()
+    return f'v{version}-{digest}'
+
+
+def last_modified(updated_at):
+    return updated_at.replace(tzinfo=timezone.utc) if updated_at else None
+
+
+def not_modified_tag(etag, modified, if_none_match, if_modified_since):
+    # The ETag a 304 should carry, or None when the client's copy is stale
+    if if_none_match:
+        # Compressed representations carry their own ETag, see body_variant()
+        return next((tag for tag in [etag] + [f'{etag}-{e}' for e in ENCODINGS]
+                     if if_none_match.contains(tag)), None)
+    if modified and if_modified_since and modified.replace(microsecond=0) <= if_modified_since:
+        return etag
+    return None
+
+
+def body_variant(cache_status, result_key, body, encoding):
+    # A cache hit renders the same bytes every time, so its compressed body is
+    # built once and kept next to the cached result under this variant; None
+    # when the body should not be stored
+    if cache_status != 'hit' or result_key is None:
+        return None
+    return (encoding, hashlib.sha1(body).digest())
+
+
+def cache_stats_data(result_cache, geocoder, memory_engine):
+    return dict(result_cache.stats(), geocoder=geocoder.stats(), engine=dict(memory_engine.stats() if memory_engine else {}, name=ENGINE))
+
+
+def metric_gauges(pool_state, cache_state):
+    return {
+        'pool_connections': ('Open database connections.', pool_state['size']),
+        'pool_connections_in_use': ('Database connections checked out.', pool_state['in_use']),
+        'pool_acquire_timeouts': ('Requests that timed out waiting for a connection since startup.', pool_state['timeouts']),
+        'cache_entries': ('Entries in the result cache.', cache_state['entries']),
+        'cache_bytes': ('Approximate size of the result cache.', cache_state['bytes']),
+        'cache_hit_ratio': ('Result cache hit ratio since startup.', cache_state['hit_ratio']),
+        'data_version': ('Data version currently served.', cache_state['data_version'] or 0),
+    }
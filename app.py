@@ -1,123 +1,532 @@
-import json
+import numpy as np
 import pymysql
 import time
-import yaml
-import requests
-from pathlib import Path
-from flask import Flask, request, jsonify, render_template
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from flask import Flask, Response, request, jsonify, render_template, g, has_app_context
+from flask.json.provider import DefaultJSONProvider
+from db_pool import ConnectionPool, PoolTimeout
+from data_version import DataVersionTracker
+from result_cache import ResultCache
+from rollups import QueryPlanner, check_sample
+from spatial import bin_points, fetch_points, points_array
+import wire
+from geocoder import GeocoderError, make_geocoder
+from dimensions import DimensionDictionary
+from metrics import MetricsRegistry, PhaseTimer
+from columnar_engine import ColumnarEngine
+from batch_aggregate import make_spec, parse_specs
+from batch_geocode import hotspots, parse_request as parse_geocode_batch, point_items, resolve, share_results, summary
+import compression
+from api_common import (
+    CACHE_CONFIG, COMPRESS_MIN_SIZE, CONDITIONAL_ENDPOINTS, DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER,
+    ENCODINGS, ENGINE, GEOCODE_BATCH_TIMEOUT, GEOCODE_POINTS_PAGE_QUERY, GEOCODE_POINTS_QUERY, GEOCODER_CONFIG,
+    LOCATION_QUERY, POOL_CONFIG, SAMPLE_WEIGHTED_LOCATION_QUERY, STREAM_BATCH_SIZE,
+    SpecRun, approx_requested, bins_cache_params, bins_result, binary_headers, body_variant, cache_stats_data,
+    density_queries, density_request, geocode_request, last_modified, last_page, make_result_cache, metric_gauges,
+    next_cursor, not_modified_tag, orient_error, point_records, points_request, request_etag, scan_args, shape,
+    stream_chunk, stream_head, stream_mimetype, stream_tail, sub_category_args, zero_variance,
+)
 
 app = Flask(__name__)
+metrics = MetricsRegistry()
 
-config = yaml.safe_load(Path("config.yml").read_text())
-DB_HOST = config['db']['host']
-DB_USER = config['db']['user']
-DB_PASSWORD = config['db']['passwd']
-DB_NAME = config['db']['db']
+def request_timer():
+    # None outside a request, e.g. the dimension load at startup
+    return g.get('timer') if has_app_context() else None
+
+def phase(name):
+    timer = request_timer()
+    return timer.phase(name) if timer else nullcontext()
+
+def sql_time():
+    # Time this request spent waiting for, querying and reading from MySQL
+    timer = request_timer()
+    return timer.db_time() if timer else 0.0
+
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        with phase('serialize'):
+            return super().dumps(obj, **kwargs)
+
+app.json = TimedJSONProvider(app)
 
 def get_db_connection():
     return pymysql.connect(
-        host=DB_HOST, user=DB_USER, password=DB_PASSWORD, db=DB_NAME
+        host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD, db=DB_NAME,
+        autocommit=True
     )
 
+pool = ConnectionPool(
+    get_db_connection,
+    min_size=POOL_CONFIG.get('min_size', 2),
+    max_size=POOL_CONFIG.get('max_size', 10),
+    acquire_timeout=POOL_CONFIG.get('acquire_timeout', 5),
+    recycle=POOL_CONFIG.get('recycle', 3600),
+    ping_interval=POOL_CONFIG.get('ping_interval', 30),
+)
+
+data_version = DataVersionTracker(pool, check_interval=CACHE_CONFIG.get('version_check_interval', 5))
+result_cache = make_result_cache()
+
+planner = QueryPlanner()
+memory_engine = ColumnarEngine() if ENGINE == 'memory' else None
+geocoder = make_geocoder(GEOCODER_CONFIG)
+# Shared by every /geocode_batch request, so it also caps concurrent lookups
+# across requests; the rate limit itself is enforced inside the geocoder
+geocode_executor = ThreadPoolExecutor(GEOCODER_CONFIG.get('batch_workers', 4), thread_name_prefix='geocode')
+
+@contextmanager
+def db_connection():
+    # pool.connection(), with the wait for a free connection timed as 'acquire'
+    start = time.perf_counter()
+    with pool.connection() as conn:
+        timer = request_timer()
+        if timer:
+            timer.add('acquire', time.perf_counter() - start)
+        yield conn
+
+def derived_tables():
+    # Rollups and the sample are rebuilt by the loader before it bumps the
+    # data version, so re-check which ones exist whenever the version changes.
+    version = data_version.current()
+    if planner.version != version:
+        with db_connection() as conn:
+            planner.refresh(conn.cursor(), version)
+    return planner.available
+
+def plan_query(group_by, filters=None, order_by=None, limit=None, approx=False):
+    derived_tables()
+    return planner.plan(group_by, filters, order_by, limit, approx)
+
+def memory_snapshot():
+    # Reloaded by the first request that sees a new data version
+    return memory_engine.snapshot(data_version.current(), db_connection)
+
+def run_aggregate(group_by, filters=None, order_by=None, limit=None, approx=False):
+    # (column names, row tuples) from whichever engine is configured. approx
+    # adds a Crime_Count_Var column, see rollups.with_error().
+    if memory_engine:
+        snapshot = memory_snapshot()
+        with phase('compute'):
+            names, rows = snapshot.aggregate(group_by, filters, order_by, limit)
+        return zero_variance(names, rows) if approx else (names, rows)
+    query, args = plan_query(group_by, filters, order_by, limit, approx)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        with phase('execute'):
+            cur.execute(query, args)
+        with phase('fetch'):
+            return [column[0] for column in cur.description], cur.fetchall()
+
+dimensions = DimensionDictionary()
+
+def current_dimensions():
+    # Loaded at startup and reloaded only when the data version changes. If the
+    # reload fails the previous snapshot keeps serving.
+    version = data_version.current()
+    if dimensions.version != version:
+        try:
+            names, rows = run_aggregate(['City', 'Crime_Category', 'Sub_Category'])
+            dimensions.refresh([dict(zip(names, row)) for row in rows], version)
+        except (pymysql.MySQLError, PoolTimeout):
+            if not dimensions.cities:
+                raise
+    return dimensions
+
+def cached_result(req, params, compute):
+    # Results only change when the loader bumps the data version, so the
+    # version is part of every lookup and a bump drops all cached results.
+    version = data_version.current()
+    cache_key = ResultCache.make_key(req, params)
+    g.result_key = cache_key
+    results = result_cache.get(cache_key, version)
+    if results is not None:
+        g.cache_status = 'hit'
+        g.conditional_ok = True
+        return results, 'hit'
+    results = compute()
+    result_cache.put(cache_key, version, results)
+    g.cache_status = 'miss'
+    g.conditional_ok = True
+    return results, 'miss'
+
+def run_specs(specs, approx=False):
+    # Returns ([(result, cache status)] in spec order, scans run), see SpecRun
+    run = SpecRun(result_cache, specs, approx, data_version.current())
+    for scan, members in run.scans:
+        run.answer(members, *run_aggregate(*scan_args(scan), approx))
+    g.cache_status = run.cache_status
+    g.approx = approx
+    g.result_key = run.result_key
+    g.conditional_ok = True
+    return run.answers, len(run.scans)
+
+def cached_aggregate(group_by, filters=None, order_by=None):
+    answers, _ = run_specs([make_spec(group_by, filters, order_by)], approx_requested(request.args))
+    return answers[0]
+
+def location_bins(city, bin_size, outlier_iqr, bbox, approx=False):
+    # approx reads the weighted sample; the memory engine has every row, so
+    # it counts exactly with unit weights
+    weights = None
+    if memory_engine:
+        # Latitude/Longitude are FLOAT columns, so the float32 copies are exact
+        lat, lon = memory_snapshot().points(city)
+        if approx:
+            weights = np.ones(len(lat))
+    else:
+        with db_connection() as conn:
+            cur = conn.cursor(pymysql.cursors.SSCursor)
+            with phase('execute'):
+                cur.execute(SAMPLE_WEIGHTED_LOCATION_QUERY if approx else LOCATION_QUERY, (city,))
+            with phase('fetch'):
+                if approx:
+                    lat, lon, weights = fetch_points(cur)
+                else:
+                    lat, lon = fetch_points(cur)
+    with phase('compute'):
+        return bins_result(bin_points(lat, lon, bin_size=bin_size, outlier_iqr=outlier_iqr, bbox=bbox, weights=weights))
+
+def hotspot_points(city, sub_category):
+    # Every point of a city and sub-category, for /geocode_batch to bin
+    if memory_engine:
+        return memory_snapshot().points(city, sub_category)
+    with db_connection() as conn:
+        cur = conn.cursor(pymysql.cursors.SSCursor)
+        with phase('execute'):
+            cur.execute(GEOCODE_POINTS_QUERY, sub_category_args(city, sub_category))
+        with phase('fetch'):
+            return fetch_points(cur)
+
+def all_points(req, query, args, fmt, dtype):
+    # Every matching point, for requests that do not ask for a page
+    with db_connection() as conn:
+        cur = conn.cursor(pymysql.cursors.SSCursor)
+        with phase('execute'):
+            cur.execute(query, args)
+        with phase('fetch'):
+            lat, lon = fetch_points(cur)
+    if fmt == 'json':
+        return page_response(req, zip(lat.tolist(), lon.tolist()), None, fmt, dtype)
+    return binary_response(lat, lon, fmt, dtype)
+
+def binary_response(lat, lon, fmt, dtype, cursor=None):
+    with phase('serialize'):
+        body = wire.encode(fmt, [lat, lon], ['Latitude', 'Longitude'], dtype)
+    return Response(body, mimetype=wire.FORMATS[fmt], headers=binary_headers(sql_time(), cursor))
+
+def fetch_page(query, args, after, limit):
+    # One keyset page, see last_page()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        with phase('execute'):
+            cur.execute(query, args + (after, limit + 1))
+        with phase('fetch'):
+            rows = cur.fetchall()
+    return last_page(rows, limit)
+
+def page_response(req, rows, cursor, fmt, dtype):
+    if fmt != 'json':
+        return binary_response(*points_array(rows), fmt, dtype, cursor)
+    return jsonify(
+        code=1,
+        msg="Success",
+        data=point_records(rows),
+        next_cursor=cursor,
+        req=req,
+        sqltime=sql_time()
+    )
+
+@app.before_request
+def start_timer():
+    g.timer = PhaseTimer()
+
+@app.before_request
+def validate_orient():
+    error = orient_error(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    return None
+
+@app.before_request
+def conditional_get():
+    if request.method != 'GET' or request.endpoint not in CONDITIONAL_ENDPOINTS or request.args.get('key') != '123':
+        return None
+    version = data_version.current()
+    if version is None:
+        return None
+    g.etag = request_etag(request.endpoint, request.args, version)
+    modified = last_modified(data_version.updated_at)
+    matched = not_modified_tag(g.etag, modified, request.if_none_match, request.if_modified_since)
+    if matched:
+        response = Response(status=304)
+        response.set_etag(matched)
+        response.last_modified = modified
+        return response
+    return None
+
+@app.after_request
+def record_timing(response):
+    timer = g.get('timer')
+    if timer is None:
+        return response
+    response.headers['Server-Timing'] = timer.server_timing()
+    route, method, status = request.endpoint or 'not_found', request.method, response.status_code
+    # Recorded when the body has been sent, so streamed responses count in full
+    response.call_on_close(lambda: metrics.observe(route, method, status, timer.elapsed(), timer.phases))
+    return response
+
+@app.after_request
+def compress_response(response):
+    # Runs after add_cache_header (Flask calls after_request hooks in reverse
+    # order) so it can give each encoding its own ETag.
+    if request.method == 'HEAD' or response.status_code in (204, 304) or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = compression.negotiate(request.accept_encodings, ENCODINGS)
+    if encoding is None:
+        return response
+    timer = g.get('timer')
+    if response.is_streamed:
+        response.response = compression.compress_stream(response.response, encoding, timer)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_SIZE:
+            return response
+        variant = body_variant(g.get('cache_status'), g.get('result_key'), body, encoding)
+        compressed = result_cache.get_body(g.result_key, data_version.current(), variant) if variant else None
+        if compressed is None:
+            with phase('compress'):
+                compressed = compression.compress(body, encoding, stored=variant is not None)
+            if variant:
+                result_cache.put_body(g.result_key, data_version.current(), variant, compressed)
+        response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+@app.after_request
+def add_cache_header(response):
+    cache_status = g.get('cache_status')
+    if cache_status:
+        response.headers['X-Cache'] = cache_status.upper()
+    if g.get('approx'):
+        response.headers['X-Approximate'] = 'sample'
+    if g.get('etag') and g.get('conditional_ok') and response.status_code == 200:
+        response.set_etag(g.etag)
+        response.last_modified = last_modified(data_version.updated_at)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def stream_rows(req, query, args, fmt):
+    # Unbuffered server-side cursor: rows are pulled from MySQL in fixed-size
+    # batches and written out as they arrive, so memory stays flat no matter
+    # how many rows match. The connection is held until the stream finishes.
+    if request.method == 'HEAD':
+        # Werkzeug never sends a HEAD body, so there is nothing to query
+        return Response(mimetype=stream_mimetype(fmt))
+    timer = g.timer
+    with timer.phase('acquire'):
+        conn = pool.acquire()
+    try:
+        cur = conn.cursor(pymysql.cursors.SSCursor)
+        with timer.phase('execute'):
+            cur.execute(query, args)
+    except Exception:
+        pool.release(conn, discard=True)
+        raise
+    names = [column[0] for column in cur.description]
+    released = []
+
+    def release(finished=False):
+        # Called when generate() ends and again when the response is closed,
+        # which also covers a body that is never iterated; the first call wins
+        if released:
+            return
+        released.append(True)
+        if finished:
+            cur.close()
+        # A client that disconnects mid-stream leaves unread rows on the
+        # connection, so it cannot go back to the pool.
+        pool.release(conn, discard=not finished)
+
+    def generate():
+        finished = False
+        try:
+            if fmt == 'json':
+                yield stream_head(req)
+            first = True
+            while True:
+                with timer.phase('fetch'):
+                    rows = cur.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                with timer.phase('serialize'):
+                    chunk = stream_chunk(names, rows, fmt, first)
+                first = False
+                yield chunk
+            if fmt == 'json':
+                yield stream_tail(timer.db_time())
+            finished = True
+        finally:
+            release(finished)
+
+    response = Response(generate(), mimetype=stream_mimetype(fmt))
+    response.call_on_close(release)
+    return response
+
+def busy_response(req):
+    response = jsonify(
+        code=0,
+        msg='Server busy: no database connection available, try again later',
+        req=req,
+        sqltime=sql_time()
+    )
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@app.route("/pool_stats", methods=['GET'])   #http://127.0.0.1:5000/pool_stats?key=123
+def pool_stats():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='pool_stats')
+    return jsonify(code=1, msg="Success", data=pool.stats(), req='pool_stats')
+
+@app.route("/cache_stats", methods=['GET'])   #http://127.0.0.1:5000/cache_stats?key=123
+def cache_stats():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='cache_stats')
+    return jsonify(code=1, msg="Success", data=cache_stats_data(result_cache, geocoder, memory_engine), req='cache_stats')
+
+@app.route("/metrics", methods=['GET'])   #http://127.0.0.1:5000/metrics?key=123
+def prometheus_metrics():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='metrics')
+    gauges = metric_gauges(pool.stats(), result_cache.stats())
+    return Response(metrics.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route("/dimensions", methods=['GET'])   #http://127.0.0.1:5000/dimensions?key=123
+def list_dimensions():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='dimensions')
+    data = current_dimensions().as_dict()
+    g.conditional_ok = True
+    return jsonify(code=1, msg="Success", data=data, req='dimensions')
+
+@app.route("/aggregate", methods=['POST'])   #curl -X POST "http://127.0.0.1:5000/aggregate?key=123" -H "Content-Type: application/json" -d '{"specs": [{"group_by": ["DateYear"]}]}'
+def aggregate():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='aggregate', sqltime=sql_time())
+    try:
+        specs = parse_specs(request.get_json(silent=True), current_dimensions().cities)
+    except ValueError as e:
+        return jsonify(code=0, msg=str(e), req='aggregate', sqltime=sql_time()), 400
+    try:
+        answers, scans = run_specs(specs, approx_requested(request.args))
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=[{'id': spec.id, 'data': shape(result, request.args), 'cache': cache_status}
+                  for spec, (result, cache_status) in zip(specs, answers)],
+            req='aggregate',
+            scans=scans,
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('aggregate')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='aggregate',
+            sqltime=sql_time()
+        )
+
 @app.route("/crime_category_per_city", methods=['GET'])   #http://127.0.0.1:5000/crime_category_per_city?key=123
 def crime_category_per_city():
     key = request.args.get('key')
     if key != '123':
-        return jsonify(code=0, msg='Invalid API key', req='crime_category_per_city', sqltime=0)
-    start_time = time.time()
+        return jsonify(code=0, msg='Invalid API key', req='crime_category_per_city', sqltime=sql_time())
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        query = """
-            SELECT City, Crime_Category, COUNT(*) AS Crime_Count 
-            FROM hovetl_crimes 
-            GROUP BY City, Crime_Category
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        conn.close()
+        results, cache_status = cached_aggregate(['City', 'Crime_Category'])
         return jsonify(
             code=1,
             msg="Success",
-            data=results,
+            data=shape(results, request.args),
             req='crime_category_per_city',
-            sqltime=time.time() - start_time
+            cache=cache_status,
+            sqltime=sql_time()
         )
+    except PoolTimeout:
+        return busy_response('crime_category_per_city')
     except Exception as e:
         return jsonify(
             code=0, 
             msg=f"Error: {str(e)}", 
             req='crime_category_per_city', 
-            sqltime=time.time() - start_time
+            sqltime=sql_time()
         )
 
 @app.route("/crime_over_years", methods=['GET'])   #http://127.0.0.1:5000/crime_over_years?key=123
 def crime_over_years():
     key = request.args.get('key')
     if key != '123':
-        return jsonify(code=0, msg='Invalid API key', req='crime_over_years', sqltime=0)
-    start_time = time.time()
+        return jsonify(code=0, msg='Invalid API key', req='crime_over_years', sqltime=sql_time())
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        query = """
-            SELECT DateYear, COUNT(*) AS Crime_Count 
-            FROM hovetl_crimes 
-            GROUP BY DateYear
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        conn.close()
+        results, cache_status = cached_aggregate(['DateYear'])
         return jsonify(
             code=1,
             msg="Success",
-            data=results,
+            data=shape(results, request.args),
             req='crime_over_years',
-            sqltime=time.time() - start_time
+            cache=cache_status,
+            sqltime=sql_time()
         )    
+    except PoolTimeout:
+        return busy_response('crime_over_years')
     except Exception as e:
         return jsonify(
             code=0, 
             msg=f"Error: {str(e)}", 
             req='crime_over_years', 
-            sqltime=time.time() - start_time
+            sqltime=sql_time()
         )
     
 @app.route("/crime_per_month", methods=['GET'])  #http:/127.0.0.1:5000/crime_per_month?key=123&city=Seattle
 def crime_per_month():
     key = request.args.get('key')
     city = request.args.get('city')
-    valid_cities = ["Seattle", "Chicago", "San Francisco"]
     if key != '123':
-        return jsonify(code=0, msg='Invalid API key', req='crime_per_month', sqltime=0)
+        return jsonify(code=0, msg='Invalid API key', req='crime_per_month', sqltime=sql_time())
+    valid_cities = current_dimensions().cities
     if not city or city not in valid_cities:
-        return jsonify(code=0, msg=f"Invalid city. Valid options: {', '.join(valid_cities)}", req='crime_per_month', sqltime=0)
-    start_time = time.time()
+        return jsonify(code=0, msg=f"Invalid city. Valid options: {', '.join(valid_cities)}", req='crime_per_month', sqltime=sql_time())
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        query = """
-            SELECT DateMonth, COUNT(*) AS Crime_Count 
-            FROM hovetl_crimes 
-            WHERE City = %s 
-            GROUP BY DateMonth
-        """
-        cur.execute(query, (city,))
-        results = cur.fetchall()
-        conn.close()
+        results, cache_status = cached_aggregate(['DateMonth'], filters=[('City', '=', city)])
         return jsonify(
             code=1,
             msg="Success",
-            data=results,
+            data=shape(results, request.args),
             req='crime_per_month',
-            sqltime=time.time() - start_time
+            cache=cache_status,
+            sqltime=sql_time()
         )    
+    except PoolTimeout:
+        return busy_response('crime_per_month')
     except Exception as e:
         return jsonify(
             code=0, 
             msg=f"Error: {str(e)}", 
             req='crime_per_month', 
-            sqltime=time.time() - start_time
+            sqltime=sql_time()
         )
 
 @app.route("/crime_by_date_range", methods=['GET'])  #http:/127.0.0.1:5000/crime_by_date_range?key=123&start_date=2020-01-01&end_date=2024-01-31
@@ -126,132 +535,102 @@ def crimes_by_date_range():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     if key != '123':
-        return jsonify(code=0, msg='Invalid API key', req='crime_by_date_range', sqltime=0)
+        return jsonify(code=0, msg='Invalid API key', req='crime_by_date_range', sqltime=sql_time())
     if not start_date or not end_date:
-        return jsonify(code=0, msg='Start and end dates are required', req='crime_by_date_range', sqltime=0)
-    start_time = time.time()
+        return jsonify(code=0, msg='Start and end dates are required', req='crime_by_date_range', sqltime=sql_time())
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        query = """
-            SELECT CrimeDate, COUNT(*) AS Crime_Count 
-            FROM hovetl_crimes 
-            WHERE CrimeDate BETWEEN %s AND %s
-            GROUP BY CrimeDate
-            ORDER BY CrimeDate
-        """
-        cur.execute(query, (start_date, end_date))
-        results = cur.fetchall()
-        conn.close()
+        results, cache_status = cached_aggregate(['CrimeDate'], filters=[('CrimeDate', 'between', (start_date, end_date))], order_by=['CrimeDate'])
         return jsonify(
             code=1,
             msg="Success",
-            data=results,
+            data=shape(results, request.args),
             req='crime_by_date_range',
-            sqltime=time.time() - start_time
+            cache=cache_status,
+            sqltime=sql_time()
         )   
+    except PoolTimeout:
+        return busy_response('crime_by_date_range')
     except Exception as e:
         return jsonify(
             code=0, 
             msg=f"Error: {str(e)}", 
             req='crime_by_date_range', 
-            sqltime=time.time() - start_time
+            sqltime=sql_time()
         )
     
 @app.route("/crime_comparison_per_year", methods=['GET']) #http://127.0.0.1:5000/crime_comparison_per_year?key=123
 def crime_comparison_per_year():
     key = request.args.get('key')
     if key != '123':
-        return jsonify(code=0, msg='Invalid API key', req='crime_comparison_per_year', sqltime=0)
-    start_time = time.time()
+        return jsonify(code=0, msg='Invalid API key', req='crime_comparison_per_year', sqltime=sql_time())
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        query = """
-        SELECT City, DateYear, Crime_Category, COUNT(*) AS Crime_Count
-        FROM hovetl_crimes
-        GROUP BY City, DateYear, Crime_Category
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        conn.close()
+        results, cache_status = cached_aggregate(['City', 'DateYear', 'Crime_Category'])
         return jsonify(
             code=1,
             msg="Success",
-            data=results,
+            data=shape(results, request.args),
             req='crime_comparison_per_year',
-            sqltime=time.time() - start_time
+            cache=cache_status,
+            sqltime=sql_time()
         )   
+    except PoolTimeout:
+        return busy_response('crime_comparison_per_year')
     except Exception as e:
         return jsonify(
             code=0,
             msg=f"Error: {str(e)}",
             req='crime_comparison_per_year',
-            sqltime=time.time() - start_time
+            sqltime=sql_time()
         )
 
 @app.route("/crime_statistics_by_category", methods=['GET']) #http://127.0.0.1:5000/crime_statistics_by_category?key=123
 def crime_statistics_by_category():
     key = request.args.get('key')
     if key != '123':
-        return jsonify(code=0, msg='Invalid API key', req='crime_statistics_by_category', sqltime=0)
-    start_time = time.time()
+        return jsonify(code=0, msg='Invalid API key', req='crime_statistics_by_category', sqltime=sql_time())
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        query = """
-        SELECT Crime_Category, COUNT(*) AS Crime_Count
-        FROM hovetl_crimes
-        GROUP BY Crime_Category
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        conn.close()
+        results, cache_status = cached_aggregate(['Crime_Category'])
         return jsonify(
             code=1,
             msg="Success",
-            data=results,
+            data=shape(results, request.args),
             req='crime_statistics_by_category',
-            sqltime=time.time() - start_time
+            cache=cache_status,
+            sqltime=sql_time()
         )  
+    except PoolTimeout:
+        return busy_response('crime_statistics_by_category')
     except Exception as e:
         return jsonify(
             code=0,
             msg=f"Error: {str(e)}",
             req='crime_statistics_by_category',
-            sqltime=time.time() - start_time
+            sqltime=sql_time()
         )
     
 @app.route("/crime_per_city_category", methods=['GET']) #http://127.0.0.1:5000/crime_per_city_category?key=123
 def crime_rate_per_city():
     key = request.args.get('key')
     if key != '123':
-        return jsonify(code=0, msg='Invalid API key', req='crime_rate_per_city', sqltime=0)
-    start_time = time.time()
+        return jsonify(code=0, msg='Invalid API key', req='crime_rate_per_city', sqltime=sql_time())
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        query = """
-        SELECT City, Crime_Category, COUNT(*) AS Crime_Count
-        FROM hovetl_crimes
-        GROUP BY City, Crime_Category
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        conn.close()
+        results, cache_status = cached_aggregate(['City', 'Crime_Category'])
         return jsonify(
             code=1,
             msg="Success",
-            data=results,
+            data=shape(results, request.args),
             req='crime_rate_per_city',
-            sqltime=time.time() - start_time
+            cache=cache_status,
+            sqltime=sql_time()
         ) 
+    except PoolTimeout:
+        return busy_response('crime_rate_per_city')
     except Exception as e:
         return jsonify(
             code=0,
             msg=f"Error: {str(e)}",
             req='crime_rate_per_city',
-            sqltime=time.time() - start_time
+            sqltime=sql_time()
         )
 
 
@@ -259,33 +638,25 @@ def crime_rate_per_city():
 def crime_by_day_of_week():
     key = request.args.get('key')
     if key != '123':
-        return jsonify(code=0, msg='Invalid API key', req='crime_by_day_of_week', sqltime=0)
-    start_time = time.time()
+        return jsonify(code=0, msg='Invalid API key', req='crime_by_day_of_week', sqltime=sql_time())
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        query = """
-        SELECT DAYOFWEEK(CrimeDate) AS Day_Of_Week, COUNT(*) AS Crime_Count
-        FROM hovetl_crimes
-        GROUP BY Day_Of_Week
-        ORDER BY Day_Of_Week
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        conn.close()
+        results, cache_status = cached_aggregate(['Day_Of_Week'], order_by=['Day_Of_Week'])
         return jsonify(
             code=1,
             msg="Success",
-            data=results,
+            data=shape(results, request.args),
             req='crime_by_day_of_week',
-            sqltime=time.time() - start_time
+            cache=cache_status,
+            sqltime=sql_time()
         ) 
+    except PoolTimeout:
+        return busy_response('crime_by_day_of_week')
     except Exception as e:
         return jsonify(
             code=0,
             msg=f"Error: {str(e)}",
             req='crime_by_day_of_week',
-            sqltime=time.time() - start_time
+            sqltime=sql_time()
         )
 
 @app.route('/crime_details_by_city_category', methods=['GET']) #http://127.0.0.1:5000/crime_details_by_city_category?key=123&city=Seattle&category=Theft
@@ -294,145 +665,213 @@ def crime_details_by_city_category():
     city = request.args.get('city')
     category = request.args.get('category')
     if key != '123':
-        return jsonify(code=0, msg='Invalid API key', req='crime_details_by_city_category', sqltime=0)
+        return jsonify(code=0, msg='Invalid API key', req='crime_details_by_city_category', sqltime=sql_time())
     if not city or not category:
         return jsonify({"error": "Please provide both city and category parameters."}), 400
-    allowed_cities = ['Seattle', 'Chicago', 'San Francisco']
+    allowed_cities = current_dimensions().cities
     if city not in allowed_cities:
         return jsonify({"error": f"Sorry, we do not have data for the city '{city}'. Supported cities are: {', '.join(allowed_cities)}."}), 400
-    start_time = time.time()
     try:
-        query = f"""
-        SELECT Sub_Category, COUNT(*) AS Crime_Count
-        FROM hovetl_crimes
-        WHERE City = '{city}' AND LOWER(Crime_Category) LIKE LOWER('%{category}%')
-        GROUP BY Sub_Category
-        ORDER BY Crime_Count DESC
-        """
-        conn = get_db_connection()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        cur.execute(query)
-        results = cur.fetchall()
-        conn.close()
+        results, cache_status = cached_aggregate(
+            ['Sub_Category'],
+            filters=[('City', '=', city), ('Crime_Category', 'like', category)],
+            order_by=['Crime_Count DESC']
+        )
         return jsonify(
             code=1,
             msg="Success",
-            data=results,
+            data=shape(results, request.args),
             req='crime_details_by_city_category',
-            sqltime=time.time() - start_time
+            cache=cache_status,
+            sqltime=sql_time()
         ) 
+    except PoolTimeout:
+        return busy_response('crime_details_by_city_category')
     except Exception as e:
         return jsonify(
             code=0,
             msg=f"Error: {str(e)}",
             req='crime_details_by_city_category',
-            sqltime=time.time() - start_time
+            sqltime=sql_time()
         )
 
-@app.route('/crime_location_density_by_city', methods=['GET']) #http://127.0.0.1:5000/crime_location_density_by_city?key=123&city=Chicago
+@app.route('/crime_location_density_by_city', methods=['GET']) #http://127.0.0.1:5000/crime_location_density_by_city?key=123&city=Chicago&stream=ndjson
 def crime_location_density_by_city():
     key = request.args.get('key')
-    city = request.args.get('city')
-
     if key != '123':
-        return jsonify(code=0, msg='Invalid API key', req='crime_location_density_by_city', sqltime=0)
-
-    if not city:
-        return jsonify({"error": "Please provide a city parameter."}), 400
-
-    allowed_cities = ['Seattle', 'Chicago', 'San Francisco']
-    if city not in allowed_cities:
-        return jsonify({"error": f"Sorry, we do not have data for the city '{city}'. Supported cities are: {', '.join(allowed_cities)}."}), 400
-    start_time = time.time()
+        return jsonify(code=0, msg='Invalid API key', req='crime_location_density_by_city', sqltime=sql_time())
+    try:
+        params = density_request(request.args, request.accept_mimetypes, current_dimensions().cities)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 406
+    query, page_query = density_queries(params)
     try:
-        query = f"""
-        SELECT Latitude, Longitude FROM hovetl_crimes
-        WHERE City = '{city}'
-        """
-        conn = get_db_connection()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        cur.execute(query)
-        results = cur.fetchall()
-        conn.close()
+        if params.approx:
+            g.approx = True
+            # Points always come from MySQL; bins only when the engine is mysql
+            if params.mode == 'points' or not memory_engine:
+                check_sample(derived_tables())
+        if params.mode == 'bins':
+            result, cache_status = cached_result(
+                'crime_location_density_by_city',
+                bins_cache_params(params),
+                lambda: location_bins(params.city, params.bin_size, params.outlier_iqr, params.bbox, params.approx)
+            )
+            return jsonify(
+                code=1,
+                msg="Success",
+                data=shape(result['bins'], request.args),
+                center=result['center'],
+                points=result['points'],
+                req='crime_location_density_by_city',
+                cache=cache_status,
+                sqltime=sql_time()
+            )
+        if params.stream:
+            return stream_rows('crime_location_density_by_city', query, (params.city,), params.stream)
+        if params.limit is None:
+            return all_points('crime_location_density_by_city', query, (params.city,), params.fmt, params.dtype)
+        rows, last_cid = fetch_page(page_query, (params.city,), params.after, params.limit)
+        return page_response('crime_location_density_by_city', rows, next_cursor(last_cid, params.scope), params.fmt, params.dtype)
+    except PoolTimeout:
+        return busy_response('crime_location_density_by_city')
+    except Exception as e:
         return jsonify(
-            code=1,
-            msg="Success",
-            data=results,
+            code=0,
+            msg=f"Error: {str(e)}",
             req='crime_location_density_by_city',
-            sqltime=time.time() - start_time
-        ) 
+            sqltime=sql_time()
+        )
+
+@app.route('/geocode_points', methods=['GET'])   #http://127.0.0.1:5000/geocode_points?key=123&city=Chicago&sub_category=Assault&format=npy
+def geocode_points():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='geocode_points', sqltime=sql_time())
+    try:
+        params = points_request(request.args, request.accept_mimetypes)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 406
+    try:
+        if params.limit is None:
+            return all_points('geocode_points', GEOCODE_POINTS_QUERY, params.args, params.fmt, params.dtype)
+        rows, last_cid = fetch_page(GEOCODE_POINTS_PAGE_QUERY, params.args, params.after, params.limit)
+        return page_response('geocode_points', rows, next_cursor(last_cid, params.scope), params.fmt, params.dtype)
+    except PoolTimeout:
+        return busy_response('geocode_points')
     except Exception as e:
         return jsonify(
             code=0,
             msg=f"Error: {str(e)}",
-            req='crime_location_density_by_city',
-            sqltime=time.time() - start_time
+            req='geocode_points',
+            sqltime=sql_time()
         )
 
 @app.route('/geocode', methods=['GET'])   #http://127.0.0.1:5000/geocode?key=123&city=Chicago&sub_category=Assault
 def geocode():
     key = request.args.get('key')
-    city = request.args.get('city')
-    sub_category = request.args.get('sub_category')
-
     if key != '123':
         return jsonify(
             code=0,
             msg='Invalid API key',
-            req='geocode'
+            req='geocode',
+            sqltime=sql_time()
         )
-    if not city or not sub_category:
-        return jsonify({
-            "error": "Please provide both city and sub-category parameters."
-        }), 400
-    start_time = time.time()
     try:
-        query_cities = "SELECT DISTINCT City FROM hovetl_crimes"
-        conn = get_db_connection()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        cur.execute(query_cities)
-        cities = [row['City'] for row in cur.fetchall()]
-        conn.close()
-
+        city, args, scope, after = geocode_request(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        cities = current_dimensions().cities
         if city not in cities:
             return jsonify({
                 "error": f"City '{city}' not found in the database. Available cities are: {', '.join(cities)}."
             }), 400
-        query = f"""
-        SELECT Latitude, Longitude FROM hovetl_crimes
-        WHERE City = '{city}' AND LOWER(Sub_Category) LIKE LOWER('%{sub_category}%')
-        """
-        conn = get_db_connection()
-        cur = conn.cursor(pymysql.cursors.DictCursor)
-        cur.execute(query)
-        results = cur.fetchall()
-        conn.close()
-        if not results:
+        # Only the first match is geocoded, so the query stops there
+        rows, last_cid = fetch_page(GEOCODE_POINTS_PAGE_QUERY, args, after, 1)
+        if not rows:
             return jsonify({
                 "error": "No crimes found for the provided city and sub-category."
             }), 404
-        latitude = results[0]['Latitude']
-        longitude = results[0]['Longitude']
-        url = f'https://nominatim.openstreetmap.org/reverse?lat={latitude}&lon={longitude}&format=json&addressdetails=1'
-        response = requests.get(url, headers={'User-Agent': 'Geocoding API client'})
-        data = response.json()
-        if response.status_code == 200 and 'address' in data:
-            address = data['address']
+        latitude, longitude = rows[0]
+        with phase('geocode'):
+            address = geocoder.reverse(latitude, longitude)
+        if address:
             return jsonify({
                 "latitude": latitude,
                 "longitude": longitude,
-                "address": address
+                "address": address,
+                "next_cursor": next_cursor(last_cid, scope),
+                "sqltime": sql_time()
             })
         else:
             return jsonify({
-                "error": "Address not found or API limit exceeded."
+                "error": "Address not found."
             }), 404
+    except PoolTimeout:
+        return busy_response('geocode')
+    except GeocoderError as e:
+        return jsonify({
+            "error": f"Geocoder unavailable or API limit exceeded: {e}"
+        }), 503
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='geocode',
+            sqltime=sql_time()
+        )
+
+@app.route('/geocode_batch', methods=['POST'])   #curl -X POST "http://127.0.0.1:5000/geocode_batch?key=123" -H "Content-Type: application/json" -d '{"city": "Chicago", "sub_category": "Assault", "top": 10}'
+def geocode_batch():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='geocode_batch', sqltime=sql_time())
+    try:
+        kind, value, radius = parse_geocode_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify(code=0, msg=str(e), req='geocode_batch', sqltime=sql_time()), 400
+    try:
+        if kind == 'points':
+            items, lookups = point_items(value, radius)
+        else:
+            city, sub_category, top, bin_size = value
+            cities = current_dimensions().cities
+            if city not in cities:
+                return jsonify(code=0, msg=f"Invalid city. Valid options: {', '.join(cities)}", req='geocode_batch', sqltime=sql_time()), 400
+            lat, lon = hotspot_points(city, sub_category)
+            with phase('compute'):
+                items = lookups = hotspots(lat, lon, top, bin_size, radius)
+        with phase('geocode'):
+            resolve(geocoder, lookups, geocode_executor, GEOCODE_BATCH_TIMEOUT)
+        share_results(items)
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=items,
+            summary=summary(items),
+            req='geocode_batch',
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('geocode_batch')
     except Exception as e:
         return jsonify(
             code=0,
             msg=f"Error: {str(e)}",
-            req='geocode'
+            req='geocode_batch',
+            sqltime=sql_time()
         )
 
+try:
+    current_dimensions()
+except (pymysql.MySQLError, PoolTimeout):
+    # Database not reachable yet; the first request that needs it retries
+    pass
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,3 @@
+# Production entry point for the async app (async_app.py):
+#   hypercorn -w 4 -b 0.0.0.0:5000 asgi:app
+from async_app import app
@@ -0,0 +1,939 @@
+import asyncio
+import numpy as np
+import pymysql
+import aiomysql
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from functools import wraps
+from quart import Quart, Response, request, jsonify, g, has_app_context
+from quart.json.provider import DefaultJSONProvider
+from db_pool import AsyncConnectionPool, PoolTimeout
+from data_version import AsyncDataVersionTracker
+from result_cache import ResultCache
+from rollups import DERIVED_TABLES_QUERY, QueryPlanner, check_sample
+from spatial import bin_points, fetch_points_async, points_array
+import wire
+from geocoder import GeocoderError, make_geocoder
+from dimensions import DimensionDictionary
+from metrics import MetricsRegistry, PhaseTimer
+from columnar_engine import ColumnarEngine
+from batch_aggregate import make_spec, parse_specs
+from batch_geocode import hotspots, parse_request as parse_geocode_batch, point_items, resolve_async, share_results, summary
+import compression
+from api_common import (
+    CACHE_CONFIG, COMPRESS_MIN_SIZE, CONDITIONAL_ENDPOINTS, DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER,
+    ENCODINGS, ENGINE, GEOCODE_BATCH_TIMEOUT, GEOCODE_POINTS_PAGE_QUERY, GEOCODE_POINTS_QUERY, GEOCODER_CONFIG,
+    LOCATION_QUERY, POOL_CONFIG, SAMPLE_WEIGHTED_LOCATION_QUERY, STREAM_BATCH_SIZE, config,
+    SpecRun, approx_requested, bins_cache_params, bins_result, binary_headers, body_variant, cache_stats_data,
+    density_queries, density_request, geocode_request, last_modified, last_page, make_result_cache, metric_gauges,
+    next_cursor, not_modified_tag, orient_error, point_records, points_request, request_etag, scan_args, shape,
+    stream_chunk, stream_head, stream_mimetype, stream_tail, sub_category_args, zero_variance,
+)
+
+# The routes of app.py on an event loop: aiomysql for MySQL, httpx for the
+# geocoder, so a request waiting on either holds no thread. Parameter parsing,
+# planning and response shaping are shared with app.py through api_common;
+# only the I/O differs. Run it with
+#   hypercorn -w 4 -b 0.0.0.0:5000 asgi:app
+
+app = Quart(__name__)
+metrics = MetricsRegistry()
+
+def request_timer():
+    return g.get('timer') if has_app_context() else None
+
+def phase(name):
+    timer = request_timer()
+    return timer.phase(name) if timer else nullcontext()
+
+def sql_time():
+    timer = request_timer()
+    return timer.db_time() if timer else 0.0
+
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        with phase('serialize'):
+            return super().dumps(obj, **kwargs)
+
+app.json = TimedJSONProvider(app)
+
+ASYNC_CONFIG = config.get('async') or {}
+# Concurrent requests allowed per route (by endpoint name); the rest wait up
+# to queue_timeout seconds for a slot and then get a 503
+ROUTE_LIMITS = ASYNC_CONFIG.get('route_limits') or {}
+DEFAULT_ROUTE_LIMIT = ASYNC_CONFIG.get('default_route_limit', 64)
+QUEUE_TIMEOUT = ASYNC_CONFIG.get('queue_timeout', 10)
+# Quart cuts responses off after 60s by default, which long streams can exceed
+app.config['RESPONSE_TIMEOUT'] = ASYNC_CONFIG.get('response_timeout', 600)
+
+pool = AsyncConnectionPool(
+    min_size=POOL_CONFIG.get('min_size', 2),
+    max_size=POOL_CONFIG.get('max_size', 10),
+    acquire_timeout=POOL_CONFIG.get('acquire_timeout', 5),
+    recycle=POOL_CONFIG.get('recycle', 3600),
+    host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD, db=DB_NAME,
+)
+
+data_version = AsyncDataVersionTracker(pool, check_interval=CACHE_CONFIG.get('version_check_interval', 5))
+result_cache = make_result_cache()
+
+planner = QueryPlanner()
+memory_engine = ColumnarEngine() if ENGINE == 'memory' else None
+geocoder = make_geocoder(GEOCODER_CONFIG, asynchronous=True)
+geocode_slots = asyncio.Semaphore(GEOCODER_CONFIG.get('batch_workers', 4))
+route_slots = {}
+
+@asynccontextmanager
+async def db_connection():
+    start = time.perf_counter()
+    async with pool.connection() as conn:
+        timer = request_timer()
+        if timer:
+            timer.add('acquire', time.perf_counter() - start)
+        yield conn
+
+@contextmanager
+def loader_connection():
+    # The columnar engine loads in a worker thread over its own blocking
+    # connection, see memory_snapshot()
+    conn = pymysql.connect(
+        host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD, db=DB_NAME,
+        autocommit=True
+    )
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+async def derived_tables():
+    version = await data_version.current()
+    if planner.version != version:
+        async with db_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(DERIVED_TABLES_QUERY)
+                planner.set_available(await cur.fetchall(), version)
+    return planner.available
+
+async def plan_query(group_by, filters=None, order_by=None, limit=None, approx=False):
+    await derived_tables()
+    return planner.plan(group_by, filters, order_by, limit, approx)
+
+async def memory_snapshot():
+    # A reload blocks for the whole table scan, so it runs off the event loop
+    version = await data_version.current()
+    return await asyncio.to_thread(memory_engine.snapshot, version, loader_connection)
+
+async def run_aggregate(group_by, filters=None, order_by=None, limit=None, approx=False):
+    if memory_engine:
+        snapshot = await memory_snapshot()
+        with phase('compute'):
+            names, rows = await asyncio.to_thread(snapshot.aggregate, group_by, filters, order_by, limit)
+        return zero_variance(names, rows) if approx else (names, rows)
+    query, args = await plan_query(group_by, filters, order_by, limit, approx)
+    async with db_connection() as conn:
+        async with conn.cursor() as cur:
+            with phase('execute'):
+                await cur.execute(query, args)
+            with phase('fetch'):
+                return [column[0] for column in cur.description], await cur.fetchall()
+
+dimensions = DimensionDictionary()
+
+async def current_dimensions():
+    version = await data_version.current()
+    if dimensions.version != version:
+        try:
+            names, rows = await run_aggregate(['City', 'Crime_Category', 'Sub_Category'])
+            dimensions.refresh([dict(zip(names, row)) for row in rows], version)
+        except (pymysql.MySQLError, PoolTimeout):
+            if not dimensions.cities:
+                raise
+    return dimensions
+
+async def cached_result(req, params, compute):
+    version = await data_version.current()
+    cache_key = ResultCache.make_key(req, params)
+    g.result_key = cache_key
+    results = result_cache.get(cache_key, version)
+    if results is not None:
+        g.cache_status = 'hit'
+        g.conditional_ok = True
+        return results, 'hit'
+    results = await compute()
+    result_cache.put(cache_key, version, results)
+    g.cache_status = 'miss'
+    g.conditional_ok = True
+    return results, 'miss'
+
+async def run_specs(specs, approx=False):
+    run = SpecRun(result_cache, specs, approx, await data_version.current())
+    for scan, members in run.scans:
+        run.answer(members, *await run_aggregate(*scan_args(scan), approx))
+    g.cache_status = run.cache_status
+    g.approx = approx
+    g.result_key = run.result_key
+    g.conditional_ok = True
+    return run.answers, len(run.scans)
+
+async def cached_aggregate(group_by, filters=None, order_by=None):
+    answers, _ = await run_specs([make_spec(group_by, filters, order_by)], approx_requested(request.args))
+    return answers[0]
+
+async def location_bins(city, bin_size, outlier_iqr, bbox, approx=False):
+    weights = None
+    if memory_engine:
+        lat, lon = (await memory_snapshot()).points(city)
+        if approx:
+            weights = np.ones(len(lat))
+    else:
+        async with db_connection() as conn:
+            async with conn.cursor(aiomysql.SSCursor) as cur:
+                with phase('execute'):
+                    await cur.execute(SAMPLE_WEIGHTED_LOCATION_QUERY if approx else LOCATION_QUERY, (city,))
+                with phase('fetch'):
+                    if approx:
+                        lat, lon, weights = await fetch_points_async(cur)
+                    else:
+                        lat, lon = await fetch_points_async(cur)
+    with phase('compute'):
+        result = await asyncio.to_thread(bin_points, lat, lon, bin_size=bin_size, outlier_iqr=outlier_iqr, bbox=bbox, weights=weights)
+    return bins_result(result)
+
+async def hotspot_points(city, sub_category):
+    if memory_engine:
+        return (await memory_snapshot()).points(city, sub_category)
+    async with db_connection() as conn:
+        async with conn.cursor(aiomysql.SSCursor) as cur:
+            with phase('execute'):
+                await cur.execute(GEOCODE_POINTS_QUERY, sub_category_args(city, sub_category))
+            with phase('fetch'):
+                return await fetch_points_async(cur)
+
+async def all_points(req, query, args, fmt, dtype):
+    async with db_connection() as conn:
+        async with conn.cursor(aiomysql.SSCursor) as cur:
+            with phase('execute'):
+                await cur.execute(query, args)
+            with phase('fetch'):
+                lat, lon = await fetch_points_async(cur)
+    if fmt == 'json':
+        return page_response(req, zip(lat.tolist(), lon.tolist()), None, fmt, dtype)
+    return binary_response(lat, lon, fmt, dtype)
+
+def binary_response(lat, lon, fmt, dtype, cursor=None):
+    with phase('serialize'):
+        body = wire.encode(fmt, [lat, lon], ['Latitude', 'Longitude'], dtype)
+    return Response(body, mimetype=wire.FORMATS[fmt], headers=binary_headers(sql_time(), cursor))
+
+async def fetch_page(query, args, after, limit):
+    async with db_connection() as conn:
+        async with conn.cursor() as cur:
+            with phase('execute'):
+                await cur.execute(query, args + (after, limit + 1))
+            with phase('fetch'):
+                rows = await cur.fetchall()
+    return last_page(rows, limit)
+
+def page_response(req, rows, cursor, fmt, dtype):
+    if fmt != 'json':
+        return binary_response(*points_array(rows), fmt, dtype, cursor)
+    return jsonify(
+        code=1,
+        msg="Success",
+        data=point_records(rows),
+        next_cursor=cursor,
+        req=req,
+        sqltime=sql_time()
+    )
+
+def limited(view):
+    # Caps how many requests of one route are in flight, so a slow route
+    # (e.g. /geocode waiting on Nominatim) cannot take every pool connection
+    # and starve the others.
+    name = view.__name__
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        slots = route_slots.get(name)
+        if slots is None:
+            slots = route_slots[name] = asyncio.Semaphore(ROUTE_LIMITS.get(name, DEFAULT_ROUTE_LIMIT))
+        try:
+            await asyncio.wait_for(slots.acquire(), QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return busy_response(name, 'Server busy: too many concurrent requests for this route, try again later')
+        g.route_slot = slots
+        try:
+            return await view(*args, **kwargs)
+        finally:
+            # Unless stream_rows() took the slot over to hold it until the
+            # stream ends
+            if g.pop('route_slot', None) is not None:
+                slots.release()
+    return wrapper
+
+@app.before_serving
+async def open_pool():
+    await pool.open()
+    try:
+        await current_dimensions()
+    except (pymysql.MySQLError, PoolTimeout):
+        # Database not reachable yet; the first request that needs it retries
+        pass
+
+@app.after_serving
+async def close_pool():
+    close = getattr(geocoder.backend, 'close', None)
+    if close:
+        await close()
+    await pool.close()
+
+@app.before_request
+async def start_timer():
+    g.timer = PhaseTimer()
+
+@app.before_request
+async def validate_orient():
+    error = orient_error(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    return None
+
+@app.before_request
+async def conditional_get():
+    if request.method != 'GET' or request.endpoint not in CONDITIONAL_ENDPOINTS or request.args.get('key') != '123':
+        return None
+    version = await data_version.current()
+    if version is None:
+        return None
+    g.etag = request_etag(request.endpoint, request.args, version)
+    modified = last_modified(data_version.updated_at)
+    matched = not_modified_tag(g.etag, modified, request.if_none_match, request.if_modified_since)
+    if matched:
+        response = Response('', status=304)
+        response.set_etag(matched)
+        response.last_modified = modified
+        return response
+    return None
+
+@app.after_request
+async def record_timing(response):
+    timer = g.get('timer')
+    if timer is None:
+        return response
+    response.headers['Server-Timing'] = timer.server_timing()
+    # Streams are recorded by stream_rows() once the last row is sent
+    if not g.get('streamed'):
+        metrics.observe(request.endpoint or 'not_found', request.method, response.status_code, timer.elapsed(), timer.phases)
+    return response
+
+@app.after_request
+async def compress_response(response):
+    if request.method == 'HEAD' or response.status_code in (204, 304):
+        return response
+    response.vary.add('Accept-Encoding')
+    # Streams are compressed as they are generated, see stream_rows()
+    if g.get('streamed') or 'Content-Encoding' in response.headers:
+        return response
+    encoding = compression.negotiate(request.accept_encodings, ENCODINGS)
+    if encoding is None:
+        return response
+    body = await response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    version = await data_version.current()
+    variant = body_variant(g.get('cache_status'), g.get('result_key'), body, encoding)
+    compressed = result_cache.get_body(g.result_key, version, variant) if variant else None
+    if compressed is None:
+        with phase('compress'):
+            compressed = await asyncio.to_thread(compression.compress, body, encoding, variant is not None)
+        if variant:
+            result_cache.put_body(g.result_key, version, variant, compressed)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+@app.after_request
+async def add_cache_header(response):
+    cache_status = g.get('cache_status')
+    if cache_status:
+        response.headers['X-Cache'] = cache_status.upper()
+    if g.get('approx'):
+        response.headers['X-Approximate'] = 'sample'
+    if g.get('etag') and g.get('conditional_ok') and response.status_code == 200:
+        response.set_etag(g.etag)
+        response.last_modified = last_modified(data_version.updated_at)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+async def stream_rows(req, query, args, fmt):
+    # stream_rows() of app.py over an aiomysql SSCursor. The route slot and
+    # the connection are both held until the stream finishes.
+    if request.method == 'HEAD':
+        return Response('', mimetype=stream_mimetype(fmt))
+    timer = g.timer
+    route, method = request.endpoint, request.method
+    with timer.phase('acquire'):
+        conn = await pool.acquire()
+    try:
+        cur = await conn.cursor(aiomysql.SSCursor)
+        with timer.phase('execute'):
+            await cur.execute(query, args)
+    except BaseException:
+        pool.release(conn, discard=True)
+        raise
+    names = [column[0] for column in cur.description]
+    slot = g.pop('route_slot', None)
+    released = []
+
+    def release(finished=False):
+        # Called when generate() ends and again when the request's task is
+        # done, which also covers a body that is never iterated, e.g. a client
+        # that goes away before the first chunk; the first call wins
+        if released:
+            return
+        released.append(True)
+        pool.release(conn, discard=not finished)
+        if slot is not None:
+            slot.release()
+        metrics.observe(route, method, 200, timer.elapsed(), timer.phases)
+
+    asyncio.current_task().add_done_callback(lambda task: release())
+
+    async def generate():
+        finished = False
+        try:
+            if fmt == 'json':
+                yield stream_head(req)
+            first = True
+            while True:
+                with timer.phase('fetch'):
+                    rows = await cur.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                with timer.phase('serialize'):
+                    chunk = stream_chunk(names, rows, fmt, first)
+                first = False
+                yield chunk
+            if fmt == 'json':
+                yield stream_tail(timer.db_time())
+            await cur.close()
+            finished = True
+        finally:
+            release(finished)
+
+    body = generate()
+    headers = {}
+    encoding = compression.negotiate(request.accept_encodings, ENCODINGS)
+    if encoding:
+        body = compression.compress_stream_async(body, encoding, timer)
+        headers['Content-Encoding'] = encoding
+    g.streamed = True
+    return Response(body, mimetype=stream_mimetype(fmt), headers=headers)
+
+def busy_response(req, msg='Server busy: no database connection available, try again later'):
+    response = jsonify(
+        code=0,
+        msg=msg,
+        req=req,
+        sqltime=sql_time()
+    )
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@app.route("/pool_stats", methods=['GET'])   #http://127.0.0.1:5000/pool_stats?key=123
+@limited
+async def pool_stats():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='pool_stats')
+    return jsonify(code=1, msg="Success", data=pool.stats(), req='pool_stats')
+
+@app.route("/cache_stats", methods=['GET'])   #http://127.0.0.1:5000/cache_stats?key=123
+@limited
+async def cache_stats():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='cache_stats')
+    return jsonify(code=1, msg="Success", data=cache_stats_data(result_cache, geocoder, memory_engine), req='cache_stats')
+
+@app.route("/metrics", methods=['GET'])   #http://127.0.0.1:5000/metrics?key=123
+@limited
+async def prometheus_metrics():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='metrics')
+    gauges = metric_gauges(pool.stats(), result_cache.stats())
+    return Response(metrics.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route("/dimensions", methods=['GET'])   #http://127.0.0.1:5000/dimensions?key=123
+@limited
+async def list_dimensions():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='dimensions')
+    data = (await current_dimensions()).as_dict()
+    g.conditional_ok = True
+    return jsonify(code=1, msg="Success", data=data, req='dimensions')
+
+@app.route("/aggregate", methods=['POST'])   #curl -X POST "http://127.0.0.1:5000/aggregate?key=123" -H "Content-Type: application/json" -d '{"specs": [{"group_by": ["DateYear"]}]}'
+@limited
+async def aggregate():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='aggregate', sqltime=sql_time())
+    try:
+        specs = parse_specs(await request.get_json(silent=True), (await current_dimensions()).cities)
+    except ValueError as e:
+        return jsonify(code=0, msg=str(e), req='aggregate', sqltime=sql_time()), 400
+    try:
+        answers, scans = await run_specs(specs, approx_requested(request.args))
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=[{'id': spec.id, 'data': shape(result, request.args), 'cache': cache_status}
+                  for spec, (result, cache_status) in zip(specs, answers)],
+            req='aggregate',
+            scans=scans,
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('aggregate')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='aggregate',
+            sqltime=sql_time()
+        )
+
+@app.route("/crime_category_per_city", methods=['GET'])   #http://127.0.0.1:5000/crime_category_per_city?key=123
+@limited
+async def crime_category_per_city():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='crime_category_per_city', sqltime=sql_time())
+    try:
+        results, cache_status = await cached_aggregate(['City', 'Crime_Category'])
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=shape(results, request.args),
+            req='crime_category_per_city',
+            cache=cache_status,
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('crime_category_per_city')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='crime_category_per_city',
+            sqltime=sql_time()
+        )
+
+@app.route("/crime_over_years", methods=['GET'])   #http://127.0.0.1:5000/crime_over_years?key=123
+@limited
+async def crime_over_years():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='crime_over_years', sqltime=sql_time())
+    try:
+        results, cache_status = await cached_aggregate(['DateYear'])
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=shape(results, request.args),
+            req='crime_over_years',
+            cache=cache_status,
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('crime_over_years')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='crime_over_years',
+            sqltime=sql_time()
+        )
+
+@app.route("/crime_per_month", methods=['GET'])  #http:/127.0.0.1:5000/crime_per_month?key=123&city=Seattle
+@limited
+async def crime_per_month():
+    key = request.args.get('key')
+    city = request.args.get('city')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='crime_per_month', sqltime=sql_time())
+    valid_cities = (await current_dimensions()).cities
+    if not city or city not in valid_cities:
+        return jsonify(code=0, msg=f"Invalid city. Valid options: {', '.join(valid_cities)}", req='crime_per_month', sqltime=sql_time())
+    try:
+        results, cache_status = await cached_aggregate(['DateMonth'], filters=[('City', '=', city)])
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=shape(results, request.args),
+            req='crime_per_month',
+            cache=cache_status,
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('crime_per_month')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='crime_per_month',
+            sqltime=sql_time()
+        )
+
+@app.route("/crime_by_date_range", methods=['GET'])  #http:/127.0.0.1:5000/crime_by_date_range?key=123&start_date=2020-01-01&end_date=2024-01-31
+@limited
+async def crimes_by_date_range():
+    key = request.args.get('key')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='crime_by_date_range', sqltime=sql_time())
+    if not start_date or not end_date:
+        return jsonify(code=0, msg='Start and end dates are required', req='crime_by_date_range', sqltime=sql_time())
+    try:
+        results, cache_status = await cached_aggregate(['CrimeDate'], filters=[('CrimeDate', 'between', (start_date, end_date))], order_by=['CrimeDate'])
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=shape(results, request.args),
+            req='crime_by_date_range',
+            cache=cache_status,
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('crime_by_date_range')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='crime_by_date_range',
+            sqltime=sql_time()
+        )
+
+@app.route("/crime_comparison_per_year", methods=['GET']) #http://127.0.0.1:5000/crime_comparison_per_year?key=123
+@limited
+async def crime_comparison_per_year():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='crime_comparison_per_year', sqltime=sql_time())
+    try:
+        results, cache_status = await cached_aggregate(['City', 'DateYear', 'Crime_Category'])
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=shape(results, request.args),
+            req='crime_comparison_per_year',
+            cache=cache_status,
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('crime_comparison_per_year')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='crime_comparison_per_year',
+            sqltime=sql_time()
+        )
+
+@app.route("/crime_statistics_by_category", methods=['GET']) #http://127.0.0.1:5000/crime_statistics_by_category?key=123
+@limited
+async def crime_statistics_by_category():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='crime_statistics_by_category', sqltime=sql_time())
+    try:
+        results, cache_status = await cached_aggregate(['Crime_Category'])
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=shape(results, request.args),
+            req='crime_statistics_by_category',
+            cache=cache_status,
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('crime_statistics_by_category')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='crime_statistics_by_category',
+            sqltime=sql_time()
+        )
+
+@app.route("/crime_per_city_category", methods=['GET']) #http://127.0.0.1:5000/crime_per_city_category?key=123
+@limited
+async def crime_rate_per_city():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='crime_rate_per_city', sqltime=sql_time())
+    try:
+        results, cache_status = await cached_aggregate(['City', 'Crime_Category'])
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=shape(results, request.args),
+            req='crime_rate_per_city',
+            cache=cache_status,
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('crime_rate_per_city')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='crime_rate_per_city',
+            sqltime=sql_time()
+        )
+
+@app.route('/crime_by_day_of_week', methods=['GET']) #http://127.0.0.1:5000/crime_by_day_of_week?key=123
+@limited
+async def crime_by_day_of_week():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='crime_by_day_of_week', sqltime=sql_time())
+    try:
+        results, cache_status = await cached_aggregate(['Day_Of_Week'], order_by=['Day_Of_Week'])
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=shape(results, request.args),
+            req='crime_by_day_of_week',
+            cache=cache_status,
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('crime_by_day_of_week')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='crime_by_day_of_week',
+            sqltime=sql_time()
+        )
+
+@app.route('/crime_details_by_city_category', methods=['GET']) #http://127.0.0.1:5000/crime_details_by_city_category?key=123&city=Seattle&category=Theft
+@limited
+async def crime_details_by_city_category():
+    key = request.args.get('key')
+    city = request.args.get('city')
+    category = request.args.get('category')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='crime_details_by_city_category', sqltime=sql_time())
+    if not city or not category:
+        return jsonify({"error": "Please provide both city and category parameters."}), 400
+    allowed_cities = (await current_dimensions()).cities
+    if city not in allowed_cities:
+        return jsonify({"error": f"Sorry, we do not have data for the city '{city}'. Supported cities are: {', '.join(allowed_cities)}."}), 400
+    try:
+        results, cache_status = await cached_aggregate(
+            ['Sub_Category'],
+            filters=[('City', '=', city), ('Crime_Category', 'like', category)],
+            order_by=['Crime_Count DESC']
+        )
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=shape(results, request.args),
+            req='crime_details_by_city_category',
+            cache=cache_status,
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('crime_details_by_city_category')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='crime_details_by_city_category',
+            sqltime=sql_time()
+        )
+
+@app.route('/crime_location_density_by_city', methods=['GET']) #http://127.0.0.1:5000/crime_location_density_by_city?key=123&city=Chicago&stream=ndjson
+@limited
+async def crime_location_density_by_city():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='crime_location_density_by_city', sqltime=sql_time())
+    try:
+        params = density_request(request.args, request.accept_mimetypes, (await current_dimensions()).cities)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 406
+    query, page_query = density_queries(params)
+    try:
+        if params.approx:
+            g.approx = True
+            if params.mode == 'points' or not memory_engine:
+                check_sample(await derived_tables())
+        if params.mode == 'bins':
+            result, cache_status = await cached_result(
+                'crime_location_density_by_city',
+                bins_cache_params(params),
+                lambda: location_bins(params.city, params.bin_size, params.outlier_iqr, params.bbox, params.approx)
+            )
+            return jsonify(
+                code=1,
+                msg="Success",
+                data=shape(result['bins'], request.args),
+                center=result['center'],
+                points=result['points'],
+                req='crime_location_density_by_city',
+                cache=cache_status,
+                sqltime=sql_time()
+            )
+        if params.stream:
+            return await stream_rows('crime_location_density_by_city', query, (params.city,), params.stream)
+        if params.limit is None:
+            return await all_points('crime_location_density_by_city', query, (params.city,), params.fmt, params.dtype)
+        rows, last_cid = await fetch_page(page_query, (params.city,), params.after, params.limit)
+        return page_response('crime_location_density_by_city', rows, next_cursor(last_cid, params.scope), params.fmt, params.dtype)
+    except PoolTimeout:
+        return busy_response('crime_location_density_by_city')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='crime_location_density_by_city',
+            sqltime=sql_time()
+        )
+
+@app.route('/geocode_points', methods=['GET'])   #http://127.0.0.1:5000/geocode_points?key=123&city=Chicago&sub_category=Assault&format=npy
+@limited
+async def geocode_points():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='geocode_points', sqltime=sql_time())
+    try:
+        params = points_request(request.args, request.accept_mimetypes)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 406
+    try:
+        if params.limit is None:
+            return await all_points('geocode_points', GEOCODE_POINTS_QUERY, params.args, params.fmt, params.dtype)
+        rows, last_cid = await fetch_page(GEOCODE_POINTS_PAGE_QUERY, params.args, params.after, params.limit)
+        return page_response('geocode_points', rows, next_cursor(last_cid, params.scope), params.fmt, params.dtype)
+    except PoolTimeout:
+        return busy_response('geocode_points')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='geocode_points',
+            sqltime=sql_time()
+        )
+
+@app.route('/geocode', methods=['GET'])   #http://127.0.0.1:5000/geocode?key=123&city=Chicago&sub_category=Assault
+@limited
+async def geocode():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(
+            code=0,
+            msg='Invalid API key',
+            req='geocode',
+            sqltime=sql_time()
+        )
+    try:
+        city, args, scope, after = geocode_request(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        cities = (await current_dimensions()).cities
+        if city not in cities:
+            return jsonify({
+                "error": f"City '{city}' not found in the database. Available cities are: {', '.join(cities)}."
+            }), 400
+        rows, last_cid = await fetch_page(GEOCODE_POINTS_PAGE_QUERY, args, after, 1)
+        if not rows:
+            return jsonify({
+                "error": "No crimes found for the provided city and sub-category."
+            }), 404
+        latitude, longitude = rows[0]
+        with phase('geocode'):
+            address = await geocoder.reverse_async(latitude, longitude)
+        if address:
+            return jsonify({
+                "latitude": latitude,
+                "longitude": longitude,
+                "address": address,
+                "next_cursor": next_cursor(last_cid, scope),
+                "sqltime": sql_time()
+            })
+        else:
+            return jsonify({
+                "error": "Address not found."
+            }), 404
+    except PoolTimeout:
+        return busy_response('geocode')
+    except GeocoderError as e:
+        return jsonify({
+            "error": f"Geocoder unavailable or API limit exceeded: {e}"
+        }), 503
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='geocode',
+            sqltime=sql_time()
+        )
+
+@app.route('/geocode_batch', methods=['POST'])   #curl -X POST "http://127.0.0.1:5000/geocode_batch?key=123" -H "Content-Type: application/json" -d '{"city": "Chicago", "sub_category": "Assault", "top": 10}'
+@limited
+async def geocode_batch():
+    key = request.args.get('key')
+    if key != '123':
+        return jsonify(code=0, msg='Invalid API key', req='geocode_batch', sqltime=sql_time())
+    try:
+        kind, value, radius = parse_geocode_batch(await request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify(code=0, msg=str(e), req='geocode_batch', sqltime=sql_time()), 400
+    try:
+        if kind == 'points':
+            items, lookups = point_items(value, radius)
+        else:
+            city, sub_category, top, bin_size = value
+            cities = (await current_dimensions()).cities
+            if city not in cities:
+                return jsonify(code=0, msg=f"Invalid city. Valid options: {', '.join(cities)}", req='geocode_batch', sqltime=sql_time()), 400
+            lat, lon = await hotspot_points(city, sub_category)
+            with phase('compute'):
+                items = lookups = await asyncio.to_thread(hotspots, lat, lon, top, bin_size, radius)
+        with phase('geocode'):
+            await resolve_async(geocoder, lookups, geocode_slots, GEOCODE_BATCH_TIMEOUT)
+        share_results(items)
+        return jsonify(
+            code=1,
+            msg="Success",
+            data=items,
+            summary=summary(items),
+            req='geocode_batch',
+            sqltime=sql_time()
+        )
+    except PoolTimeout:
+        return busy_response('geocode_batch')
+    except Exception as e:
+        return jsonify(
+            code=0,
+            msg=f"Error: {str(e)}",
+            req='geocode_batch',
+            sqltime=sql_time()
+        )
+
+if __name__ == "__main__":
+    app.run(debug=True)
@@ -0,0 +1,156 @@
+import datetime
+from collections import namedtuple
+
+from rollups import DIMENSIONS, ROLLUPS, check_spec, order_rows
+
+MAX_SPECS = 20
+MAX_GROUP_BY = 4
+SPEC_FIELDS = ('id', 'group_by', 'filters', 'order_by', 'limit')
+# Request filter name -> (dimension, operator)
+FILTER_FIELDS = {
+    'city': ('City', '='),
+    'year': ('DateYear', '='),
+    'category': ('Crime_Category', 'like'),
+    'sub_category': ('Sub_Category', 'like'),
+}
+DATE_FIELDS = ('start_date', 'end_date')
+
+# A normalised aggregate request: filters are sorted (dimension, op, value)
+# tuples so two specs with the same filters compare equal.
+Spec = namedtuple('Spec', 'id group_by filters order_by limit')
+
+
+def make_spec(group_by, filters=None, order_by=None, limit=None, id=None):
+    filters = tuple(sorted(
+        (dimension, op, value.strip().lower() if op == 'like' else value)
+        for dimension, op, value in filters or []
+    ))
+    # A top-N without an explicit order means the N largest counts
+    if limit and not order_by:
+        order_by = ['Crime_Count DESC']
+    check_spec(group_by, filters, order_by, limit)
+    return Spec(id, tuple(group_by), filters, tuple(order_by or ()), limit)
+
+
+def _dimensions(spec):
+    return set(spec.group_by) | {dimension for dimension, _, _ in spec.filters}
+
+
+def rollup_rank(dimensions):
+    # Position of the smallest rollup that can answer these dimensions; the
+    # fact table ranks last
+    for rank, (_, rollup_dimensions) in enumerate(ROLLUPS):
+        if dimensions <= set(rollup_dimensions):
+            return rank
+    return len(ROLLUPS)
+
+
+def parse_specs(body, cities):
+    # Validates a POST /aggregate body against the whitelist and returns Specs;
+    # raises ValueError with a message fit for the client.
+    specs = body.get('specs') if isinstance(body, dict) else None
+    if not isinstance(specs, list) or not specs:
+        raise ValueError("Body must be a JSON object with a non-empty 'specs' list")
+    if len(specs) > MAX_SPECS:
+        raise ValueError(f"At most {MAX_SPECS} specs per request")
+    parsed = []
+    for i, raw in enumerate(specs):
+        if not isinstance(raw, dict):
+            raise ValueError(f"Spec {i} must be an object")
+        unknown = set(raw) - set(SPEC_FIELDS)
+        if unknown:
+            raise ValueError(f"Spec {i}: unknown field(s) {', '.join(sorted(unknown))}")
+        group_by = raw.get('group_by', [])
+        if not isinstance(group_by, list) or not all(isinstance(d, str) for d in group_by):
+            raise ValueError(f"Spec {i}: group_by must be a list of column names")
+        if len(group_by) > MAX_GROUP_BY or len(set(group_by)) != len(group_by):
+            raise ValueError(f"Spec {i}: group_by takes up to {MAX_GROUP_BY} distinct columns from {', '.join(DIMENSIONS)}")
+        order_by = raw.get('order_by', [])
+        if not isinstance(order_by, list) or not all(isinstance(term, str) for term in order_by):
+            raise ValueError(f"Spec {i}: order_by must be a list such as [\"Crime_Count DESC\"]")
+        try:
+            spec = make_spec(group_by, _parse_filters(raw.get('filters') or {}, cities), order_by,
+                             raw.get('limit'), str(raw.get('id', i)))
+        except ValueError as e:
+            raise ValueError(f"Spec {i}: {e}")
+        parsed.append(spec)
+    return parsed
+
+
+def _parse_filters(raw, cities):
+    if not isinstance(raw, dict):
+        raise ValueError("filters must be an object")
+    unknown = set(raw) - set(FILTER_FIELDS) - set(DATE_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown filter(s) {', '.join(sorted(unknown))}; allowed: {', '.join(list(FILTER_FIELDS) + list(DATE_FIELDS))}")
+    filters = []
+    for name, (dimension, op) in FILTER_FIELDS.items():
+        value = raw.get(name)
+        if value is None:
+            continue
+        if name == 'year':
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError("year must be an integer")
+        elif not isinstance(value, str) or not value.strip():
+            raise ValueError(f"{name} must be a non-empty string")
+        if name == 'city' and value not in cities:
+            raise ValueError(f"Invalid city. Valid options: {', '.join(cities)}")
+        filters.append((dimension, op, value))
+    if any(name in raw for name in DATE_FIELDS):
+        try:
+            start, end = (datetime.date.fromisoformat(raw[name]).isoformat() for name in DATE_FIELDS)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("start_date and end_date must both be given as YYYY-MM-DD")
+        filters.append(('CrimeDate', 'between', (start, end)))
+    return filters
+
+
+def merge_specs(specs):
+    # Groups specs that share the same filters into scans: one query grouped
+    # by the union of their columns, re-aggregated per spec by derive(). Two
+    # specs are only merged while the union still fits the larger of the
+    # rollups they would read on their own, so merging never turns two rollup
+    # lookups into a fact table scan. Returns [(scan Spec, [spec index])].
+    scans = []
+    for i, spec in enumerate(specs):
+        for scan in scans:
+            if scan['filters'] != spec.filters:
+                continue
+            union = scan['group_by'] + [d for d in spec.group_by if d not in scan['group_by']]
+            dimensions = set(union) | {dimension for dimension, _, _ in spec.filters}
+            if rollup_rank(dimensions) <= max(scan['rank'], rollup_rank(_dimensions(spec))):
+                scan['group_by'] = union
+                scan['rank'] = rollup_rank(dimensions)
+                scan['members'].append(i)
+                break
+        else:
+            scans.append({'group_by': list(spec.group_by), 'filters': spec.filters,
+                          'rank': rollup_rank(_dimensions(spec)), 'members': [i]})
+
+    merged = []
+    for scan in scans:
+        members = scan['members']
+        first = specs[members[0]]
+        if len(members) == 1:
+            # Nothing to re-aggregate, so ordering and top-N go to the engine
+            merged.append((first, members))
+        else:
+            merged.append((Spec(None, tuple(scan['group_by']), scan['filters'], (), None), members))
+    return merged
+
+
+def derive(names, rows, spec):
+    # One spec's result from a scan grouped by a superset of its columns
+    group_by = list(spec.group_by)
+    if list(names[:-1]) != group_by:
+        positions = [names.index(dimension) for dimension in group_by]
+        totals = {}
+        for row in rows:
+            key = tuple(row[i] for i in positions)
+            totals[key] = totals.get(key, 0) + row[-1]
+        rows = [key + (count,) for key, count in totals.items()]
+        if not group_by and not rows:
+            rows = [(0,)]
+    names = group_by + ['Crime_Count']
+    rows = order_rows(names, rows, spec.order_by)
+    return names, rows[:spec.limit] if spec.limit else rows
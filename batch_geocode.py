@@ -0,0 +1,178 @@
+import asyncio
+import math
+import time
+
+import numpy as np
+
+from geocoder import GeocoderError, RateLimited
+from spatial import MIN_BIN_SIZE, bin_points
+
+MAX_ITEMS = 50
+DEFAULT_TOP = 10
+DEFAULT_BIN_SIZE = 0.005
+DEFAULT_DEDUPE_M = 250
+STATUSES = ('ok', 'not_found', 'rate_limited', 'error')
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    # Equirectangular, as in GazetteerGeocoder; exact enough below a few km
+    cos_lat = math.cos(math.radians((lat1 + lat2) / 2))
+    return 111200 * math.hypot(lat1 - lat2, (lon1 - lon2) * cos_lat)
+
+
+def distances_m(latitude, longitude, lats, lons):
+    # distance_m() from one point to arrays of points
+    cos_lat = np.cos(np.radians((lats + latitude) / 2))
+    return 111200 * np.hypot(lats - latitude, (lons - longitude) * cos_lat)
+
+
+def dedupe(points, radius_m):
+    # Greedy clustering in input order: a point within radius_m of an
+    # earlier kept point joins it. Returns the index of the kept point each
+    # input point resolves to.
+    kept, owner = [], []
+    for i, (latitude, longitude) in enumerate(points):
+        for j in kept:
+            if distance_m(latitude, longitude, *points[j]) <= radius_m:
+                owner.append(j)
+                break
+        else:
+            kept.append(i)
+            owner.append(i)
+    return owner
+
+
+def hotspots(lat, lon, top, bin_size, radius_m):
+    # Centres of the `top` busiest bin_size cells, the same cells the binned
+    # density view shows. Cells within radius_m of a busier one are the same
+    # hotspot, so their counts are added to it rather than listed twice.
+    # This is dedupe() over the ranked cells, but each kept spot claims its
+    # cells in one NumPy pass, and the loop stops once `top` spots are kept:
+    # the cells still unclaimed then belong to spots that are not listed.
+    bins = bin_points(lat, lon, bin_size=bin_size, outlier_iqr=0)['bins']
+    counts = np.asarray(bins['count'])
+    ranked = np.argsort(-counts, kind='stable')
+    counts = counts[ranked]
+    lat_centres = np.round(np.asarray(bins['lat_bin'])[ranked] + bin_size / 2, 6)
+    lon_centres = np.round(np.asarray(bins['lon_bin'])[ranked] + bin_size / 2, 6)
+    unclaimed = np.ones(len(counts), dtype=bool)
+    spots = []
+    while len(spots) < top and unclaimed.any():
+        # The busiest unclaimed cell is further than radius_m from every
+        # kept spot, so it starts a new one
+        i = int(np.argmax(unclaimed))
+        claimed = unclaimed & (distances_m(lat_centres[i], lon_centres[i], lat_centres, lon_centres) <= radius_m)
+        claimed[i] = True
+        unclaimed &= ~claimed
+        spots.append({'latitude': float(lat_centres[i]), 'longitude': float(lon_centres[i]), 'count': int(counts[claimed].sum())})
+    return spots
+
+
+def point_items(points, radius_m):
+    # One item per requested point, plus the distinct ones to look up. A
+    # point within radius_m of an earlier one is marked same_as and gets its
+    # answer from share_results().
+    items = [{'latitude': latitude, 'longitude': longitude} for latitude, longitude in points]
+    for i, j in enumerate(dedupe(points, radius_m)):
+        if i != j:
+            items[i]['same_as'] = j
+    return items, [item for item in items if 'same_as' not in item]
+
+
+def share_results(items):
+    for item in items:
+        if 'same_as' in item:
+            source = items[item['same_as']]
+            item.update({k: source[k] for k in ('status', 'address', 'error') if k in source})
+    return items
+
+
+def parse_request(body):
+    # Validates a POST /geocode_batch body. Returns ('points', [(lat, lon)],
+    # radius) or ('hotspots', (city, sub_category, top, bin_size), radius);
+    # raises ValueError with a message fit for the client. The city is
+    # checked by the route against the loaded dimensions.
+    if not isinstance(body, dict):
+        raise ValueError("Body must be a JSON object with either 'points' or 'city' and 'sub_category'")
+    radius = body.get('dedupe_m', DEFAULT_DEDUPE_M)
+    if isinstance(radius, bool) or not isinstance(radius, (int, float)) or not 0 <= radius < math.inf:
+        raise ValueError("dedupe_m must be a non-negative number of metres")
+    if 'points' in body:
+        points = body['points']
+        if not isinstance(points, list) or not points or len(points) > MAX_ITEMS:
+            raise ValueError(f"points must be a list of 1 to {MAX_ITEMS} [latitude, longitude] pairs")
+        parsed = []
+        for i, point in enumerate(points):
+            if (not isinstance(point, list) or len(point) != 2
+                    or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in point)
+                    or not (-90 <= point[0] <= 90 and -180 <= point[1] <= 180)):
+                raise ValueError(f"Point {i} must be [latitude, longitude] in degrees")
+            parsed.append((float(point[0]), float(point[1])))
+        return 'points', parsed, radius
+    city, sub_category = body.get('city'), body.get('sub_category')
+    if not isinstance(city, str) or not isinstance(sub_category, str) or not sub_category.strip():
+        raise ValueError("Provide either 'points' or both 'city' and 'sub_category'")
+    top = body.get('top', DEFAULT_TOP)
+    if isinstance(top, bool) or not isinstance(top, int) or not 1 <= top <= MAX_ITEMS:
+        raise ValueError(f"top must be an integer between 1 and {MAX_ITEMS}")
+    bin_size = body.get('bin_size', DEFAULT_BIN_SIZE)
+    if (isinstance(bin_size, bool) or not isinstance(bin_size, (int, float))
+            or not MIN_BIN_SIZE <= bin_size < math.inf):
+        raise ValueError(f"bin_size must be a number of degrees no smaller than {MIN_BIN_SIZE:g}")
+    return 'hotspots', (city, sub_category.strip(), top, float(bin_size)), radius
+
+
+def _outcome(address=None, error=None):
+    if isinstance(error, RateLimited):
+        return {'status': 'rate_limited', 'error': str(error)}
+    if error is not None:
+        return {'status': 'error', 'error': str(error)}
+    return {'status': 'ok', 'address': address} if address else {'status': 'not_found'}
+
+
+def _resolve_one(geocoder, latitude, longitude, deadline):
+    try:
+        return _outcome(geocoder.reverse(latitude, longitude, timeout=max(0.0, deadline - time.monotonic())))
+    except GeocoderError as e:
+        return _outcome(error=e)
+
+
+def resolve(geocoder, items, executor, timeout):
+    # Reverse-geocodes items (dicts with latitude/longitude) on the shared
+    # executor and adds status/address/error to each. Items still waiting
+    # for a rate-limit token at the deadline come back as rate_limited, so
+    # the batch always returns with whatever it managed to resolve.
+    deadline = time.monotonic() + timeout
+    futures = [executor.submit(_resolve_one, geocoder, item['latitude'], item['longitude'], deadline)
+               for item in items]
+    for item, future in zip(items, futures):
+        item.update(future.result())
+    return items
+
+
+async def _resolve_one_async(geocoder, latitude, longitude, deadline, slots):
+    async with slots:
+        try:
+            address = await geocoder.reverse_async(latitude, longitude, timeout=max(0.0, deadline - time.monotonic()))
+        except GeocoderError as e:
+            return _outcome(error=e)
+        return _outcome(address)
+
+
+async def resolve_async(geocoder, items, slots, timeout):
+    # resolve() for async_app.py; `slots` is the semaphore capping
+    # concurrent lookups across requests
+    deadline = time.monotonic() + timeout
+    outcomes = await asyncio.gather(*(
+        _resolve_one_async(geocoder, item['latitude'], item['longitude'], deadline, slots) for item in items
+    ))
+    for item, outcome in zip(items, outcomes):
+        item.update(outcome)
+    return items
+
+
+def summary(items):
+    counts = dict.fromkeys(STATUSES, 0)
+    for item in items:
+        counts[item['status']] += 1
+    return counts
@@ -0,0 +1,67 @@
+# Compares two loadgen result files route by route and exits non-zero when the
+# candidate is slower than the baseline by more than the threshold.
+#
+#   python -m benchmark.compare results/base.json results/change.json --threshold 10
+import argparse
+import json
+import sys
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+def change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two loadgen result files.")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="percent increase in p95 (or drop in throughput) that counts as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(f"baseline:  {baseline.get('label') or '-'} ({baseline.get('git_revision')}, {baseline.get('started_at')})")
+    print(f"candidate: {candidate.get('label') or '-'} ({candidate.get('git_revision')}, {candidate.get('started_at')})")
+    if baseline.get('config', {}).get('concurrency') != candidate.get('config', {}).get('concurrency'):
+        print("warning: the runs used different concurrency")
+
+    rows = [(route, baseline['routes'].get(route), candidate['routes'].get(route))
+            for route in sorted(set(baseline['routes']) | set(candidate['routes']))]
+    rows.append(('ALL', baseline['overall'], candidate['overall']))
+
+    regressions = []
+    print(f"{'route':36} {'rps':>18} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18}")
+    for route, before, after in rows:
+        if not before or not after:
+            print(f"{route:36} only in {'candidate' if after else 'baseline'}")
+            continue
+        cells = []
+        for metric in ('throughput_rps',) + METRICS:
+            delta = change(before[metric], after[metric])
+            delta_text = f"{delta:+.0f}%" if delta is not None else "n/a"
+            cells.append(f"{after[metric] or 0:10.1f} {delta_text:>7}")
+        print(f"{route:36} " + ' '.join(cells))
+        p95 = change(before['p95_ms'], after['p95_ms'])
+        rps = change(before['throughput_rps'], after['throughput_rps'])
+        if p95 is not None and p95 > args.threshold:
+            regressions.append(f"{route}: p95 {before['p95_ms']:.1f} -> {after['p95_ms']:.1f} ms ({p95:+.0f}%)")
+        if route == 'ALL' and rps is not None and -rps > args.threshold:
+            regressions.append(f"overall throughput {before['throughput_rps']:.1f} -> {after['throughput_rps']:.1f} rps ({rps:+.0f}%)")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression{'' if len(regressions) == 1 else 's'} over {args.threshold:.0f}%:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\nNo regressions over {args.threshold:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
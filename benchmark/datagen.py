@@ -0,0 +1,158 @@
+# Writes synthetic ChicagoCrimes.csv, SanFranciscoCrimes.csv and SeattleCrimes.csv
+# in the same layouts as the real exports, so loader.py loads them unchanged.
+#
+#   python -m benchmark.datagen --rows 3000000 --out bench_data
+#   python loader.py --data-dir bench_data
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Rough city centres and spreads (degrees), and a sample of each city's own
+# category vocabulary with descending frequency
+CITIES = {
+    'Chicago': {
+        'file': 'ChicagoCrimes.csv',
+        'center': (41.85, -87.68), 'spread': (0.09, 0.06),
+        'categories': {
+            'THEFT': ['$500 AND UNDER', 'OVER $500', 'RETAIL THEFT', 'FROM BUILDING'],
+            'BATTERY': ['SIMPLE', 'DOMESTIC BATTERY SIMPLE', 'AGGRAVATED - HANDGUN'],
+            'CRIMINAL DAMAGE': ['TO PROPERTY', 'TO VEHICLE'],
+            'ASSAULT': ['SIMPLE', 'AGGRAVATED - HANDGUN'],
+            'DECEPTIVE PRACTICE': ['FINANCIAL IDENTITY THEFT OVER $ 300', 'CREDIT CARD FRAUD'],
+            'MOTOR VEHICLE THEFT': ['AUTOMOBILE', 'TRUCK, BUS, MOTOR HOME'],
+            'NARCOTICS': ['POSS: CANNABIS 30GMS OR LESS', 'POSS: HEROIN(WHITE)'],
+            'BURGLARY': ['FORCIBLE ENTRY', 'UNLAWFUL ENTRY'],
+            'ROBBERY': ['ARMED - HANDGUN', 'STRONG ARM - NO WEAPON'],
+            'WEAPONS VIOLATION': ['UNLAWFUL POSS OF HANDGUN', 'RECKLESS FIREARM DISCHARGE'],
+            'CRIMINAL TRESPASS': ['TO LAND', 'TO RESIDENCE'],
+            'OFFENSE INVOLVING CHILDREN': ['ENDANGER LIFE / HEALTH OF CHILD'],
+            'PUBLIC PEACE VIOLATION': ['RECKLESS CONDUCT'],
+            'HOMICIDE': ['FIRST DEGREE MURDER'],
+        },
+    },
+    'San Francisco': {
+        'file': 'SanFranciscoCrimes.csv',
+        'center': (37.76, -122.44), 'spread': (0.03, 0.03),
+        'categories': {
+            'Larceny Theft': ['Theft, From Locked Vehicle, >$950', 'Theft, Other Property, $50-$200'],
+            'Malicious Mischief': ['Malicious Mischief, Vandalism to Property'],
+            'Other Miscellaneous': ['Found Property', 'Stay Away or Court Order, Non-DV Related'],
+            'Assault': ['Battery', 'Assault, Aggravated, W/ Knife'],
+            'Non-Criminal': ['Lost Property', 'Aided Case'],
+            'Burglary': ['Burglary, Commercial Property, Forcible Entry'],
+            'Motor Vehicle Theft': ['Vehicle, Stolen, Auto'],
+            'Fraud': ['Fraudulent Use of Credit Card', 'Fraud, Elder Abuse'],
+            'Warrant': ['Warrant Arrest, Enroute To Outside Jurisdiction'],
+            'Drug Offense': ['Methamphetamine, Possession'],
+            'Robbery': ['Robbery, Street, Strongarm'],
+            'Traffic Violation Arrest': ['Driving, Suspended License'],
+        },
+    },
+    'Seattle': {
+        'file': 'SeattleCrimes.csv',
+        'center': (47.62, -122.33), 'spread': (0.06, 0.03),
+        'categories': {
+            'LARCENY-THEFT': ['THEFT FROM MOTOR VEHICLE', 'SHOPLIFTING', 'ALL OTHER LARCENY'],
+            'DESTRUCTION/DAMAGE/VANDALISM OF PROPERTY': ['DESTRUCTION/DAMAGE/VANDALISM OF PROPERTY'],
+            'ASSAULT OFFENSES': ['SIMPLE ASSAULT', 'AGGRAVATED ASSAULT', 'INTIMIDATION'],
+            'BURGLARY/BREAKING&ENTERING': ['BURGLARY/BREAKING & ENTERING'],
+            'MOTOR VEHICLE THEFT': ['MOTOR VEHICLE THEFT'],
+            'FRAUD OFFENSES': ['IDENTITY THEFT', 'CREDIT CARD/AUTOMATED TELLER MACHINE FRAUD'],
+            'TRESPASS OF REAL PROPERTY': ['TRESPASS OF REAL PROPERTY'],
+            'DRUG/NARCOTIC OFFENSES': ['DRUG/NARCOTIC VIOLATIONS'],
+            'ROBBERY': ['ROBBERY'],
+            'DRIVING UNDER THE INFLUENCE': ['DRIVING UNDER THE INFLUENCE'],
+            'WEAPON LAW VIOLATIONS': ['WEAPON LAW VIOLATIONS'],
+            'STOLEN PROPERTY OFFENSES': ['STOLEN PROPERTY OFFENSES'],
+        },
+    },
+}
+START = np.datetime64('2019-01-01')
+DAYS = int((np.datetime64('2024-12-31') - START).astype(int)) + 1
+
+
+def zipf_weights(n, s=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+def city_chunk(city, n, first_id, rng):
+    spec = CITIES[city]
+    categories = list(spec['categories'])
+    category_idx = rng.choice(len(categories), size=n, p=zipf_weights(len(categories)))
+    descriptions = np.empty(n, dtype=object)
+    for i, category in enumerate(categories):
+        mask = category_idx == i
+        descriptions[mask] = rng.choice(spec['categories'][category], size=int(mask.sum()))
+    category_col = np.array(categories, dtype=object)[category_idx]
+
+    # A few hot spots per city plus a diffuse background
+    hot_spots = rng.normal(spec['center'], spec['spread'], size=(8, 2))
+    spot = rng.integers(0, len(hot_spots), size=n)
+    diffuse = rng.random(n) < 0.4
+    lat = np.where(diffuse, rng.normal(spec['center'][0], spec['spread'][0], n), rng.normal(hot_spots[spot, 0], 0.01))
+    lon = np.where(diffuse, rng.normal(spec['center'][1], spec['spread'][1], n), rng.normal(hot_spots[spot, 1], 0.01))
+    lat, lon = lat.round(6), lon.round(6)
+    # Source quirks the pipeline has to cope with: (0, 0) placeholders and blanks
+    zero = rng.random(n) < 0.002
+    lat[zero], lon[zero] = 0.0, 0.0
+    blank = rng.random(n) < 0.01
+    lat[blank] = np.nan
+
+    # Mild summer peak in the dates
+    day = rng.integers(0, DAYS, size=n)
+    day = (day + (30 * np.sin(2 * np.pi * day / 365.25)).astype(int)).clip(0, DAYS - 1)
+    dates = pd.to_datetime(START + day.astype('timedelta64[D]')) + pd.to_timedelta(rng.integers(0, 86400, size=n), unit='s')
+    ids = np.arange(first_id, first_id + n)
+
+    if city == 'Chicago':
+        return pd.DataFrame({
+            'ID': ids, 'Date': dates.strftime('%m/%d/%Y %I:%M:%S %p'),
+            'PrimaryType': category_col, 'Description': descriptions, 'Latitude': lat, 'Longitude': lon,
+        })
+    if city == 'San Francisco':
+        return pd.DataFrame({
+            'Row ID': ids, 'Incident Date': dates.strftime('%Y/%m/%d'), 'Incident Year': dates.year,
+            'Incident Category': category_col, 'Incident Description': descriptions, 'Latitude': lat, 'Longitude': lon,
+        })
+    return pd.DataFrame({
+        'Offense ID': ids, 'Report DateTime': dates.strftime('%m/%d/%Y %I:%M:%S %p'),
+        'Offense Parent Group': category_col, 'Offense': descriptions, 'Latitude': lat, 'Longitude': lon,
+    })
+
+
+def write_city(city, rows, out_dir, chunksize, seed):
+    rng = np.random.default_rng([seed, list(CITIES).index(city)])
+    path = Path(out_dir) / CITIES[city]['file']
+    written = 0
+    with open(path, 'w', newline='') as f:
+        while written < rows:
+            n = min(chunksize, rows - written)
+            city_chunk(city, n, written + 1, rng).to_csv(f, index=False, header=written == 0)
+            written += n
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic city crime CSVs for benchmarking.")
+    parser.add_argument('--rows', type=int, default=1000000, help="rows in total, split across the cities")
+    parser.add_argument('--out', default='bench_data')
+    parser.add_argument('--chunksize', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=0, help="same seed and rows give byte-identical files")
+    args = parser.parse_args()
+
+    Path(args.out).mkdir(parents=True, exist_ok=True)
+    # Same proportions as the real exports: Chicago largest, Seattle smallest
+    shares = {'Chicago': 0.45, 'San Francisco': 0.3, 'Seattle': 0.25}
+    for city, share in shares.items():
+        start = time.monotonic()
+        rows = int(args.rows * share)
+        path = write_city(city, rows, args.out, args.chunksize, args.seed)
+        print(f"{path}: {rows} rows in {time.monotonic() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# Replays a weighted mix of the API routes against a running app.py at a fixed
+# concurrency and reports throughput and p50/p95/p99 latency per route.
+#
+#   python -m benchmark.loadgen --concurrency 16 --duration 60 --out results/base.json
+import argparse
+import json
+import math
+import random
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CITIES = ['Chicago', 'San Francisco', 'Seattle']
+CATEGORIES = ['Theft', 'Violent', 'Property', 'Drug', 'Traffic', 'Public']
+SUB_CATEGORIES = ['Assault', 'Theft', 'Burglary', 'Robbery', 'Fraud', 'Narcotic']
+
+# (weight, label, route, parameter factory); weights roughly follow dashboard
+# traffic. Parameters are drawn at random so not every request is a cache hit.
+MIX = [
+    (10, 'crime_category_per_city', 'crime_category_per_city', lambda r: {}),
+    (10, 'crime_over_years', 'crime_over_years', lambda r: {}),
+    (10, 'crime_per_month', 'crime_per_month', lambda r: {'city': r.choice(CITIES)}),
+    (10, 'crime_by_date_range', 'crime_by_date_range', lambda r: date_range(r)),
+    (10, 'crime_comparison_per_year', 'crime_comparison_per_year', lambda r: {}),
+    (10, 'crime_statistics_by_category', 'crime_statistics_by_category', lambda r: {}),
+    (5, 'crime_per_city_category', 'crime_per_city_category', lambda r: {}),
+    (10, 'crime_by_day_of_week', 'crime_by_day_of_week', lambda r: {}),
+    (10, 'crime_details_by_city_category', 'crime_details_by_city_category',
+     lambda r: {'city': r.choice(CITIES), 'category': r.choice(CATEGORIES)}),
+    (8, 'crime_location_density_by_city:bins', 'crime_location_density_by_city',
+     lambda r: {'city': r.choice(CITIES), 'mode': 'bins'}),
+    (2, 'crime_location_density_by_city:npy', 'crime_location_density_by_city',
+     lambda r: {'city': r.choice(CITIES), 'format': 'npy'}),
+    (5, 'geocode', 'geocode', lambda r: {'city': r.choice(CITIES), 'sub_category': r.choice(SUB_CATEGORIES)}),
+]
+
+
+def date_range(r):
+    year = r.randint(2019, 2024)
+    month = r.randint(1, 12)
+    return {'start_date': f'{year}-{month:02d}-01', 'end_date': f'{year}-{month:02d}-28'}
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, errors, statuses, cache_hits, elapsed):
+    routes = {}
+    for route in sorted(set(latencies) | set(errors)):
+        values = sorted(latencies[route])
+        count = len(values) + errors[route]
+        routes[route] = {
+            'requests': count,
+            'errors': errors[route],
+            'throughput_rps': count / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(values, 50),
+            'p95_ms': percentile(values, 95),
+            'p99_ms': percentile(values, 99),
+            'max_ms': values[-1] if values else None,
+            'mean_ms': sum(values) / len(values) if values else None,
+            'cache_hit_ratio': cache_hits[route] / len(values) if values else None,
+            'statuses': dict(statuses[route]),
+        }
+    everything = sorted(v for values in latencies.values() for v in values)
+    total = len(everything) + sum(errors.values())
+    overall = {
+        'requests': total,
+        'errors': sum(errors.values()),
+        'throughput_rps': total / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(everything, 50),
+        'p95_ms': percentile(everything, 95),
+        'p99_ms': percentile(everything, 99),
+    }
+    return routes, overall
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the crime API with a weighted route mix.")
+    parser.add_argument('--base-url', default='http://127.0.0.1:5000')
+    parser.add_argument('--key', default='123')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds to measure, after the warm-up")
+    parser.add_argument('--warmup', type=float, default=5.0, help="seconds of unrecorded traffic first")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label', default='', help="free text stored with the results, e.g. the change under test")
+    parser.add_argument('--out', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    weights = [weight for weight, _, _, _ in MIX]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    statuses = defaultdict(lambda: defaultdict(int))
+    cache_hits = defaultdict(int)
+    lock = threading.Lock()
+    started_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    start = time.monotonic()
+    measure_from = start + args.warmup
+    stop_at = measure_from + args.duration
+
+    def worker(worker_id):
+        # One session per worker so every worker keeps its own keep-alive connection
+        rng = random.Random(args.seed * 1000 + worker_id)
+        session = requests.Session()
+        session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            _, label, route, params = rng.choices(MIX, weights=weights)[0]
+            query = dict(params(rng), key=args.key)
+            sent = time.perf_counter()
+            try:
+                response = session.get(f"{args.base_url}/{route}", params=query, timeout=args.timeout)
+                response.content  # read the whole body
+                ok = response.status_code < 500
+                status = response.status_code
+                hit = response.headers.get('X-Cache') == 'HIT'
+            except requests.RequestException:
+                ok, status, hit = False, 'error', False
+            elapsed_ms = (time.perf_counter() - sent) * 1000
+            if now < measure_from:
+                continue
+            with lock:
+                statuses[label][str(status)] += 1
+                if ok:
+                    latencies[label].append(elapsed_ms)
+                    cache_hits[label] += hit
+                else:
+                    errors[label] += 1
+
+    print(f"Warming up for {args.warmup:.0f}s, then measuring for {args.duration:.0f}s at concurrency {args.concurrency}")
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(worker, range(args.concurrency)))
+    elapsed = time.monotonic() - measure_from
+
+    routes, overall = summarize(latencies, errors, statuses, cache_hits, elapsed)
+    print(f"{'route':36} {'req':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, stats in list(routes.items()) + [('ALL', overall)]:
+        print(f"{route:36} {stats['requests']:7d} {stats['errors']:5d} {stats['throughput_rps']:8.1f} "
+              f"{stats['p50_ms'] or 0:8.1f} {stats['p95_ms'] or 0:8.1f} {stats['p99_ms'] or 0:8.1f}")
+
+    if args.out:
+        result = {
+            'label': args.label,
+            'git_revision': git_revision(),
+            'started_at': started_at,
+            'config': {key: value for key, value in vars(args).items() if key not in ('out', 'key')},
+            'mix': [{'weight': weight, 'label': label, 'route': route} for weight, label, route, _ in MIX],
+            'elapsed_s': elapsed,
+            'overall': overall,
+            'routes': routes,
+        }
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
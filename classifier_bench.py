@@ -0,0 +1,89 @@
+# Checks CrimeClassifier against the original categorize_crime and times both
+# on a synthetic Sub_Category column. Exits non-zero on any mismatch.
+#
+#   python classifier_bench.py --rows 5000000
+#   python classifier_bench.py --csv SeattleCrimes.csv --column "Offense Parent Group"
+import argparse
+import itertools
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from crime_classifier import CrimeClassifier, categorize_crime
+
+# A sample of the sub-categories the three cities actually report
+SUB_CATEGORIES = [
+    'THEFT', 'BATTERY', 'CRIMINAL DAMAGE', 'ASSAULT', 'DECEPTIVE PRACTICE', 'OTHER OFFENSE',
+    'NARCOTICS', 'BURGLARY', 'MOTOR VEHICLE THEFT', 'ROBBERY', 'WEAPONS VIOLATION',
+    'CRIMINAL TRESPASS', 'OFFENSE INVOLVING CHILDREN', 'PUBLIC PEACE VIOLATION', 'SEX OFFENSE',
+    'CRIM SEXUAL ASSAULT', 'INTERFERENCE WITH PUBLIC OFFICER', 'HOMICIDE', 'ARSON', 'STALKING',
+    'Larceny Theft', 'Malicious Mischief', 'Non-Criminal', 'Recovered Vehicle', 'Fraud', 'Warrant',
+    'Drug Offense', 'Lost Property', 'Suspicious Occ', 'Disorderly Conduct', 'Miscellaneous Investigation',
+    'Forgery And Counterfeiting', 'Traffic Violation Arrest', 'Missing Person', 'Courtesy Report',
+    'LARCENY-THEFT', 'DESTRUCTION/DAMAGE/VANDALISM OF PROPERTY', 'ASSAULT OFFENSES',
+    'BURGLARY/BREAKING&ENTERING', 'FRAUD OFFENSES', 'TRESPASS OF REAL PROPERTY', 'DRUG/NARCOTIC OFFENSES',
+    'DRIVING UNDER THE INFLUENCE', 'STOLEN PROPERTY OFFENSES', 'FAMILY OFFENSES, NONVIOLENT',
+    'EXTORTION/BLACKMAIL', 'PORNOGRAPHY/OBSCENE MATERIAL', 'LIQUOR LAW VIOLATIONS', 'BAD CHECKS',
+    'ANIMAL CRUELTY', 'CURFEW/LOITERING/VAGRANCY VIOLATIONS', 'GAMBLING OFFENSES', 'HUMAN TRAFFICKING',
+]
+
+
+def edge_cases(classifier):
+    # Every keyword alone, in upper case, and paired with every other keyword
+    # (which exercises rule priority), plus values that are not plain strings.
+    keywords = [keyword for category in classifier.rules['categories'] for keyword in category['keywords']]
+    values = keywords + [keyword.upper() for keyword in keywords]
+    values += [f"{a} / {b}" for a, b in itertools.product(keywords, keywords)]
+    values += ['', ' ', 'nan', 'None', '12', 'ammunition', ' AMMUNITION', 'multi\nline assault']
+    return pd.Series(values + [None, np.nan, 12])
+
+
+def check(classifier, series):
+    expected = series.map(categorize_crime)
+    actual = classifier.classify(series).astype(object)
+    mismatched = expected != actual
+    for value, want, got in zip(series[mismatched], expected[mismatched], actual[mismatched]):
+        print(f"MISMATCH {value!r}: categorize_crime={want!r} CrimeClassifier={got!r}")
+    return int(mismatched.sum())
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time CrimeClassifier against categorize_crime.")
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--csv', help="take the values from this CSV instead of generating them")
+    parser.add_argument('--column', default='Sub_Category')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    classifier = CrimeClassifier.from_file()
+    failures = check(classifier, edge_cases(classifier))
+
+    if args.csv:
+        series = pd.read_csv(args.csv, usecols=[args.column])[args.column]
+    else:
+        rng = np.random.default_rng(args.seed)
+        series = pd.Series(rng.choice(SUB_CATEGORIES, size=args.rows))
+    print(f"{len(series)} rows, {series.nunique()} distinct values")
+
+    legacy, legacy_time = timed(lambda: series.apply(categorize_crime))
+    vectorized, vectorized_time = timed(lambda: classifier.classify(series))
+    failures += int((legacy != vectorized.astype(object)).sum())
+    print(f"categorize_crime  {legacy_time:8.3f}s  {len(series) / legacy_time:12.0f} rows/sec")
+    print(f"CrimeClassifier   {vectorized_time:8.3f}s  {len(series) / vectorized_time:12.0f} rows/sec  ({legacy_time / vectorized_time:.0f}x)")
+
+    if failures:
+        print(f"{failures} value{'' if failures == 1 else 's'} classified differently")
+        sys.exit(1)
+    print("CrimeClassifier matches categorize_crime")
+
+
+if __name__ == "__main__":
+    main()
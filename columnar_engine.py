@@ -0,0 +1,215 @@
+import datetime
+import re
+import threading
+import time
+
+import numpy as np
+import pymysql
+
+from rollups import FACT_TABLE, check_spec, order_rows
+
+EPOCH = datetime.datetime(1970, 1, 1)
+LOAD_BATCH_SIZE = 50000
+DICTIONARY_COLUMNS = ('City', 'Crime_Category', 'Sub_Category')
+# Dictionary codes are narrowed to int16 after loading when they fit
+COLUMN_TYPES = {
+    'City': np.int32, 'Crime_Category': np.int32, 'Sub_Category': np.int32,
+    'DateYear': np.int16, 'DateMonth': np.int16, 'Day': np.int32,
+    'Latitude': np.float32, 'Longitude': np.float32,
+}
+LOAD_QUERY = f"""
+    SELECT City, Crime_Category, Sub_Category, DateYear, DateMonth,
+           DATEDIFF(CrimeDate, '1970-01-01'), Latitude, Longitude
+    FROM {FACT_TABLE}
+"""
+# Dense group keys up to this many slots are counted with bincount; larger
+# key spaces fall back to np.unique
+BINCOUNT_LIMIT = 1 << 24
+
+
+def _like(pattern):
+    # MySQL LIKE (case-insensitive under the table's collation) as a regex
+    parts = ('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern.lower())
+    return re.compile(''.join(parts), re.DOTALL)
+
+
+def _day(value):
+    return int(np.datetime64(str(value)[:10], 'D').astype(np.int64))
+
+
+class ColumnarSnapshot:
+    # One immutable, fully loaded copy of hovetl_crimes. Strings are
+    # dictionary-encoded; CrimeDate is kept as days since 1970-01-01.
+    def __init__(self, version, dictionaries, columns, load_seconds):
+        self.version = version
+        self.dictionaries = dictionaries
+        self.index = {name: {value: i for i, value in enumerate(values)} for name, values in dictionaries.items()}
+        self.columns = columns
+        self.rows = len(columns['Day'])
+        self.load_seconds = load_seconds
+
+    def stats(self):
+        return {
+            'data_version': self.version,
+            'rows': self.rows,
+            'bytes': sum(column.nbytes for column in self.columns.values()),
+            'load_seconds': self.load_seconds,
+        }
+
+    def _column(self, dimension):
+        return self.columns['Day' if dimension == 'CrimeDate' else dimension]
+
+    def _decode(self, dimension, values):
+        if dimension in self.dictionaries:
+            names = self.dictionaries[dimension]
+            return [names[v] for v in values.tolist()]
+        if dimension == 'CrimeDate':
+            return [EPOCH + datetime.timedelta(days=v) for v in values.tolist()]
+        return values.tolist()
+
+    def _render(self, dimension, value):
+        # Text form MySQL compares against in LIKE
+        if value is None:
+            return None
+        if dimension == 'CrimeDate':
+            return value.strftime('%Y-%m-%d %H:%M:%S')
+        return str(value)
+
+    def _mask(self, filters):
+        mask = None
+        for dimension, op, value in filters:
+            column = self._column(dimension)
+            if op == 'like':
+                regex = _like(f"%{value}%")
+                present = np.arange(len(self.dictionaries[dimension])) if dimension in self.dictionaries else np.unique(column)
+                matches = []
+                for code, decoded in zip(present.tolist(), self._decode(dimension, present)):
+                    text = self._render(dimension, decoded)
+                    if text is not None and regex.fullmatch(text.lower()):
+                        matches.append(code)
+                current = np.isin(column, matches)
+            elif dimension in self.index:
+                if op == '=':
+                    code = self.index[dimension].get(value)
+                    current = column == code if code is not None else np.zeros(self.rows, dtype=bool)
+                else:
+                    low, high = value
+                    codes = [code for code, name in enumerate(self.dictionaries[dimension])
+                             if name is not None and low <= name <= high]
+                    current = np.isin(column, codes)
+            else:
+                convert = _day if dimension == 'CrimeDate' else int
+                if op == '=':
+                    current = column == convert(value)
+                else:
+                    low, high = value
+                    current = (column >= convert(low)) & (column <= convert(high))
+            mask = current if mask is None else mask & current
+        return mask
+
+    def aggregate(self, group_by, filters=None, order_by=None, limit=None):
+        # Same contract as QueryPlanner.plan + fetchall: (column names, rows)
+        check_spec(group_by, filters, order_by, limit)
+        names = list(group_by) + ['Crime_Count']
+        mask = self._mask(filters or [])
+        selected = None if mask is None else np.flatnonzero(mask)
+        if not group_by:
+            return names, [(self.rows if selected is None else len(selected),)]
+        if selected is not None and not len(selected):
+            return names, []
+
+        # Dense key per row: dictionary codes as they are, numeric columns
+        # shifted to start at zero
+        key = None
+        sizes, offsets = [], []
+        for dimension in group_by:
+            column = self._column(dimension)
+            if selected is not None:
+                column = column[selected]
+            if dimension in self.dictionaries:
+                low, size = 0, len(self.dictionaries[dimension])
+            else:
+                low = int(column.min())
+                size = int(column.max()) - low + 1
+            part = column.astype(np.int64) - low
+            key = part if key is None else key * size + part
+            sizes.append(size)
+            offsets.append(low)
+
+        slots = int(np.prod(sizes, dtype=np.float64))
+        if slots <= BINCOUNT_LIMIT:
+            counts = np.bincount(key, minlength=slots)
+            groups = np.flatnonzero(counts)
+            counts = counts[groups]
+        else:
+            groups, counts = np.unique(key, return_counts=True)
+        parts = np.unravel_index(groups, sizes)
+        columns = [self._decode(dimension, part + low) for dimension, part, low in zip(group_by, parts, offsets)]
+        rows = order_rows(names, zip(*columns, counts.tolist()), order_by)
+        return names, rows[:limit] if limit else rows
+
+    def points(self, city, sub_category=None):
+        # Latitude/Longitude of one city, optionally only the sub-categories
+        # containing `sub_category` (Sub_Category_Lower LIKE '%...%')
+        filters = [('City', '=', city)]
+        if sub_category:
+            filters.append(('Sub_Category', 'like', sub_category.lower()))
+        rows = self._mask(filters)
+        return self.columns['Latitude'][rows].astype(np.float64), self.columns['Longitude'][rows].astype(np.float64)
+
+
+class ColumnarEngine:
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def snapshot(self, version, connection):
+        # The first caller to see a new data version loads it while the
+        # others wait on the lock; the new snapshot replaces the old one in a
+        # single assignment, so no caller ever sees a partial load.
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                with connection() as conn:
+                    snapshot = self._load(conn, version)
+                self._snapshot = snapshot
+        return snapshot
+
+    def stats(self):
+        snapshot = self._snapshot
+        return snapshot.stats() if snapshot else {'data_version': None, 'rows': 0, 'bytes': 0, 'load_seconds': None}
+
+    def _load(self, conn, version):
+        start = time.monotonic()
+        dictionaries = {name: [] for name in DICTIONARY_COLUMNS}
+        index = {name: {} for name in DICTIONARY_COLUMNS}
+        batches = {name: [] for name in COLUMN_TYPES}
+        cur = conn.cursor(pymysql.cursors.SSCursor)
+        cur.execute(LOAD_QUERY)
+        while True:
+            rows = cur.fetchmany(LOAD_BATCH_SIZE)
+            if not rows:
+                break
+            city, category, sub_category, year, month, day, lat, lon = zip(*rows)
+            for name, values in (('City', city), ('Crime_Category', category), ('Sub_Category', sub_category)):
+                lookup = index[name]
+                for value in set(values) - lookup.keys():
+                    lookup[value] = len(dictionaries[name])
+                    dictionaries[name].append(value)
+                batches[name].append(np.fromiter(map(lookup.__getitem__, values), np.int32, len(values)))
+            for name, values in (('DateYear', year), ('DateMonth', month), ('Day', day), ('Latitude', lat), ('Longitude', lon)):
+                batches[name].append(np.array(values, dtype=COLUMN_TYPES[name]))
+        cur.close()
+
+        columns = {}
+        for name, parts in batches.items():
+            column = np.concatenate(parts) if parts else np.empty(0, dtype=COLUMN_TYPES[name])
+            if name in dictionaries and len(dictionaries[name]) <= np.iinfo(np.int16).max:
+                column = column.astype(np.int16)
+            columns[name] = column
+        # DAYOFWEEK(): 1 = Sunday; 1970-01-01 was a Thursday
+        columns['Day_Of_Week'] = ((columns['Day'].astype(np.int64) + 4) % 7 + 1).astype(np.int8)
+        return ColumnarSnapshot(version, dictionaries, columns, time.monotonic() - start)
@@ -0,0 +1,106 @@
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Server preference when the client accepts several with the same q value
+ENCODINGS = ('zstd', 'br', 'gzip')
+MIN_SIZE = 1024
+
+# Per-request bodies favour speed; bodies stored in the result cache are
+# compressed once, so they can afford a slower, tighter level.
+FAST_LEVELS = {'gzip': 5, 'br': 4, 'zstd': 3}
+STORED_LEVELS = {'gzip': 9, 'br': 9, 'zstd': 12}
+
+
+def available(encodings=ENCODINGS):
+    return [e for e in encodings
+            if e == 'gzip' or (e == 'br' and brotli) or (e == 'zstd' and zstandard)]
+
+
+def negotiate(accept_encodings, encodings):
+    # Best encoding for an Accept-Encoding header (werkzeug Accept object),
+    # or None to send the body as it is
+    best, best_q = None, 0
+    for encoding in encodings:
+        q = accept_encodings.quality(encoding)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data, encoding, stored=False):
+    # Deterministic output (gzip mtime 0) so equal bodies compress to equal bytes
+    level = (STORED_LEVELS if stored else FAST_LEVELS)[encoding]
+    if encoding == 'gzip':
+        c = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return c.compress(data) + c.flush()
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _stream_compressor(encoding):
+    # (compress chunk, finish) pair. Every chunk is flushed so the client can
+    # decode it as soon as it arrives.
+    level = FAST_LEVELS[encoding]
+    if encoding == 'gzip':
+        c = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return lambda data: c.compress(data) + c.flush(zlib.Z_SYNC_FLUSH), c.flush
+    if encoding == 'br':
+        c = brotli.Compressor(quality=level)
+        return lambda data: c.process(data) + c.flush(), c.finish
+    c = zstandard.ZstdCompressor(level=level).compressobj()
+    return lambda data: c.compress(data) + c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), c.flush
+
+
+def compress_stream(chunks, encoding, timer=None):
+    compress_chunk, finish = _stream_compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if not chunk:
+                continue
+            if timer:
+                with timer.phase('compress'):
+                    chunk = compress_chunk(chunk)
+            else:
+                chunk = compress_chunk(chunk)
+            if chunk:
+                yield chunk
+        yield finish()
+    finally:
+        # Closing the wrapped generator runs its cleanup, e.g. returning the
+        # database connection to the pool
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+
+
+async def compress_stream_async(chunks, encoding, timer=None):
+    # compress_stream() for the async generators async_app.py streams
+    compress_chunk, finish = _stream_compressor(encoding)
+    try:
+        async for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if not chunk:
+                continue
+            if timer:
+                with timer.phase('compress'):
+                    chunk = compress_chunk(chunk)
+            else:
+                chunk = compress_chunk(chunk)
+            if chunk:
+                yield chunk
+        yield finish()
+    finally:
+        await chunks.aclose()
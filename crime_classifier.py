@@ -0,0 +1,113 @@
+import json
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+RULES_PATH = Path(__file__).with_name('crime_categories.json')
+
+
+class CrimeClassifier:
+    def __init__(self, rules):
+        self.rules = rules
+        self.default = rules['default']
+        self.names = [category['name'] for category in rules['categories']]
+        self.labels = list(dict.fromkeys(self.names + [self.default]))
+        # One alternation of lookaheads, tried left to right, so the first
+        # category with any matching keyword wins, as in categorize_crime.
+        branches = [
+            f"(?=.*?(?:{'|'.join(re.escape(keyword) for keyword in category['keywords'])}))(?P<c{i}>)"
+            for i, category in enumerate(rules['categories'])
+        ]
+        self._pattern = re.compile('|'.join(branches), re.DOTALL)
+
+    @classmethod
+    def from_file(cls, path=RULES_PATH):
+        return cls(json.loads(Path(path).read_text()))
+
+    def classify_value(self, value):
+        match = self._pattern.match(str(value).lower())
+        return self.names[int(match.lastgroup[1:])] if match else self.default
+
+    def classify(self, series):
+        # Classify each distinct value once and broadcast through the
+        # categorical codes; missing values (code -1) take the last slot.
+        values = series.astype('category')
+        index = {label: i for i, label in enumerate(self.labels)}
+        lookup = np.array(
+            [index[self.classify_value(value)] for value in values.cat.categories]
+            + [index[self.classify_value(np.nan)]]
+        )
+        codes = lookup[values.cat.codes.to_numpy()]
+        return pd.Series(pd.Categorical.from_codes(codes, categories=self.labels), index=series.index, name=series.name)
+
+
+# Original per-row classifier from the loader notebook. Kept as the reference
+# CrimeClassifier and crime_categories.json are checked against (classifier_bench.py).
+def categorize_crime(crime_category):
+    crime_category = str(crime_category).lower()
+
+    if any(keyword in crime_category for keyword in [
+        'felony', 'murder', 'manslaughter', 'homicide', 'missing', 'assault',
+        'battery', 'kidnapping', 'abduction', 'child', 'children'
+    ]):
+        return 'Violent Crimes'
+
+    elif any(keyword in crime_category for keyword in [
+        'sex', 'sexual', 'prostitue', 'prostitution', 'rape',
+        'pornography', 'family', 'domestic'
+    ]):
+        return 'Domestic and Sexual Offenses'
+
+    elif any(keyword in crime_category for keyword in [
+        'vandalism', 'trespass', 'trespassing',
+        'retail', 'property', 'larceny'
+    ]):
+        return 'Property Crimes'
+
+    elif any(keyword in crime_category for keyword in [
+        'burglary'
+    ]):
+        return 'Burglary'
+
+    elif any(keyword in crime_category for keyword in [
+       'narcotics', 'drugs', 'heroin',
+       'marjuana', 'drug', 'cannabis', 'liquor'
+    ]):
+        return 'Drug Offenses'
+
+    elif any(keyword in crime_category for keyword in [
+        'fraud', 'card', 'forgery', 'pickpocket', 'checks',
+        'robbery', 'theft', 'purse', 'financial', "counterfeit",
+        'bribery', 'blackmail', 'embezzlement'
+    ]):
+        return 'Theft and Fraud'
+
+    elif any(keyword in crime_category for keyword in [
+        'weapons', 'armed', 'carrying', ' ammunition',
+        'gun', 'weapon', 'firearms', 'possession', 'knife'
+    ]):
+        return 'Weapons Offenses'
+
+    elif any(keyword in crime_category for keyword in [
+         'speed', 'traffic', 'bike', 'driving', 'car', 'vehicle',
+         'automobile', 'drunk', 'bus'
+    ]):
+        return 'Traffic and Vehicular Crimes'
+
+    elif any(keyword in crime_category for keyword in [
+        'obscenity', 'restraining', 'predatory', 'stalking', 'gambling', 'warrant',
+        'public', 'entry', 'harrassment', 'restraint', 'peeping', 'damage', 'intimidation'
+    ]):
+        return 'Public Order Offenses'
+
+    elif any(keyword in crime_category for keyword in [
+        'obstruct', 'arson', 'bomb', 'school', 'riot', 'case',
+        'suspicious', 'violation', 'fire', 'civil', 'cruelty',
+        'law', 'conspiracy', 'illegal', 'state', 'police'
+    ]):
+        return 'Crimes Against Government'
+
+    else:
+        return 'Other'
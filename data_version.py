@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+
+import pymysql
+
+from db_pool import PoolTimeout
+
+DATA_VERSION_TABLE = 'hovetl_data_version'
+
+
+def ensure_data_version_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DATA_VERSION_TABLE} (
+            Id TINYINT PRIMARY KEY,
+            Version BIGINT NOT NULL,
+            Updated_At DATETIME NOT NULL
+        )
+    """)
+
+
+def bump_data_version(cursor):
+    # Called by the loader after every change to hovetl_crimes so readers
+    # know their cached results are stale.
+    ensure_data_version_table(cursor)
+    cursor.execute(f"""
+        INSERT INTO {DATA_VERSION_TABLE} (Id, Version, Updated_At)
+        VALUES (1, 1, UTC_TIMESTAMP())
+        ON DUPLICATE KEY UPDATE Version = Version + 1, Updated_At = UTC_TIMESTAMP()
+    """)
+    return read_data_version(cursor)
+
+
+def read_data_version(cursor):
+    try:
+        cursor.execute(f"SELECT Version, Updated_At FROM {DATA_VERSION_TABLE} WHERE Id = 1")
+    except pymysql.ProgrammingError:
+        # Table not created yet: the data predates versioning
+        return 0, None
+    return _version_row(cursor.fetchone())
+
+
+async def read_data_version_async(cursor):
+    try:
+        await cursor.execute(f"SELECT Version, Updated_At FROM {DATA_VERSION_TABLE} WHERE Id = 1")
+    except pymysql.ProgrammingError:
+        return 0, None
+    return _version_row(await cursor.fetchone())
+
+
+def _version_row(row):
+    if not row:
+        return 0, None
+    if isinstance(row, dict):
+        return row['Version'], row['Updated_At']
+    return row[0], row[1]
+
+
+class DataVersionTracker:
+    def __init__(self, pool, check_interval=5):
+        self.pool = pool
+        self.check_interval = check_interval
+        self.version = None
+        self.updated_at = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self.version
+        with self._lock:
+            if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval:
+                try:
+                    with self.pool.connection() as conn:
+                        self.version, self.updated_at = read_data_version(conn.cursor())
+                except (pymysql.MySQLError, PoolTimeout):
+                    # Keep serving with the last known version while the database
+                    # is unreachable or every connection is busy
+                    pass
+                self._checked_at = time.monotonic()
+        return self.version
+
+
+class AsyncDataVersionTracker:
+    # DataVersionTracker for async_app.py, over an AsyncConnectionPool
+    def __init__(self, pool, check_interval=5):
+        self.pool = pool
+        self.check_interval = check_interval
+        self.version = None
+        self.updated_at = None
+        self._checked_at = None
+        self._lock = asyncio.Lock()
+
+    async def current(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self.version
+        async with self._lock:
+            if self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval:
+                try:
+                    async with self.pool.connection() as conn:
+                        async with conn.cursor() as cur:
+                            self.version, self.updated_at = await read_data_version_async(cur)
+                except (pymysql.MySQLError, PoolTimeout):
+                    pass
+                self._checked_at = time.monotonic()
+        return self.version
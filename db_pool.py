@@ -0,0 +1,278 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import pymysql
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _Entry:
+    __slots__ = ('conn', 'created', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+
+class ConnectionPool:
+    def __init__(self, connect, min_size=1, max_size=10, acquire_timeout=5.0,
+                 recycle=3600, ping_interval=30):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: need 0 <= min_size <= max_size and max_size >= 1")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'acquired': 0, 'created': 0, 'reconnects': 0, 'discarded': 0,
+            'waits': 0, 'timeouts': 0, 'wait_time': 0.0, 'max_wait_time': 0.0,
+        }
+        self._fill()
+
+    def _fill(self):
+        # Warm the pool up to min_size; a database that is down at startup
+        # should not stop the app from booting, connections are retried lazily.
+        while self._size < self.min_size:
+            try:
+                entry = self._open()
+            except pymysql.MySQLError:
+                return
+            with self._cond:
+                self._size += 1
+                self._idle.append(entry)
+
+    def _open(self):
+        entry = _Entry(self._connect())
+        with self._cond:
+            self._stats['created'] += 1
+        return entry
+
+    def _close(self, entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+    def _reconnect(self, entry):
+        self._close(entry)
+        with self._cond:
+            self._stats['reconnects'] += 1
+        return self._open()
+
+    def _check(self, entry):
+        now = time.monotonic()
+        if self.recycle and now - entry.created > self.recycle:
+            return self._reconnect(entry)
+        if now - entry.last_used > self.ping_interval:
+            try:
+                entry.conn.ping(reconnect=False)
+            except Exception:
+                return self._reconnect(entry)
+        return entry
+
+    def acquire(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    # LIFO so the most recently used (warm) connection is reused first
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"Timed out after {timeout:.1f}s waiting for a database connection")
+                waited = True
+                self._cond.wait(remaining)
+            wait = time.monotonic() - start
+            if waited:
+                self._stats['waits'] += 1
+            self._stats['wait_time'] += wait
+            self._stats['max_wait_time'] = max(self._stats['max_wait_time'], wait)
+        try:
+            entry = self._open() if entry is None else self._check(entry)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._in_use[id(entry.conn)] = entry
+            self._stats['acquired'] += 1
+        return entry.conn
+
+    def release(self, conn, discard=False):
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+            if entry is None:
+                return
+            drop = discard or not conn.open
+            if drop:
+                self._size -= 1
+                self._stats['discarded'] += 1
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            self._cond.notify()
+        if drop:
+            self._close(entry)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except (pymysql.OperationalError, pymysql.InterfaceError):
+            self.release(conn, discard=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self):
+        with self._cond:
+            acquired = self._stats['acquired']
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'acquired': acquired,
+                'created': self._stats['created'],
+                'reconnects': self._stats['reconnects'],
+                'discarded': self._stats['discarded'],
+                'waits': self._stats['waits'],
+                'timeouts': self._stats['timeouts'],
+                'total_wait_ms': self._stats['wait_time'] * 1000,
+                'avg_wait_ms': self._stats['wait_time'] * 1000 / acquired if acquired else 0.0,
+                'max_wait_ms': self._stats['max_wait_time'] * 1000,
+            }
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+        for entry in idle:
+            self._close(entry)
+
+
+class AsyncConnectionPool:
+    # aiomysql's pool with the same acquire timeout, PoolTimeout and stats
+    # shape as ConnectionPool, for async_app.py
+    def __init__(self, min_size=2, max_size=10, acquire_timeout=5, recycle=3600, **connect_kwargs):
+        if aiomysql is None:
+            raise RuntimeError("The async serving mode needs aiomysql installed")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.recycle = recycle
+        self.connect_kwargs = connect_kwargs
+        self._pool = None
+        self._slots = None
+        self._stats = {'acquired': 0, 'timeouts': 0, 'discarded': 0, 'wait_time': 0.0, 'max_wait_time': 0.0}
+
+    async def open(self):
+        # Waiters queue on this semaphore rather than inside aiomysql, which
+        # does not wake them when a closed connection is released. With at
+        # most max_size connections out, aiomysql always has a free one or
+        # room to open one.
+        self._slots = asyncio.Semaphore(self.max_size)
+        kwargs = dict(minsize=self.min_size, maxsize=self.max_size, pool_recycle=self.recycle,
+                      autocommit=True, **self.connect_kwargs)
+        try:
+            self._pool = await aiomysql.create_pool(**kwargs)
+        except (pymysql.MySQLError, OSError):
+            # MySQL not reachable yet: start empty, connections are opened on
+            # first acquire
+            self._pool = aiomysql.Pool(echo=False, loop=asyncio.get_running_loop(), **kwargs)
+
+    async def acquire(self, timeout=None):
+        start = time.monotonic()
+        try:
+            conn = await asyncio.wait_for(self._acquire(), self.acquire_timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            self._stats['timeouts'] += 1
+            raise PoolTimeout(f"No database connection available within {self.acquire_timeout}s")
+        waited = time.monotonic() - start
+        self._stats['acquired'] += 1
+        self._stats['wait_time'] += waited
+        self._stats['max_wait_time'] = max(self._stats['max_wait_time'], waited)
+        return conn
+
+    async def _acquire(self):
+        await self._slots.acquire()
+        try:
+            return await self._pool.acquire()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        # A connection with unread rows or a broken socket is closed instead
+        # of going back to the pool
+        if discard:
+            self._stats['discarded'] += 1
+            conn.close()
+        self._pool.release(conn)
+        self._slots.release()
+
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        conn = await self.acquire(timeout)
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, discard=True)
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self):
+        acquired = self._stats['acquired']
+        size = self._pool.size if self._pool else 0
+        idle = self._pool.freesize if self._pool else 0
+        return {
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'size': size,
+            'in_use': size - idle,
+            'idle': idle,
+            'acquired': acquired,
+            'discarded': self._stats['discarded'],
+            'timeouts': self._stats['timeouts'],
+            'total_wait_ms': self._stats['wait_time'] * 1000,
+            'avg_wait_ms': self._stats['wait_time'] * 1000 / acquired if acquired else 0.0,
+            'max_wait_ms': self._stats['max_wait_time'] * 1000,
+        }
+
+    async def close(self):
+        if self._pool:
+            self._pool.close()
+            await self._pool.wait_closed()
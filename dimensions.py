@@ -0,0 +1,44 @@
+import threading
+
+
+class DimensionDictionary:
+    # Distinct values of the low-cardinality columns, shared by every route
+    # for validation and value lists. Replaced wholesale on refresh so
+    # readers always see one consistent snapshot.
+    def __init__(self):
+        self.version = object()
+        self._data = {'cities': [], 'categories': [], 'sub_categories': [], 'sub_categories_by_city': {}}
+        self._lock = threading.Lock()
+
+    def refresh(self, rows, version):
+        cities, categories, sub_categories, by_city = set(), set(), set(), {}
+        for row in rows:
+            city, category, sub_category = row['City'], row['Crime_Category'], row['Sub_Category']
+            cities.add(city)
+            categories.add(category)
+            sub_categories.add(sub_category)
+            by_city.setdefault(city, set()).add(sub_category)
+        data = {
+            'cities': sorted(cities),
+            'categories': sorted(categories),
+            'sub_categories': sorted(sub_categories),
+            'sub_categories_by_city': {city: sorted(values) for city, values in sorted(by_city.items())},
+        }
+        with self._lock:
+            self._data = data
+            self.version = version
+
+    @property
+    def cities(self):
+        return self._data['cities']
+
+    @property
+    def categories(self):
+        return self._data['categories']
+
+    @property
+    def sub_categories(self):
+        return self._data['sub_categories']
+
+    def as_dict(self):
+        return dict(self._data)
@@ -0,0 +1,71 @@
+# Runs EXPLAIN on every query app.py issues against a migrated local MySQL
+# and exits non-zero if any of them falls back to a full scan of hovetl_crimes.
+#
+#   python migrations.py && python explain_check.py
+import sys
+
+import pymysql
+
+from api_common import LOCATION_QUERY, GEOCODE_POINTS_QUERY, LOCATION_PAGE_QUERY, GEOCODE_POINTS_PAGE_QUERY
+from app import pool
+from rollups import QueryPlanner, FACT_TABLE
+
+# Keep in step with the routes in app.py
+ROUTE_PLANS = {
+    'crime_category_per_city': dict(group_by=['City', 'Crime_Category']),
+    'crime_over_years': dict(group_by=['DateYear']),
+    'crime_per_month': dict(group_by=['DateMonth'], filters=[('City', '=', 'Chicago')]),
+    'crime_by_date_range': dict(
+        group_by=['CrimeDate'],
+        filters=[('CrimeDate', 'between', ('2020-01-01', '2020-01-31'))],
+        order_by=['CrimeDate']
+    ),
+    'crime_comparison_per_year': dict(group_by=['City', 'DateYear', 'Crime_Category']),
+    'crime_statistics_by_category': dict(group_by=['Crime_Category']),
+    'crime_rate_per_city': dict(group_by=['City', 'Crime_Category']),
+    'crime_by_day_of_week': dict(group_by=['Day_Of_Week'], order_by=['Day_Of_Week']),
+    'dimensions': dict(group_by=['City', 'Crime_Category', 'Sub_Category']),
+    'crime_details_by_city_category': dict(
+        group_by=['Sub_Category'],
+        filters=[('City', '=', 'Seattle'), ('Crime_Category', 'like', 'theft')],
+        order_by=['Crime_Count DESC']
+    ),
+}
+
+RAW_QUERIES = {
+    'crime_location_density_by_city': (LOCATION_QUERY, ('Chicago',)),
+    'geocode (points)': (GEOCODE_POINTS_QUERY, ('Chicago', '%assault%')),
+    'crime_location_density (page)': (LOCATION_PAGE_QUERY, ('Chicago', 0, 10001)),
+    'geocode (page)': (GEOCODE_POINTS_PAGE_QUERY, ('Chicago', '%assault%', 0, 2)),
+}
+
+
+def fact_table_queries():
+    # Plan against the fact table only: rollups are small by construction and
+    # the fact-table plan is what runs whenever a rollup is missing.
+    planner = QueryPlanner()
+    for name, spec in ROUTE_PLANS.items():
+        yield name, planner.plan(spec['group_by'], spec.get('filters'), spec.get('order_by'))
+    yield from RAW_QUERIES.items()
+
+
+def main():
+    failures = 0
+    with pool.connection() as conn:
+        cur = conn.cursor(pymysql.cursors.DictCursor)
+        for name, (query, args) in fact_table_queries():
+            cur.execute("EXPLAIN " + query, args)
+            for row in cur.fetchall():
+                if row['table'] != FACT_TABLE:
+                    continue
+                status = 'FULL SCAN' if row['type'] == 'ALL' else 'ok'
+                failures += row['type'] == 'ALL'
+                print(f"{status:9} {name:32} type={row['type']:6} key={row['key']} rows={row['rows']} {row['Extra'] or ''}")
+    if failures:
+        print(f"{failures} quer{'y' if failures == 1 else 'ies'} regressed to a full table scan")
+        sys.exit(1)
+    print("All queries use an index")
+
+
+if __name__ == "__main__":
+    main()
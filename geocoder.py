@@ -0,0 +1,297 @@
+import asyncio
+import csv
+import inspect
+import json
+import math
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import requests
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+ADDRESS_FIELDS = ('road', 'suburb', 'city', 'county', 'state', 'postcode', 'country', 'country_code')
+
+
+class GeocoderError(Exception):
+    # Upstream failure (network, rate limit, bad response); not cached
+    pass
+
+
+class RateLimited(GeocoderError):
+    # No rate-limit token within the time the caller was willing to wait
+    pass
+
+
+class TokenBucket:
+    # `rate` calls per second with bursts of up to `burst`. reserve() hands
+    # out tokens ahead of time, so concurrent callers queue up in order
+    # instead of all retrying when a token frees up.
+    def __init__(self, rate, burst=1):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {'granted': 0, 'refused': 0, 'wait_time': 0.0}
+
+    def reserve(self, timeout=None):
+        # Seconds to wait before making the call, or None (and no token
+        # taken) when that would be longer than `timeout`
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                self._stats['refused'] += 1
+                return None
+            self._tokens -= 1
+            self._stats['granted'] += 1
+            self._stats['wait_time'] += wait
+            return wait
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, rate=self.rate, burst=self.burst)
+
+
+class NominatimGeocoder:
+    def __init__(self, base_url='https://nominatim.openstreetmap.org', user_agent='Geocoding API client', timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+
+    def reverse(self, latitude, longitude):
+        try:
+            response = self.session.get(
+                f'{self.base_url}/reverse',
+                params={'lat': latitude, 'lon': longitude, 'format': 'json', 'addressdetails': 1},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise GeocoderError(f"Geocoder unreachable: {e}")
+        if response.status_code != 200:
+            raise GeocoderError(f"Geocoder returned HTTP {response.status_code}")
+        data = response.json()
+        # Nominatim answers 200 with an "error" key when nothing is near the point
+        return data.get('address')
+
+
+class AsyncNominatimGeocoder:
+    # NominatimGeocoder over httpx, so a slow upstream does not hold a thread
+    def __init__(self, base_url='https://nominatim.openstreetmap.org', user_agent='Geocoding API client', timeout=10):
+        if httpx is None:
+            raise RuntimeError("The async serving mode needs httpx installed")
+        self.base_url = base_url.rstrip('/')
+        self.client = httpx.AsyncClient(headers={'User-Agent': user_agent}, timeout=timeout)
+
+    async def reverse(self, latitude, longitude):
+        try:
+            response = await self.client.get(
+                f'{self.base_url}/reverse',
+                params={'lat': latitude, 'lon': longitude, 'format': 'json', 'addressdetails': 1}
+            )
+        except httpx.HTTPError as e:
+            raise GeocoderError(f"Geocoder unreachable: {e}")
+        if response.status_code != 200:
+            raise GeocoderError(f"Geocoder returned HTTP {response.status_code}")
+        return response.json().get('address')
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class GazetteerGeocoder:
+    # Offline backend: nearest entry of a local CSV gazetteer with a
+    # latitude,longitude column pair plus any of ADDRESS_FIELDS.
+    def __init__(self, path, max_distance_km=5.0):
+        self.max_distance_km = max_distance_km
+        lats, lons, self.addresses = [], [], []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                lats.append(float(row['latitude']))
+                lons.append(float(row['longitude']))
+                self.addresses.append({k: row[k] for k in ADDRESS_FIELDS if row.get(k)})
+        if not self.addresses:
+            raise ValueError(f"Gazetteer {path} has no entries")
+        self.lat = np.array(lats)
+        self.lon = np.array(lons)
+
+    def reverse(self, latitude, longitude):
+        # Equirectangular distance is plenty at city scale
+        cos_lat = math.cos(math.radians(latitude))
+        km = 111.2 * np.hypot(self.lat - latitude, (self.lon - longitude) * cos_lat)
+        nearest = int(np.argmin(km))
+        return dict(self.addresses[nearest]) if km[nearest] <= self.max_distance_km else None
+
+
+class CachedGeocoder:
+    # Persistent cache in front of any backend, keyed by lat/lon rounded to
+    # `precision` decimals (4 is about 11 m). Misses ("no address") are cached
+    # too, for a shorter time; upstream errors are not.
+    def __init__(self, backend, path, precision=4, ttl=30 * 86400, negative_ttl=86400, max_entries=100000,
+                 limiter=None, max_wait=10, access_interval=3600):
+        self.backend = backend
+        # Optional TokenBucket in front of the backend; cache hits never wait
+        self.limiter = limiter
+        self.max_wait = max_wait
+        self.precision = precision
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # last_access only orders evictions, so a hit rewrites it (a commit,
+        # i.e. an fsync) at most once per access_interval seconds
+        self.access_interval = access_interval
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                lat_key REAL NOT NULL,
+                lon_key REAL NOT NULL,
+                address TEXT,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (lat_key, lon_key)
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_geocode_cache_access ON geocode_cache (last_access)")
+        self._db.commit()
+        self._stats = {'hits': 0, 'misses': 0, 'negative_hits': 0, 'evictions': 0, 'errors': 0, 'rate_limited': 0}
+
+    def _key(self, latitude, longitude):
+        return round(float(latitude), self.precision), round(float(longitude), self.precision)
+
+    def _lookup(self, latitude, longitude):
+        # (True, address) on a cache hit, otherwise (False, cache key)
+        key = self._key(latitude, longitude)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT address, expires_at, last_access FROM geocode_cache WHERE lat_key = ? AND lon_key = ?", key
+            ).fetchone()
+            if row and row[1] > now:
+                if now - row[2] >= self.access_interval:
+                    self._db.execute(
+                        "UPDATE geocode_cache SET last_access = ? WHERE lat_key = ? AND lon_key = ?", (now,) + key
+                    )
+                    self._db.commit()
+                self._stats['hits'] += 1
+                if row[0] is None:
+                    self._stats['negative_hits'] += 1
+                    return True, None
+                return True, json.loads(row[0])
+            self._stats['misses'] += 1
+        return False, key
+
+    def _reserve(self, timeout):
+        # Seconds to wait for the backend's rate limit; raises RateLimited
+        # when that is longer than `timeout` (default max_wait)
+        if self.limiter is None:
+            return 0.0
+        wait = self.limiter.reserve(self.max_wait if timeout is None else timeout)
+        if wait is None:
+            with self._lock:
+                self._stats['rate_limited'] += 1
+            raise RateLimited("Geocoder rate limit reached, try again later")
+        return wait
+
+    def reverse(self, latitude, longitude, timeout=None):
+        hit, value = self._lookup(latitude, longitude)
+        if hit:
+            return value
+        time.sleep(self._reserve(timeout))
+        try:
+            address = self.backend.reverse(*value)
+        except GeocoderError:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        self._store(value, address)
+        return address
+
+    async def reverse_async(self, latitude, longitude, timeout=None):
+        # For async_app.py: the backend call is awaited when the backend is
+        # async; the SQLite reads and writes run in a worker thread
+        hit, value = await asyncio.to_thread(self._lookup, latitude, longitude)
+        if hit:
+            return value
+        await asyncio.sleep(self._reserve(timeout))
+        try:
+            address = self.backend.reverse(*value)
+            if inspect.isawaitable(address):
+                address = await address
+        except GeocoderError:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        await asyncio.to_thread(self._store, value, address)
+        return address
+
+    def _store(self, key, address):
+        now = time.time()
+        expires_at = now + (self.ttl if address is not None else self.negative_ttl)
+        with self._lock:
+            self._db.execute(
+                "REPLACE INTO geocode_cache (lat_key, lon_key, address, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                key + (json.dumps(address) if address is not None else None, expires_at, now)
+            )
+            count = self._db.execute("SELECT COUNT(*) FROM geocode_cache").fetchone()[0]
+            if count > self.max_entries:
+                # Drop expired entries first, then the least recently used
+                evicted = self._db.execute("DELETE FROM geocode_cache WHERE expires_at <= ?", (now,)).rowcount
+                excess = count - evicted - self.max_entries
+                if excess > 0:
+                    self._db.execute(
+                        "DELETE FROM geocode_cache WHERE rowid IN "
+                        "(SELECT rowid FROM geocode_cache ORDER BY last_access LIMIT ?)", (excess,)
+                    )
+                    evicted += excess
+                self._stats['evictions'] += evicted
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM geocode_cache").fetchone()[0]
+            lookups = self._stats['hits'] + self._stats['misses']
+            stats = dict(self._stats, entries=entries, hit_ratio=self._stats['hits'] / lookups if lookups else 0.0)
+        if self.limiter:
+            stats['rate_limit'] = self.limiter.stats()
+        return stats
+
+
+def make_geocoder(config, asynchronous=False):
+    config = config or {}
+    backend_name = config.get('backend', 'nominatim')
+    if backend_name == 'nominatim':
+        backend = (AsyncNominatimGeocoder if asynchronous else NominatimGeocoder)(
+            base_url=config.get('nominatim_url', 'https://nominatim.openstreetmap.org'),
+            timeout=config.get('timeout', 10)
+        )
+    elif backend_name == 'offline':
+        backend = GazetteerGeocoder(config.get('gazetteer', 'gazetteer.csv'), config.get('max_distance_km', 5.0))
+    else:
+        raise ValueError(f"Unknown geocoder backend '{backend_name}'")
+    # Nominatim's usage policy allows one request per second; the offline
+    # backend needs no limit. Set rate_limit to 0 to turn it off.
+    rate_limit = config.get('rate_limit', 1 if backend_name == 'nominatim' else 0)
+    limiter = TokenBucket(rate_limit, config.get('rate_burst', 1)) if rate_limit else None
+    return CachedGeocoder(
+        backend,
+        config.get('cache_path', 'geocode_cache.sqlite3'),
+        precision=config.get('cache_precision', 4),
+        ttl=config.get('cache_ttl_days', 30) * 86400,
+        negative_ttl=config.get('negative_ttl_hours', 24) * 3600,
+        max_entries=config.get('cache_max_entries', 100000),
+        limiter=limiter,
+        max_wait=config.get('rate_limit_wait', 10),
+        access_interval=config.get('cache_access_interval', 3600),
+    )
@@ -0,0 +1,88 @@
+# Checks batch_geocode.hotspots() against the original greedy clustering of
+# every ranked cell and times both on a city-sized spread of points. Exits
+# non-zero on any mismatch or if hotspots() takes longer than --max-seconds.
+#
+#   python hotspot_bench.py --points 300000 --top 10 --bin-size 0.005 --radius 250
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from batch_geocode import dedupe, hotspots
+from spatial import bin_points
+
+
+def reference_hotspots(lat, lon, top, bin_size, radius_m):
+    # hotspots() as first written: dedupe() over every ranked cell
+    bins = bin_points(lat, lon, bin_size=bin_size, outlier_iqr=0)['bins']
+    ranked = sorted(zip(bins['count'], bins['lat_bin'], bins['lon_bin']), key=lambda cell: -cell[0])
+    centres = [(round(lat_bin + bin_size / 2, 6), round(lon_bin + bin_size / 2, 6)) for _, lat_bin, lon_bin in ranked]
+    spots = {}
+    for (count, _, _), i in zip(ranked, dedupe(centres, radius_m)):
+        if i in spots:
+            spots[i]['count'] += count
+        elif len(spots) < top:
+            spots[i] = {'latitude': centres[i][0], 'longitude': centres[i][1], 'count': count}
+    return list(spots.values())
+
+
+def city_points(rng, n):
+    # A Chicago-sized extent with a few dense clusters over a uniform background
+    centres = rng.uniform([41.65, -87.85], [42.02, -87.52], size=(12, 2))
+    clustered = centres[rng.integers(len(centres), size=n // 2)] + rng.normal(0, 0.01, size=(n // 2, 2))
+    background = rng.uniform([41.65, -87.85], [42.02, -87.52], size=(n - n // 2, 2))
+    points = np.vstack([clustered, background])
+    return points[:, 0], points[:, 1]
+
+
+def same(expected, actual):
+    return len(expected) == len(actual) and all(
+        want['count'] == got['count']
+        and abs(want['latitude'] - got['latitude']) < 1e-9 and abs(want['longitude'] - got['longitude']) < 1e-9
+        for want, got in zip(expected, actual)
+    )
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time batch_geocode.hotspots().")
+    parser.add_argument('--points', type=int, default=300000)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--bin-size', type=float, default=0.005)
+    parser.add_argument('--radius', type=float, default=250)
+    parser.add_argument('--max-seconds', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    failures = 0
+    # Small cases, including radii that merge nearly everything or nothing
+    for top, bin_size, radius in [(1, 0.01, 0), (5, 0.01, 500), (10, 0.002, 250), (50, 0.005, 5000), (3, 0.05, 20000)]:
+        lat, lon = city_points(rng, 5000)
+        if not same(reference_hotspots(lat, lon, top, bin_size, radius), hotspots(lat, lon, top, bin_size, radius)):
+            print(f"MISMATCH top={top} bin_size={bin_size} radius={radius}")
+            failures += 1
+
+    lat, lon = city_points(rng, args.points)
+    expected, reference_time = timed(lambda: reference_hotspots(lat, lon, args.top, args.bin_size, args.radius))
+    actual, hotspots_time = timed(lambda: hotspots(lat, lon, args.top, args.bin_size, args.radius))
+    if not same(expected, actual):
+        print("MISMATCH on the timed run")
+        failures += 1
+    print(f"{args.points} points, top {args.top}, bin_size {args.bin_size}, radius {args.radius} m")
+    print(f"dedupe every cell  {reference_time:8.3f}s")
+    print(f"hotspots           {hotspots_time:8.3f}s  ({reference_time / hotspots_time:.0f}x)")
+    if hotspots_time > args.max_seconds:
+        print(f"SLOW: hotspots took longer than {args.max_seconds}s")
+        failures += 1
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
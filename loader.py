@@ -0,0 +1,346 @@
+import argparse
+import datetime
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import pymysql
+import yaml
+
+from crime_classifier import CrimeClassifier
+from data_version import bump_data_version
+from migrations import migrate
+from rollups import MIN_STRATUM_ROWS, SAMPLE_FRACTION, build_rollups, build_sample, refresh_rollup_slices, refresh_sample_slices
+
+COLUMNS = ["Latitude", "Longitude", "Crime_Description", "Sub_Category", "City", "CrimeDate", "DateYear", "DateMonth", "Crime_Category", "Source_ID"]
+MIN_DATE = '2019-01-01'
+WATERMARK_TABLE = 'hovetl_load_watermarks'
+STAGE_TABLE = 'hovetl_crimes_stage'
+
+# Per-city source layout: CSV file, source column for each target column
+# (Source_ID is the city's own record id), and the column holding the date.
+# Datetime columns are cut to the date part.
+CITIES = {
+    'Chicago': {
+        'file': 'ChicagoCrimes.csv',
+        'columns': {'Latitude': 'Latitude', 'Longitude': 'Longitude',
+                    'Crime_Description': 'Description', 'Sub_Category': 'PrimaryType', 'Source_ID': 'ID'},
+        'date': 'Date',
+    },
+    'San Francisco': {
+        'file': 'SanFranciscoCrimes.csv',
+        'columns': {'Latitude': 'Latitude', 'Longitude': 'Longitude',
+                    'Crime_Description': 'Incident Description', 'Sub_Category': 'Incident Category',
+                    'DateYear': 'Incident Year', 'Source_ID': 'Row ID'},
+        'date': 'Incident Date',
+    },
+    'Seattle': {
+        'file': 'SeattleCrimes.csv',
+        'columns': {'Latitude': 'Latitude', 'Longitude': 'Longitude',
+                    'Crime_Description': 'Offense', 'Sub_Category': 'Offense Parent Group', 'Source_ID': 'Offense ID'},
+        'date': 'Report DateTime',
+    },
+}
+
+classifier = CrimeClassifier.from_file()
+
+
+def connect(db_config, **kwargs):
+    return pymysql.connect(
+        host=db_config['host'], port=int(db_config.get('port', 3306)),
+        user=db_config['user'], password=db_config['passwd'], db=db_config['db'],
+        autocommit=True, **kwargs
+    )
+
+
+def read_city(city, data_dir, chunksize):
+    spec = CITIES[city]
+    usecols = list(spec['columns'].values()) + [spec['date']]
+    for chunk in pd.read_csv(Path(data_dir) / spec['file'], usecols=usecols, chunksize=chunksize):
+        yield map_chunk(city, chunk)
+
+
+def map_chunk(city, chunk):
+    spec = CITIES[city]
+    crime_date = pd.to_datetime(chunk[spec['date']].astype(str).str.split().str[0], errors='coerce')
+    mapped = pd.DataFrame({target: chunk[source] for target, source in spec['columns'].items()})
+    mapped['City'] = city
+    mapped['CrimeDate'] = crime_date
+    if 'DateYear' not in mapped:
+        mapped['DateYear'] = crime_date.dt.year
+    mapped['DateMonth'] = crime_date.dt.month
+    mapped = mapped.dropna()
+    mapped = mapped[mapped['CrimeDate'] >= MIN_DATE].copy()
+    mapped['DateYear'] = mapped['DateYear'].astype(int)
+    mapped['DateMonth'] = mapped['DateMonth'].astype(int)
+    mapped['Source_ID'] = mapped['Source_ID'].astype('int64')
+    mapped['Crime_Category'] = classifier.classify(mapped['Sub_Category'])
+    mapped['CrimeDate'] = mapped['CrimeDate'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return mapped[COLUMNS]
+
+
+def load_data_infile(cursor, chunk, table_name):
+    # One temporary CSV per chunk; the server parses it far faster than it
+    # parses INSERT statements.
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, newline='') as f:
+        chunk.to_csv(f, index=False, header=False, lineterminator='\n')
+    try:
+        cursor.execute(f"""
+            LOAD DATA LOCAL INFILE %s INTO TABLE {table_name}
+            FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+            LINES TERMINATED BY '\\n'
+            ({', '.join(COLUMNS)})
+        """, (f.name,))
+    finally:
+        os.unlink(f.name)
+
+
+def insert_rows(cursor, chunk, table_name):
+    # pymysql folds executemany() of a plain INSERT ... VALUES into multi-row
+    # statements of up to Cursor.max_stmt_length bytes each.
+    cursor.executemany(
+        f"INSERT INTO {table_name} ({', '.join(COLUMNS)}) VALUES ({', '.join(['%s'] * len(COLUMNS))})",
+        list(chunk.itertuples(index=False, name=None))
+    )
+
+
+def load_city(city, db_config, data_dir, chunksize, method, table_name="hovetl_crimes"):
+    start = time.monotonic()
+    rows = 0
+    conn = connect(db_config, local_infile=method == 'infile')
+    try:
+        cursor = conn.cursor()
+        for chunk in read_city(city, data_dir, chunksize):
+            if chunk.empty:
+                continue
+            if method == 'infile':
+                load_data_infile(cursor, chunk, table_name)
+            else:
+                insert_rows(cursor, chunk, table_name)
+            rows += len(chunk)
+    finally:
+        conn.close()
+    return city, rows, time.monotonic() - start
+
+
+def create_crimes_table(cursor, cities):
+    # Schema, generated columns and indexes are owned by migrations.py;
+    # a full reload only needs the data cleared.
+    migrate(cursor)
+    if set(cities) == set(CITIES):
+        cursor.execute("TRUNCATE TABLE hovetl_crimes")
+    else:
+        cursor.execute(f"DELETE FROM hovetl_crimes WHERE City IN ({', '.join(['%s'] * len(cities))})", tuple(cities))
+    print("Crimes table ready.")
+
+
+def read_watermark(cursor, city):
+    cursor.execute(f"SELECT Max_CrimeDate, Max_Source_ID FROM {WATERMARK_TABLE} WHERE City = %s", (city,))
+    row = cursor.fetchone()
+    return row if row else (None, None)
+
+
+def write_watermark(cursor, city, max_date, max_source_id, rows_read, rows_changed):
+    cursor.execute(f"""
+        REPLACE INTO {WATERMARK_TABLE} (City, Max_CrimeDate, Max_Source_ID, Rows_Read, Rows_Changed, Loaded_At)
+        VALUES (%s, %s, %s, %s, %s, UTC_TIMESTAMP())
+    """, (city, max_date, max_source_id, rows_read, rows_changed))
+
+
+def cities_needing_full_load(cursor, cities):
+    # The upsert matches rows on (City, Source_ID). Rows loaded before
+    # Source_ID existed have it NULL and never match, so an incremental run
+    # over them would insert every row a second time.
+    missing = []
+    for city in cities:
+        _, max_source_id = read_watermark(cursor, city)
+        cursor.execute("SELECT 1 FROM hovetl_crimes WHERE City = %s AND Source_ID IS NULL LIMIT 1", (city,))
+        if max_source_id is None or cursor.fetchone():
+            missing.append(city)
+    return missing
+
+
+def write_full_load_watermarks(cursor, cities, counts):
+    cursor.execute(f"""
+        SELECT City, MAX(CrimeDate), MAX(Source_ID) FROM hovetl_crimes
+        WHERE City IN ({', '.join(['%s'] * len(cities))}) GROUP BY City
+    """, tuple(cities))
+    for city, max_date, max_source_id in cursor.fetchall():
+        write_watermark(cursor, city, max_date, max_source_id, counts.get(city, 0), counts.get(city, 0))
+
+
+def apply_stage(cursor):
+    # Drop staged rows identical to what is already loaded, note every
+    # City/DateYear slice the remaining rows touch (before and after the
+    # update), then upsert them on (City, Source_ID).
+    data_columns = [column for column in COLUMNS if column not in ('City', 'Source_ID')]
+    cursor.execute(f"""
+        DELETE s FROM {STAGE_TABLE} s
+        JOIN hovetl_crimes c ON c.City = s.City AND c.Source_ID = s.Source_ID
+        WHERE {' AND '.join(f"c.{column} <=> s.{column}" for column in data_columns)}
+    """)
+    cursor.execute(f"SELECT City, DateYear FROM {STAGE_TABLE} GROUP BY City, DateYear")
+    slices = set(cursor.fetchall())
+    cursor.execute(f"""
+        SELECT c.City, c.DateYear FROM hovetl_crimes c
+        JOIN {STAGE_TABLE} s ON c.City = s.City AND c.Source_ID = s.Source_ID
+        GROUP BY c.City, c.DateYear
+    """)
+    slices.update(cursor.fetchall())
+    cursor.execute(f"SELECT COUNT(*) FROM {STAGE_TABLE}")
+    changed = cursor.fetchone()[0]
+    cursor.execute(f"""
+        INSERT INTO hovetl_crimes ({', '.join(COLUMNS)})
+        SELECT {', '.join(COLUMNS)} FROM {STAGE_TABLE}
+        ON DUPLICATE KEY UPDATE {', '.join(f"{column} = VALUES({column})" for column in data_columns)}
+    """)
+    return changed, slices
+
+
+def load_city_incremental(city, db_config, data_dir, chunksize, method, lookback_days):
+    # Only rows past the city's watermark are staged: a source id above the
+    # highest one loaded, or a date inside the lookback window (records that
+    # are still being edited at the source).
+    start = time.monotonic()
+    rows = 0
+    conn = connect(db_config, local_infile=method == 'infile')
+    try:
+        cursor = conn.cursor()
+        max_date, max_source_id = read_watermark(cursor, city)
+        cutoff = (max_date - datetime.timedelta(days=lookback_days)).strftime('%Y-%m-%d %H:%M:%S') if max_date else None
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE {STAGE_TABLE} (
+                Latitude FLOAT,
+                Longitude FLOAT,
+                Crime_Description VARCHAR(100),
+                Sub_Category VARCHAR(100),
+                City VARCHAR(100),
+                CrimeDate DATETIME,
+                DateYear INT,
+                DateMonth INT,
+                Crime_Category VARCHAR(100),
+                Source_ID BIGINT
+            ) ENGINE=MyISAM DEFAULT CHARSET=latin1
+        """)
+        for chunk in read_city(city, data_dir, chunksize):
+            if cutoff is not None:
+                chunk = chunk[(chunk['CrimeDate'] >= cutoff) | (chunk['Source_ID'] > (max_source_id or 0))]
+            if chunk.empty:
+                continue
+            if method == 'infile':
+                load_data_infile(cursor, chunk, STAGE_TABLE)
+            else:
+                insert_rows(cursor, chunk, STAGE_TABLE)
+            rows += len(chunk)
+            chunk_max_date = datetime.datetime.strptime(chunk['CrimeDate'].max(), '%Y-%m-%d %H:%M:%S')
+            max_date = max(max_date, chunk_max_date) if max_date else chunk_max_date
+            max_source_id = max(max_source_id or 0, int(chunk['Source_ID'].max()))
+        changed, slices = apply_stage(cursor)
+        write_watermark(cursor, city, max_date, max_source_id, rows, changed)
+    finally:
+        conn.close()
+    return city, rows, changed, slices, time.monotonic() - start
+
+
+def full_load(cur, args, db_config):
+    create_crimes_table(cur, args.cities)
+
+    start = time.monotonic()
+    total = 0
+    counts = {}
+    # Secondary indexes are rebuilt once at the end instead of per row
+    cur.execute("ALTER TABLE hovetl_crimes DISABLE KEYS")
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = [
+                executor.submit(load_city, city, db_config, args.data_dir, args.chunksize, args.method)
+                for city in args.cities
+            ]
+            for future in futures:
+                city, rows, elapsed = future.result()
+                total += rows
+                counts[city] = rows
+                print(f"{city}: {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/sec)")
+    finally:
+        cur.execute("ALTER TABLE hovetl_crimes ENABLE KEYS")
+    elapsed = time.monotonic() - start
+    print(f"Loaded {total} rows in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} rows/sec).")
+    write_full_load_watermarks(cur, args.cities, counts)
+
+    # Precompute the aggregates the API serves, then tell it its cached results are stale
+    build_rollups(cur)
+    build_sample(cur, args.sample_fraction, args.sample_min_rows)
+    bump_data_version(cur)
+
+
+def incremental_load(cur, args, db_config):
+    migrate(cur)
+    missing = cities_needing_full_load(cur, args.cities)
+    if missing:
+        raise SystemExit(f"No Source_ID watermark for {', '.join(missing)}; run a full load first "
+                         f"(python loader.py --cities {' '.join(repr(city) for city in missing)}).")
+
+    start = time.monotonic()
+    total = 0
+    slices = {}
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(load_city_incremental, city, db_config, args.data_dir, args.chunksize,
+                            args.method, args.lookback_days)
+            for city in args.cities
+        ]
+        for future in futures:
+            city, rows, changed, city_slices, elapsed = future.result()
+            total += changed
+            for slice_city, year in city_slices:
+                slices.setdefault(slice_city, set()).add(year)
+            print(f"{city}: {rows} rows staged, {changed} inserted or updated in {elapsed:.1f}s "
+                  f"({rows / elapsed if elapsed else 0:.0f} rows/sec)")
+    elapsed = time.monotonic() - start
+    print(f"Applied {total} changes in {elapsed:.1f}s.")
+
+    if not slices:
+        print("No changes; rollups, sample and data version left as they are.")
+        return
+    # Only the city/year slices that changed are recounted
+    refresh_rollup_slices(cur, slices)
+    refresh_sample_slices(cur, slices, args.sample_fraction, args.sample_min_rows)
+    bump_data_version(cur)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the city crime CSVs into hovetl_crimes.")
+    parser.add_argument('--config', default='config.yml')
+    parser.add_argument('--data-dir', default='.')
+    parser.add_argument('--cities', nargs='+', choices=list(CITIES), default=list(CITIES))
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=len(CITIES))
+    parser.add_argument('--method', choices=['infile', 'insert'], default='infile',
+                        help="LOAD DATA LOCAL INFILE (needs local_infile=ON on the server) or batched INSERTs")
+    parser.add_argument('--incremental', action='store_true',
+                        help="upsert only rows past each city's watermark instead of reloading everything")
+    parser.add_argument('--lookback-days', type=int, default=30,
+                        help="with --incremental, also re-check rows dated this many days before the watermark")
+    parser.add_argument('--sample-fraction', type=float, default=SAMPLE_FRACTION,
+                        help="share of each City/DateYear stratum kept in the sample table for approx=true")
+    parser.add_argument('--sample-min-rows', type=int, default=MIN_STRATUM_ROWS,
+                        help="smaller strata are sampled at a higher rate so each keeps about this many rows")
+    args = parser.parse_args()
+
+    db_config = yaml.safe_load(Path(args.config).read_text())['db']
+    conn = connect(db_config)
+    cur = conn.cursor()
+    if args.incremental:
+        incremental_load(cur, args, db_config)
+    else:
+        full_load(cur, args, db_config)
+
+    cur.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
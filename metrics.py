@@ -0,0 +1,115 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds; +Inf is implied
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DB_PHASES = ('acquire', 'execute', 'fetch')
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def db_time(self):
+        return sum(self.phases.get(name, 0.0) for name in DB_PHASES)
+
+    def server_timing(self):
+        parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.phases.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.3f}")
+        return ', '.join(parts)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+class MetricsRegistry:
+    def __init__(self, prefix='hovetl', buckets=BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._latency = {}
+        self._phases = {}
+
+    def observe(self, route, method, status, duration, phases):
+        with self._lock:
+            key = (route, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._latency.setdefault(route, Histogram(self.buckets)).observe(duration)
+            for phase, seconds in phases.items():
+                self._phases.setdefault((route, phase), Histogram(self.buckets)).observe(seconds)
+
+    def render(self, gauges=None):
+        # Prometheus text exposition format 0.0.4. gauges: {name: (help, value)}
+        p = self.prefix
+        with self._lock:
+            lines = [
+                f'# HELP {p}_requests_total Requests served, by route, method and status.',
+                f'# TYPE {p}_requests_total counter',
+            ]
+            for (route, method, status), count in sorted(self._requests.items()):
+                lines.append(f'{p}_requests_total{{{_labels(route=route, method=method, status=status)}}} {count}')
+            lines += [
+                f'# HELP {p}_request_duration_seconds Wall time from request start to the last byte sent.',
+                f'# TYPE {p}_request_duration_seconds histogram',
+            ]
+            for route, histogram in sorted(self._latency.items()):
+                lines.extend(histogram.lines(f'{p}_request_duration_seconds', _labels(route=route)))
+            lines += [
+                f'# HELP {p}_request_phase_seconds Time spent per request in each phase (acquire, execute, fetch, compute, serialize, compress, geocode).',
+                f'# TYPE {p}_request_phase_seconds histogram',
+            ]
+            for (route, phase), histogram in sorted(self._phases.items()):
+                lines.extend(histogram.lines(f'{p}_request_phase_seconds', _labels(route=route, phase=phase)))
+        for name, (help_text, value) in (gauges or {}).items():
+            lines += [f'# HELP {p}_{name} {help_text}', f'# TYPE {p}_{name} gauge', f'{p}_{name} {value}']
+        return '\n'.join(lines) + '\n'
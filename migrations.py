@@ -0,0 +1,119 @@
+from pathlib import Path
+
+import pymysql
+import yaml
+
+MIGRATIONS_TABLE = 'hovetl_schema_migrations'
+
+# (version, description, statements). Append new migrations; never edit one
+# that has already been applied somewhere.
+MIGRATIONS = [
+    (1, 'create hovetl_crimes', [
+        """
+        CREATE TABLE IF NOT EXISTS hovetl_crimes (
+            CID INT PRIMARY KEY AUTO_INCREMENT,
+            CrimeDate DATETIME,
+            DateYear INT,
+            DateMonth INT,
+            City VARCHAR(100),
+            Crime_Category VARCHAR(100),
+            Sub_Category VARCHAR(100),
+            Crime_Description VARCHAR(100),
+            Latitude FLOAT,
+            Longitude FLOAT
+        ) ENGINE=MyISAM DEFAULT CHARSET=latin1 AUTO_INCREMENT=1
+        """,
+    ]),
+    (2, 'stored generated columns for per-row expressions', [
+        """
+        ALTER TABLE hovetl_crimes
+            ADD COLUMN Day_Of_Week TINYINT AS (DAYOFWEEK(CrimeDate)) STORED,
+            ADD COLUMN Crime_Category_Lower VARCHAR(100) AS (LOWER(Crime_Category)) STORED,
+            ADD COLUMN Sub_Category_Lower VARCHAR(100) AS (LOWER(Sub_Category)) STORED
+        """,
+    ]),
+    (3, 'covering indexes for the API routes', [
+        """
+        ALTER TABLE hovetl_crimes
+            ADD INDEX idx_city_category (City, Crime_Category),
+            ADD INDEX idx_city_year_category (City, DateYear, Crime_Category),
+            ADD INDEX idx_city_month (City, DateMonth),
+            ADD INDEX idx_year (DateYear),
+            ADD INDEX idx_category (Crime_Category),
+            ADD INDEX idx_date (CrimeDate),
+            ADD INDEX idx_dow (Day_Of_Week),
+            ADD INDEX idx_city_category_lower (City, Crime_Category_Lower, Sub_Category),
+            ADD INDEX idx_city_sub_point (City, Sub_Category_Lower, Latitude, Longitude),
+            ADD INDEX idx_city_point (City, Latitude, Longitude)
+        """,
+    ]),
+    (4, 'cover the city/category/sub-category dimension lookup', [
+        """
+        ALTER TABLE hovetl_crimes
+            DROP INDEX idx_city_category,
+            ADD INDEX idx_city_category_sub (City, Crime_Category, Sub_Category)
+        """,
+    ]),
+    (5, 'source record ids and per-city load watermarks', [
+        """
+        ALTER TABLE hovetl_crimes
+            ADD COLUMN Source_ID BIGINT NULL,
+            ADD UNIQUE INDEX uq_city_source (City, Source_ID)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS hovetl_load_watermarks (
+            City VARCHAR(100) PRIMARY KEY,
+            Max_CrimeDate DATETIME NULL,
+            Max_Source_ID BIGINT NULL,
+            Rows_Read INT NOT NULL,
+            Rows_Changed INT NOT NULL,
+            Loaded_At DATETIME NOT NULL
+        ) ENGINE=MyISAM DEFAULT CHARSET=latin1
+        """,
+    ]),
+    (6, 'keyset pagination over CID for the row-level routes', [
+        # City, then CID order, with the sub-category filter and the point
+        # columns in the index so every page is an index-only range read
+        """
+        ALTER TABLE hovetl_crimes
+            ADD INDEX idx_city_cid_point (City, CID, Sub_Category_Lower, Latitude, Longitude)
+        """,
+    ]),
+]
+
+
+def applied_versions(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+            Version INT PRIMARY KEY,
+            Description VARCHAR(200) NOT NULL,
+            Applied_At DATETIME NOT NULL
+        )
+    """)
+    cursor.execute(f"SELECT Version FROM {MIGRATIONS_TABLE}")
+    return {row['Version'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()}
+
+
+def migrate(cursor, target=None):
+    done = applied_versions(cursor)
+    for version, description, statements in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute(
+            f"INSERT INTO {MIGRATIONS_TABLE} (Version, Description, Applied_At) VALUES (%s, %s, UTC_TIMESTAMP())",
+            (version, description)
+        )
+        print(f"Applied migration {version}: {description}")
+
+
+if __name__ == "__main__":
+    config = yaml.safe_load(Path("config.yml").read_text())
+    conn = pymysql.connect(
+        host=config['db']['host'], port=int(config['db'].get('port', 3306)),
+        user=config['db']['user'], password=config['db']['passwd'], db=config['db']['db'],
+        autocommit=True
+    )
+    migrate(conn.cursor())
+    conn.close()
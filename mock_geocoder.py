@@ -0,0 +1,95 @@
+# Stand-in for Nominatim's /reverse, to exercise /geocode and /geocode_batch
+# without touching the public service. It answers like Nominatim (an
+# `address` object, or an `error` key at 0,0), can add latency and random
+# failures, and enforces its own request rate with 429s so the API's rate
+# limiter can be checked:
+#
+#   python mock_geocoder.py --port 8088 --rate 5 --latency 0.2 --error-rate 0.05
+#
+# then point the API at it in config.yml:
+#
+#   geocoder:
+#     nominatim_url: http://127.0.0.1:8088
+#     rate_limit: 5
+#
+# GET /stats reports how many requests were served, rejected and failed,
+# and the most seen in any one-second window.
+import argparse
+import random
+import threading
+import time
+from collections import deque
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+settings = {'rate': 0, 'latency': 0.0, 'error_rate': 0.0}
+lock = threading.Lock()
+recent = deque()
+stats = {'served': 0, 'rate_limited': 0, 'errors': 0, 'max_per_second': 0}
+
+
+def fake_address(latitude, longitude):
+    # Stable for a coordinate, so cached and fresh answers can be compared
+    block = int(abs(latitude) * 1000) % 100 * 100
+    street = int(abs(longitude) * 1000) % 50
+    return {
+        'house_number': str(block),
+        'road': f"Mock Street {street}",
+        'suburb': f"District {int(abs(latitude) * 100) % 20}",
+        'city': 'Mockville',
+        'state': 'Mock State',
+        'postcode': f"{int(abs(latitude * longitude) * 10) % 100000:05d}",
+        'country': 'United States',
+        'country_code': 'us',
+    }
+
+
+@app.route('/reverse', methods=['GET'])
+def reverse():
+    now = time.monotonic()
+    with lock:
+        while recent and now - recent[0] >= 1:
+            recent.popleft()
+        if settings['rate'] and len(recent) >= settings['rate']:
+            stats['rate_limited'] += 1
+            return jsonify(error='Too many requests'), 429
+        recent.append(now)
+        stats['max_per_second'] = max(stats['max_per_second'], len(recent))
+    if settings['latency']:
+        time.sleep(settings['latency'])
+    if random.random() < settings['error_rate']:
+        with lock:
+            stats['errors'] += 1
+        return jsonify(error='Internal error'), 500
+    try:
+        latitude, longitude = float(request.args['lat']), float(request.args['lon'])
+    except (KeyError, ValueError):
+        return jsonify(error='Parameter lat/lon missing or invalid'), 400
+    with lock:
+        stats['served'] += 1
+    if latitude == 0 and longitude == 0:
+        return jsonify(error='Unable to geocode')
+    return jsonify(lat=str(latitude), lon=str(longitude), address=fake_address(latitude, longitude))
+
+
+@app.route('/stats', methods=['GET'])
+def show_stats():
+    with lock:
+        return jsonify(stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Nominatim reverse geocoder.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--rate', type=int, default=1, help="requests per second before answering 429 (0 = unlimited)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every answer")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    args = parser.parse_args()
+    settings.update(rate=args.rate, latency=args.latency, error_rate=args.error_rate)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
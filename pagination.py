@@ -0,0 +1,45 @@
+import base64
+import hashlib
+
+DEFAULT_PAGE_SIZE = 10000
+MAX_PAGE_SIZE = 50000
+
+
+def _scope_digest(scope):
+    return hashlib.sha1(repr(scope).encode()).hexdigest()[:8]
+
+
+def encode_cursor(last_cid, scope):
+    # Opaque to clients: the last CID served plus a digest of the query it
+    # belongs to, so a cursor cannot be replayed against another city or filter
+    token = f"{last_cid}.{_scope_digest(scope)}"
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, scope):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        last_cid, digest = raw.split('.')
+        last_cid = int(last_cid)
+    except ValueError:
+        raise ValueError("cursor is not valid")
+    if digest != _scope_digest(scope):
+        raise ValueError("cursor belongs to a different query")
+    return last_cid
+
+
+def page_params(args, scope):
+    # (CID to continue after, page size) from the request. Paging is opt-in:
+    # the page size is None, meaning every row, unless limit or cursor is given.
+    cursor, limit = args.get('cursor'), args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError(f"limit must be an integer between 1 and {MAX_PAGE_SIZE}")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be an integer between 1 and {MAX_PAGE_SIZE}")
+    elif cursor is not None:
+        limit = DEFAULT_PAGE_SIZE
+    after = decode_cursor(cursor, scope) if cursor else 0
+    return after, limit
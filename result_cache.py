@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0, 'body_hits': 0}
+
+    @staticmethod
+    def make_key(route, params=None):
+        items = []
+        for name, value in (params or {}).items():
+            if value is None:
+                continue
+            if isinstance(value, str):
+                value = value.strip()
+            items.append((name, value))
+        return route, tuple(sorted(items))
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self._stats['invalidations'] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def _drop(self, key):
+        _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _make_room(self, size, keep=None):
+        for key in list(self._entries):
+            if self._bytes + size <= self.max_bytes:
+                break
+            if key != keep:
+                self._drop(key)
+                self._stats['evictions'] += 1
+
+    def get(self, key, version):
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry[2] <= time.monotonic():
+                self._drop(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def get_body(self, key, version, variant):
+        # Encoded response bodies are kept on the entry of the result they
+        # were built from, so they expire and are invalidated along with it
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            body = entry[3].get(variant) if entry and entry[2] > time.monotonic() else None
+            if body is not None:
+                self._stats['body_hits'] += 1
+            return body
+
+    def put_body(self, key, version, variant, body):
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            # The entry itself is never evicted for its own body, so the pair
+            # has to fit the budget together
+            if entry is None or variant in entry[3] or entry[1] + len(body) > self.max_bytes:
+                return
+            self._make_room(len(body), keep=key)
+            entry[1] += len(body)
+            entry[3][variant] = body
+            self._bytes += len(body)
+
+    def put(self, key, version, value):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._drop(key)
+            self._make_room(size)
+            self._entries[key] = [value, size, time.monotonic() + self.ttl, {}]
+            self._bytes += size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(
+                self._stats,
+                hit_ratio=self._stats['hits'] / lookups if lookups else 0.0,
+                entries=len(self._entries),
+                bodies=sum(len(entry[3]) for entry in self._entries.values()),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                data_version=self._version,
+            )
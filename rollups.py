@@ -0,0 +1,258 @@
+import math
+
+FACT_TABLE = 'hovetl_crimes'
+
+# Columns of the fact table that can be grouped or filtered on. Day_Of_Week and
+# the lower-cased categories are stored generated columns (see migrations.py)
+# so they can be indexed.
+DIMENSIONS = ('City', 'DateYear', 'DateMonth', 'CrimeDate', 'Crime_Category', 'Sub_Category', 'Day_Of_Week')
+FACT_LOWER = {
+    'Crime_Category': 'Crime_Category_Lower',
+    'Sub_Category': 'Sub_Category_Lower',
+}
+
+# Ordered smallest first (approximate row counts for three cities and six
+# years). Every rollup keeps City and DateYear so it can be rebuilt one
+# city/year slice at a time.
+ROLLUPS = [
+    ('hovetl_rollup_city_year_dow', ['City', 'DateYear', 'Day_Of_Week']),                          # ~130 rows
+    ('hovetl_rollup_city_year_category', ['City', 'DateYear', 'Crime_Category']),                  # ~200 rows
+    ('hovetl_rollup_city_year_month', ['City', 'DateYear', 'DateMonth']),                          # ~220 rows
+    ('hovetl_rollup_city_year_subcategory', ['City', 'DateYear', 'Crime_Category', 'Sub_Category']),  # ~3k rows
+    ('hovetl_rollup_city_date', ['City', 'DateYear', 'CrimeDate']),                                # ~7k rows
+]
+
+# Stratified sample of the fact table for approximate answers: each
+# City/DateYear stratum keeps rows with probability p (at least
+# SAMPLE_FRACTION, more for strata under MIN_STRATUM_ROWS / SAMPLE_FRACTION
+# rows) and every kept row carries Weight = 1/p.
+SAMPLE_TABLE = 'hovetl_crimes_sample'
+SAMPLE_FRACTION = 0.02
+MIN_STRATUM_ROWS = 1000
+SAMPLE_COLUMNS = ('CID', 'City', 'DateYear', 'DateMonth', 'CrimeDate', 'Crime_Category', 'Sub_Category',
+                  'Crime_Category_Lower', 'Sub_Category_Lower', 'Day_Of_Week', 'Latitude', 'Longitude')
+# Rows are picked by CRC32(CID) against a threshold out of SAMPLE_BUCKETS, so
+# a rebuild keeps the same rows and previews do not jump around
+SAMPLE_BUCKETS = 1000000
+Z_95 = 1.96
+
+FILTER_OPS = ('=', 'between', 'like')
+# Rollups and the sample table
+DERIVED_TABLES_QUERY = r"SHOW TABLES LIKE 'hovetl\_%'"
+
+
+def build_rollups(cursor):
+    for table, dimensions in ROLLUPS:
+        # Build into a side table and swap it in so readers never see a half-built rollup
+        cursor.execute(f"DROP TABLE IF EXISTS {table}_new")
+        cursor.execute(f"""
+            CREATE TABLE {table}_new (KEY ({', '.join(dimensions)}))
+            ENGINE=MyISAM DEFAULT CHARSET=latin1
+            SELECT {', '.join(dimensions)}, COUNT(*) AS Crime_Count
+            FROM {FACT_TABLE}
+            GROUP BY {', '.join(dimensions)}
+        """)
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} LIKE {table}_new")
+        cursor.execute(f"DROP TABLE IF EXISTS {table}_old")
+        cursor.execute(f"RENAME TABLE {table} TO {table}_old, {table}_new TO {table}")
+        cursor.execute(f"DROP TABLE {table}_old")
+        print(f"Rollup {table} built.")
+
+
+def refresh_rollup_slices(cursor, slices):
+    # slices maps City -> DateYears whose fact rows changed. Only those slices
+    # are recounted; the lock keeps readers from seeing a slice half-replaced.
+    for table, _ in ROLLUPS:
+        cursor.execute("SHOW TABLES LIKE %s", (table,))
+        if not cursor.fetchall():
+            build_rollups(cursor)
+            return
+    for table, dimensions in ROLLUPS:
+        cursor.execute(f"LOCK TABLES {table} WRITE, {FACT_TABLE} READ")
+        try:
+            for city, years in slices.items():
+                years = sorted(years)
+                if not years:
+                    continue
+                in_years = ', '.join(['%s'] * len(years))
+                cursor.execute(f"DELETE FROM {table} WHERE City = %s AND DateYear IN ({in_years})", (city, *years))
+                cursor.execute(f"""
+                    INSERT INTO {table} ({', '.join(dimensions)}, Crime_Count)
+                    SELECT {', '.join(dimensions)}, COUNT(*)
+                    FROM {FACT_TABLE}
+                    WHERE City = %s AND DateYear IN ({in_years})
+                    GROUP BY {', '.join(dimensions)}
+                """, (city, *years))
+        finally:
+            cursor.execute("UNLOCK TABLES")
+        print(f"Rollup {table} refreshed for {sum(len(years) for years in slices.values())} city/year slices.")
+
+
+def _stratum_threshold(rows, fraction, min_rows):
+    return max(1, min(SAMPLE_BUCKETS, math.ceil(max(fraction, min_rows / rows) * SAMPLE_BUCKETS)))
+
+
+def _fill_sample(cursor, table, strata, fraction, min_rows):
+    # strata: [(City, DateYear, fact rows)]
+    for city, year, rows in strata:
+        threshold = _stratum_threshold(rows, fraction, min_rows)
+        cursor.execute(f"""
+            INSERT INTO {table} ({', '.join(SAMPLE_COLUMNS)}, Weight)
+            SELECT {', '.join(SAMPLE_COLUMNS)}, %s
+            FROM {FACT_TABLE}
+            WHERE City = %s AND DateYear = %s AND CRC32(CID) %% {SAMPLE_BUCKETS} < %s
+        """, (SAMPLE_BUCKETS / threshold, city, year, threshold))
+
+
+def build_sample(cursor, fraction=SAMPLE_FRACTION, min_rows=MIN_STRATUM_ROWS):
+    cursor.execute(f"DROP TABLE IF EXISTS {SAMPLE_TABLE}_new")
+    cursor.execute(f"""
+        CREATE TABLE {SAMPLE_TABLE}_new (KEY (City, DateYear), KEY (City, CID), KEY (City, Sub_Category_Lower))
+        ENGINE=MyISAM DEFAULT CHARSET=latin1
+        SELECT {', '.join(SAMPLE_COLUMNS)}, 1e0 AS Weight FROM {FACT_TABLE} WHERE FALSE
+    """)
+    cursor.execute(f"SELECT City, DateYear, COUNT(*) FROM {FACT_TABLE} GROUP BY City, DateYear")
+    _fill_sample(cursor, f"{SAMPLE_TABLE}_new", cursor.fetchall(), fraction, min_rows)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {SAMPLE_TABLE} LIKE {SAMPLE_TABLE}_new")
+    cursor.execute(f"DROP TABLE IF EXISTS {SAMPLE_TABLE}_old")
+    cursor.execute(f"RENAME TABLE {SAMPLE_TABLE} TO {SAMPLE_TABLE}_old, {SAMPLE_TABLE}_new TO {SAMPLE_TABLE}")
+    cursor.execute(f"DROP TABLE {SAMPLE_TABLE}_old")
+    cursor.execute(f"SELECT COUNT(*) FROM {SAMPLE_TABLE}")
+    print(f"Sample {SAMPLE_TABLE} built with {cursor.fetchone()[0]} rows.")
+
+
+def refresh_sample_slices(cursor, slices, fraction=SAMPLE_FRACTION, min_rows=MIN_STRATUM_ROWS):
+    # A changed City/DateYear slice is a whole stratum, so it is sampled
+    # again from scratch with the probability its new size calls for
+    cursor.execute("SHOW TABLES LIKE %s", (SAMPLE_TABLE,))
+    if not cursor.fetchall():
+        build_sample(cursor, fraction, min_rows)
+        return
+    cursor.execute(f"LOCK TABLES {SAMPLE_TABLE} WRITE, {FACT_TABLE} READ")
+    try:
+        for city, years in slices.items():
+            years = sorted(years)
+            if not years:
+                continue
+            in_years = ', '.join(['%s'] * len(years))
+            cursor.execute(f"DELETE FROM {SAMPLE_TABLE} WHERE City = %s AND DateYear IN ({in_years})", (city, *years))
+            cursor.execute(f"""
+                SELECT City, DateYear, COUNT(*) FROM {FACT_TABLE}
+                WHERE City = %s AND DateYear IN ({in_years})
+                GROUP BY City, DateYear
+            """, (city, *years))
+            _fill_sample(cursor, SAMPLE_TABLE, cursor.fetchall(), fraction, min_rows)
+    finally:
+        cursor.execute("UNLOCK TABLES")
+    print(f"Sample {SAMPLE_TABLE} refreshed for {sum(len(years) for years in slices.values())} city/year slices.")
+
+
+def check_sample(available):
+    if SAMPLE_TABLE not in available:
+        raise ValueError(f"Approximate answers need {SAMPLE_TABLE}; run the loader to build it")
+
+
+def with_error(names, rows):
+    # (names, rows) of an approximate plan, whose last two columns are the
+    # weighted count and its variance, as Crime_Count (rounded) and
+    # Crime_Count_Error, the half-width of a 95% confidence interval.
+    # Horvitz-Thompson: a row kept with probability p = 1/w adds w to the
+    # count and w(w-1) to the variance estimate, so exact rows (w = 1) add none.
+    finished = []
+    for row in rows:
+        *key, count, variance = row
+        finished.append(tuple(key) + (int(round(count or 0)), int(math.ceil(Z_95 * math.sqrt(variance or 0)))))
+    return list(names[:-2]) + ['Crime_Count', 'Crime_Count_Error'], finished
+
+
+def check_spec(group_by, filters=None, order_by=None, limit=None):
+    # Shared by every backend so a spec is rejected the same way everywhere
+    filters = filters or []
+    for dimension in list(group_by) + [f[0] for f in filters]:
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension '{dimension}'")
+    for _, op, _ in filters:
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unknown filter operator '{op}'")
+    for term in order_by or []:
+        column, *direction = term.split()
+        if column not in list(group_by) + ['Crime_Count'] or direction not in ([], ['ASC'], ['DESC']):
+            raise ValueError(f"Cannot order by '{term}'")
+    if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 1):
+        raise ValueError("limit must be a positive integer")
+
+
+def order_rows(names, rows, order_by):
+    # ORDER BY over already fetched rows, as MySQL does it: NULLs first when
+    # ascending, strings compared case-insensitively
+    rows = list(rows)
+    for term in reversed(order_by or []):
+        column, *direction = term.split()
+        i = names.index(column)
+        rows.sort(key=lambda row: (row[i] is not None, row[i].lower() if isinstance(row[i], str) else row[i]),
+                  reverse=direction == ['DESC'])
+    return rows
+
+
+class QueryPlanner:
+    def __init__(self):
+        self.version = object()
+        self.available = set()
+
+    def refresh(self, cursor, version):
+        cursor.execute(DERIVED_TABLES_QUERY)
+        self.set_available(cursor.fetchall(), version)
+
+    def set_available(self, rows, version):
+        self.available = {list(row.values())[0] if isinstance(row, dict) else row[0] for row in rows}
+        self.version = version
+
+    def choose(self, dimensions):
+        for table, rollup_dimensions in ROLLUPS:
+            if table in self.available and dimensions <= set(rollup_dimensions):
+                return table
+        return FACT_TABLE
+
+    def plan(self, group_by, filters=None, order_by=None, limit=None, approx=False):
+        # approx=True adds a Crime_Count_Var column (see with_error()). Specs a
+        # rollup can answer stay exact, since the rollup is smaller than the
+        # sample; only fact table scans are moved to the sample.
+        check_spec(group_by, filters, order_by, limit)
+        filters = filters or []
+        table = self.choose(set(group_by) | {f[0] for f in filters})
+        count = 'COUNT(*)' if table == FACT_TABLE else 'CAST(SUM(Crime_Count) AS SIGNED)'
+        columns = [count + ' AS Crime_Count']
+        if approx:
+            if table == FACT_TABLE:
+                check_sample(self.available)
+                table = SAMPLE_TABLE
+                columns = ['SUM(Weight) AS Crime_Count', 'SUM(Weight * (Weight - 1)) AS Crime_Count_Var']
+            else:
+                columns.append('0 AS Crime_Count_Var')
+
+        where, args = [], []
+        for dimension, op, value in filters:
+            if op == '=':
+                where.append(f"{dimension} = %s")
+                args.append(value)
+            elif op == 'between':
+                where.append(f"{dimension} BETWEEN %s AND %s")
+                args.extend(value)
+            else:
+                if table in (FACT_TABLE, SAMPLE_TABLE) and dimension in FACT_LOWER:
+                    where.append(f"{FACT_LOWER[dimension]} LIKE %s")
+                else:
+                    where.append(f"LOWER({dimension}) LIKE %s")
+                args.append(f"%{value.lower()}%")
+
+        query = f"SELECT {', '.join(list(group_by) + columns)} FROM {table}"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        if group_by:
+            query += " GROUP BY " + ", ".join(group_by)
+        if order_by:
+            query += " ORDER BY " + ", ".join(order_by)
+        if limit:
+            query += " LIMIT %s"
+            args.append(limit)
+        return query, tuple(args)
@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+
+from rollups import Z_95
+
+# Smallest cell (about 1 m) bin_points accepts: finer grids stop being a
+# density view and their int64 cell keys can overflow over a wide extent
+MIN_BIN_SIZE = 1e-5
+
+
+def points_array(rows):
+    # (Latitude, Longitude) tuples as two float64 arrays
+    points = np.array(rows, dtype=np.float64).reshape(-1, 2)
+    return points[:, 0], points[:, 1]
+
+
+def fetch_points(cursor, batch_size=50000):
+    # Reads (Latitude, Longitude) tuples batch by batch into one float64 array
+    # without materialising a dict or tuple per row for the whole result.
+    # Returns one array per selected column, e.g. (lat, lon, weight).
+    width = len(cursor.description)
+    batches = []
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        batches.append(np.array(rows, dtype=np.float64).reshape(-1, width))
+    return _stack(batches, width)
+
+
+async def fetch_points_async(cursor, batch_size=50000):
+    # fetch_points() for an aiomysql SSCursor
+    width = len(cursor.description)
+    batches = []
+    while True:
+        rows = await cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        batches.append(np.array(rows, dtype=np.float64).reshape(-1, width))
+    return _stack(batches, width)
+
+
+def _stack(batches, width):
+    if not batches:
+        return tuple(np.empty(0) for _ in range(width))
+    points = np.concatenate(batches)
+    return tuple(points[:, i] for i in range(width))
+
+
+def iqr_mask(values, k):
+    q1, q3 = np.percentile(values, [25, 75])
+    iqr = q3 - q1
+    return (values >= q1 - k * iqr) & (values <= q3 + k * iqr)
+
+
+def check_bin_params(bin_size, outlier_iqr=0):
+    if not math.isfinite(bin_size) or bin_size < MIN_BIN_SIZE:
+        raise ValueError(f"bin_size must be a number of degrees no smaller than {MIN_BIN_SIZE:g}")
+    if not math.isfinite(outlier_iqr) or outlier_iqr < 0:
+        raise ValueError("outlier_iqr must be a finite number that is not negative")
+
+
+def bin_points(lat, lon, bin_size=0.01, outlier_iqr=1.5, bbox=None, weights=None):
+    # Same reduction the dashboard used to do client-side: drop (0, 0)
+    # placeholders, trim IQR outliers, then count points per bin_size cell.
+    # With sample weights, counts are the weighted sums and each bin also gets
+    # count_error, the half-width of a 95% interval (see rollups.with_error).
+    check_bin_params(bin_size, outlier_iqr)
+    keep = (lat != 0.0) | (lon != 0.0)
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        keep &= (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+    lat, lon = lat[keep], lon[keep]
+    if weights is not None:
+        weights = weights[keep]
+    if outlier_iqr and lat.size:
+        keep = iqr_mask(lat, outlier_iqr) & iqr_mask(lon, outlier_iqr)
+        lat, lon = lat[keep], lon[keep]
+        if weights is not None:
+            weights = weights[keep]
+    if not lat.size:
+        bins = {'lat_bin': [], 'lon_bin': [], 'count': []}
+        if weights is not None:
+            bins['count_error'] = []
+        return {'center': None, 'points': 0, 'bins': bins}
+
+    lat_idx = np.floor(lat / bin_size).astype(np.int64)
+    lon_idx = np.floor(lon / bin_size).astype(np.int64)
+    lat_min, lon_min = lat_idx.min(), lon_idx.min()
+    width = lon_idx.max() - lon_min + 1
+    cells, inverse, counts = np.unique((lat_idx - lat_min) * width + (lon_idx - lon_min),
+                                       return_inverse=True, return_counts=True)
+    lat_bins = np.round((cells // width + lat_min) * bin_size, 6)
+    lon_bins = np.round((cells % width + lon_min) * bin_size, 6)
+    if weights is None:
+        return {
+            'center': {'lat': float(lat.mean()), 'lon': float(lon.mean())},
+            'points': int(lat.size),
+            'bins': {'lat_bin': lat_bins.tolist(), 'lon_bin': lon_bins.tolist(), 'count': counts.tolist()},
+        }
+    counts = np.bincount(inverse, weights=weights, minlength=len(cells))
+    variances = np.bincount(inverse, weights=weights * (weights - 1), minlength=len(cells))
+    return {
+        'center': {'lat': float(np.average(lat, weights=weights)), 'lon': float(np.average(lon, weights=weights))},
+        'points': int(round(weights.sum())),
+        'bins': {
+            'lat_bin': lat_bins.tolist(), 'lon_bin': lon_bins.tolist(),
+            'count': np.round(counts).astype(np.int64).tolist(),
+            'count_error': np.ceil(Z_95 * np.sqrt(variances)).astype(np.int64).tolist(),
+        },
+    }
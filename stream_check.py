@@ -0,0 +1,182 @@
+# Checks that streamed responses give their pooled connection back, and in
+# async_app.py their route slot, when the body is never read: a HEAD request
+# and a GET whose client goes away before the first chunk. MySQL is replaced
+# by a stand-in driver, so only config.yml is needed. Exits non-zero on a leak.
+#
+#   python stream_check.py
+import asyncio
+import sys
+
+import aiomysql.pool
+
+import app
+import async_app
+from db_pool import AsyncConnectionPool, ConnectionPool
+
+CITY = 'Chicago'
+URL = f'/crime_location_density_by_city?key=123&city={CITY}&stream=ndjson'
+ROWS = [(41.8 + i / 1e5, -87.6) for i in range(20000)]
+
+
+class FakeCursor:
+    description = [('Latitude',), ('Longitude',)]
+
+    def execute(self, query, args=None):
+        self.rows = list(ROWS)
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    open = True
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor()
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        self.open = False
+
+
+class FakeAsyncCursor(FakeCursor):
+    async def execute(self, query, args=None):
+        FakeCursor.execute(self, query, args)
+
+    async def fetchmany(self, size):
+        return FakeCursor.fetchmany(self, size)
+
+    async def close(self):
+        pass
+
+
+class FakeAsyncConnection:
+    # What aiomysql's Pool looks at when a connection is released
+    last_usage = float('inf')
+
+    class _reader:
+        eof_received = False
+
+        @staticmethod
+        def at_eof():
+            return False
+
+        @staticmethod
+        def exception():
+            return None
+
+    def __init__(self):
+        self.closed = False
+
+    async def cursor(self, cursor_class=None):
+        return FakeAsyncCursor()
+
+    def get_transaction_status(self):
+        return False
+
+    def close(self):
+        self.closed = True
+
+    async def ensure_closed(self):
+        self.closed = True
+
+
+async def fake_connect(**kwargs):
+    return FakeAsyncConnection()
+
+
+def check(name, pool_state, slots=None):
+    in_use = pool_state['in_use']
+    ok = in_use == 0 and (slots is None or slots == async_app.DEFAULT_ROUTE_LIMIT)
+    detail = f"in_use={in_use}" + (f" free route slots={slots}" if slots is not None else '')
+    print(f"{'ok  ' if ok else 'LEAK'} {name}: {detail}")
+    return 0 if ok else 1
+
+
+def check_sync():
+    app.pool = ConnectionPool(FakeConnection, min_size=0, max_size=3)
+    app.data_version.current = lambda: 1
+    app.dimensions.refresh([{'City': CITY, 'Crime_Category': 'x', 'Sub_Category': 'x'}], 1)
+    client = app.app.test_client()
+    failures = 0
+    for _ in range(app.pool.max_size + 1):
+        response = client.head(URL)
+        response.close()
+    failures += check('app.py HEAD', app.pool.stats())
+    for _ in range(app.pool.max_size + 1):
+        # The server closes the body without reading it, as on a disconnect
+        response = client.get(URL, buffered=False)
+        response.close()
+    failures += check('app.py unread GET', app.pool.stats())
+    response = client.get(URL)
+    lines = response.get_data(as_text=True).splitlines()
+    failures += check(f'app.py full GET ({len(lines)} rows)', app.pool.stats())
+    return failures + (len(lines) != len(ROWS))
+
+
+async def disconnected_get(url):
+    # Drives the ASGI app directly: the client goes away once the headers are
+    # sent, before the first chunk of the body is written
+    path, _, query = url.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 1), 'server': ('localhost', 80),
+        'extensions': {},
+    }
+    started = asyncio.Event()
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await started.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            started.set()
+            await asyncio.sleep(3600)
+
+    await async_app.app(scope, receive, send)
+    await asyncio.sleep(0)
+
+
+async def check_async():
+    aiomysql.pool.connect = fake_connect
+    async_app.pool = AsyncConnectionPool(min_size=0, max_size=3, acquire_timeout=1)
+    await async_app.pool.open()
+
+    async def version():
+        return 1
+    async_app.data_version.current = version
+    async_app.memory_engine = None
+    async_app.dimensions.refresh([{'City': CITY, 'Crime_Category': 'x', 'Sub_Category': 'x'}], 1)
+    client = async_app.app.test_client()
+    slots = lambda: async_app.route_slots['crime_location_density_by_city']._value
+    failures = 0
+    for _ in range(async_app.pool.max_size + 1):
+        await client.head(URL)
+    failures += check('async_app.py HEAD', async_app.pool.stats(), slots())
+    for _ in range(async_app.pool.max_size + 1):
+        await disconnected_get(URL)
+    failures += check('async_app.py disconnected GET', async_app.pool.stats(), slots())
+    response = await client.get(URL)
+    lines = (await response.get_data(as_text=True)).splitlines()
+    failures += check(f'async_app.py full GET ({len(lines)} rows)', async_app.pool.stats(), slots())
+    return failures + (len(lines) != len(ROWS))
+
+
+def main():
+    failures = check_sync() + asyncio.run(check_async())
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
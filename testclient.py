@@ -1,35 +1,142 @@
 
+import functools
+import hashlib
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import plotly
 import plotly.graph_objects as go
-from flask import Flask, render_template
+from plotly.offline import get_plotlyjs
+from flask import Flask, Response, render_template
 import requests
 import pandas as pd
 import plotly.express as px 
 import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 
 app = Flask(__name__)
 
 API_BASE_URL = "http://127.0.0.1:5000"
 
+# One pooled session for every API call, plus a small cache of parsed
+# responses that is revalidated with If-None-Match instead of refetched.
+api_session = requests.Session()
+api_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+API_CACHE_SIZE = 64
+api_cache = OrderedDict()
+api_cache_lock = threading.Lock()
+
+
+def api_get(path, timeout=None):
+    url = f"{API_BASE_URL}{path}"
+    with api_cache_lock:
+        cached = api_cache.get(url)
+    headers = {}
+    if cached:
+        headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    response = api_session.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and cached:
+        with api_cache_lock:
+            api_cache.move_to_end(url)
+        return 200, cached['data']
+    data = response.json()
+    etag = response.headers.get('ETag')
+    if response.status_code == 200 and etag:
+        with api_cache_lock:
+            api_cache[url] = {'etag': etag, 'last_modified': response.headers.get('Last-Modified'), 'data': data}
+            api_cache.move_to_end(url)
+            while len(api_cache) > API_CACHE_SIZE:
+                api_cache.popitem(last=False)
+    return response.status_code, data
+
+# plotly.js is served once from a versioned URL with a one-year cache
+# lifetime; chart fragments are rendered without it.
+PLOTLY_JS = get_plotlyjs().encode()
+PLOTLY_JS_URL = f"/assets/plotly-{plotly.__version__}.min.js"
+
+
+@app.route(PLOTLY_JS_URL)
+def plotly_js():
+    response = Response(PLOTLY_JS, mimetype="application/javascript")
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@app.context_processor
+def inject_plotly_js_url():
+    return {'plotly_js_url': PLOTLY_JS_URL}
+
+
+CHART_CACHE_SIZE = 128
+chart_cache = OrderedDict()
+chart_cache_lock = threading.Lock()
+
+
+def _digest_default(value):
+    if isinstance(value, np.ndarray):
+        return hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+    return str(value)
+
+
+def cached_chart(build):
+    # Rendered HTML fragments keyed by a hash of the chart function and its
+    # inputs (API payload and options), so unchanged charts are not rebuilt.
+    @functools.wraps(build)
+    def wrapper(*args, **kwargs):
+        payload = json.dumps([build.__name__, args, kwargs], sort_keys=True, default=_digest_default)
+        key = hashlib.sha256(payload.encode()).hexdigest()
+        with chart_cache_lock:
+            if key in chart_cache:
+                chart_cache.move_to_end(key)
+                return chart_cache[key]
+        chart_html = build(*args, **kwargs)
+        with chart_cache_lock:
+            chart_cache[key] = chart_html
+            while len(chart_cache) > CHART_CACHE_SIZE:
+                chart_cache.popitem(last=False)
+        return chart_html
+    return wrapper
+
+
 @app.route('/')  
 def home():
     return render_template('dashboard.html')  
 
+def load_point_columns(response):
+    # Binary point responses are viewed in place: np.frombuffer / Arrow's
+    # to_numpy wrap the response bytes instead of parsing floats one by one.
+    names = response.headers.get('X-Columns', 'Latitude,Longitude').split(',')
+    content_type = response.headers['Content-Type']
+    if content_type.startswith('application/x-npy'):
+        buf = io.BytesIO(response.content)
+        version = np.lib.format.read_magic(buf)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(buf)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(buf)
+        array = np.frombuffer(response.content, dtype=dtype, offset=buf.tell()).reshape(shape)
+        return dict(zip(names, array))
+    if content_type.startswith('application/vnd.apache.arrow.stream'):
+        import pyarrow as pa
+        table = pa.ipc.open_stream(response.content).read_all()
+        return {name: table.column(name).to_numpy() for name in names}
+    data = response.json()['data']
+    return {name: np.array([row[name] for row in data]) for name in names}
+
+@cached_chart
 def crimecount_chart(data):
-    cities = list(set(row['City'] for row in data))  
-    categories = list(set(row['Crime_Category'] for row in data))  
-    city_category_counts = {city: {category: 0 for category in categories} for city in cities}
-    for row in data:
-        city = row['City']
-        category = row['Crime_Category']
-        count = row['Crime_Count']
-        city_category_counts[city][category] = count
+    counts = pd.DataFrame(data).pivot_table(index='City', columns='Crime_Category', values='Crime_Count', aggfunc='sum', fill_value=0)
     traces = []
-    for category in categories:
-        counts = [city_category_counts[city][category] for city in cities]
+    for category in counts.columns:
         traces.append(go.Bar(
-            x=cities,
-            y=counts,
+            x=counts.index,
+            y=counts[category],
             name=category
         ))
     fig = go.Figure(data=traces)
@@ -45,14 +152,13 @@ def crimecount_chart(data):
         xaxis=dict(title_font=dict(color='black')),
         yaxis=dict(title_font=dict(color='black'))
     )
-    return fig.to_html(full_html=False)
+    return fig.to_html(full_html=False, include_plotlyjs=False)
 
 
 @app.route("/visualize_crime_category_per_city")
 def visualize_crime_category_per_city():
-    response = requests.get(f"{API_BASE_URL}/crime_category_per_city?key=123")
-    if response.status_code == 200:
-        api_data = response.json()
+    status_code, api_data = api_get("/crime_category_per_city?key=123&orient=columns")
+    if status_code == 200:
         if api_data.get('code') == 1:
             data = api_data.get('data')
             chart_html = crimecount_chart(data)
@@ -60,12 +166,13 @@ def visualize_crime_category_per_city():
         else:
             return f"API Error: {api_data.get('msg')}"
     else:
-        return f"Failed to fetch data: {response.status_code}"
+        return f"Failed to fetch data: {status_code}"
     
 
+@cached_chart
 def crimeyears_chart(data):
-    years = [row['DateYear'] for row in data]
-    crime_counts = [row['Crime_Count'] for row in data]
+    years = data['DateYear']
+    crime_counts = data['Crime_Count']
     fig = go.Figure(data=[go.Bar(x=years, y=crime_counts, marker_color='skyblue')])
     fig.update_layout(
         title="Crime Counts Over the Years",
@@ -78,13 +185,12 @@ def crimeyears_chart(data):
         xaxis=dict(title_font=dict(color='black')),
         yaxis=dict(title_font=dict(color='black'))
     )
-    return fig.to_html(full_html=False)
+    return fig.to_html(full_html=False, include_plotlyjs=False)
 
 @app.route("/visualize_crime_over_years")
 def test_crime_over_years():    
-    response = requests.get(f"{API_BASE_URL}/crime_over_years?key=123")
-    if response.status_code == 200:
-        api_data = response.json()
+    status_code, api_data = api_get("/crime_over_years?key=123&orient=columns")
+    if status_code == 200:
         if api_data.get('code') == 1:
             data = api_data.get('data')
             chart_html = crimeyears_chart(data)
@@ -92,11 +198,12 @@ def test_crime_over_years():
         else:
             return f"API Error: {api_data.get('msg')}"
     else:
-        return f"Failed to fetch data: {response.status_code}"
+        return f"Failed to fetch data: {status_code}"
 
+@cached_chart
 def crime_per_month_chart(data):
-    months = [row['DateMonth'] for row in data]
-    crime_counts = [row['Crime_Count'] for row in data]
+    months = data['DateMonth']
+    crime_counts = data['Crime_Count']
     fig = go.Figure(data=[go.Bar(x=months, y=crime_counts, marker_color='skyblue')])
     fig.update_layout(
         title="Crime Count Per Month",
@@ -112,13 +219,12 @@ def crime_per_month_chart(data):
         xaxis_tickvals=list(range(1, 13)), 
         xaxis_ticktext=[str(i) for i in range(1, 13)]
     )
-    return fig.to_html(full_html=False)
+    return fig.to_html(full_html=False, include_plotlyjs=False)
 
 @app.route("/visualize_crime_per_month")
 def test_crime_per_month():    
-    response = requests.get(f"{API_BASE_URL}/crime_per_month?key=123&city=Seattle")
-    if response.status_code == 200:
-        api_data = response.json()
+    status_code, api_data = api_get("/crime_per_month?key=123&city=Seattle&orient=columns")
+    if status_code == 200:
         if api_data.get('code') == 1:
             data = api_data.get('data')
             chart_html = crime_per_month_chart(data)
@@ -126,12 +232,13 @@ def test_crime_per_month():
         else:
             return f"API Error: {api_data.get('msg')}"
     else:
-        return f"Failed to fetch data: {response.status_code}"
+        return f"Failed to fetch data: {status_code}"
 
 
+@cached_chart
 def crime_by_date_range_chart(data):
-    dates = [row['CrimeDate'] for row in data]
-    crime_counts = [row['Crime_Count'] for row in data]
+    dates = data['CrimeDate']
+    crime_counts = data['Crime_Count']
     fig = go.Figure()
     fig.add_trace(go.Scatter(
         x=dates, 
@@ -156,13 +263,12 @@ def crime_by_date_range_chart(data):
         ),
         yaxis=dict(title_font=dict(color='black')),
     )
-    return fig.to_html(full_html=False)
+    return fig.to_html(full_html=False, include_plotlyjs=False)
 
 @app.route("/visualize_crime_by_date_range")
 def test_crime_by_date_range():
-    response = requests.get(f"{API_BASE_URL}/crime_by_date_range?key=123&start_date=2020-01-01&end_date=2024-01-31")
-    if response.status_code == 200:
-        api_data = response.json()
+    status_code, api_data = api_get("/crime_by_date_range?key=123&start_date=2020-01-01&end_date=2024-01-31&orient=columns")
+    if status_code == 200:
         if api_data.get('code') == 1:
             data = api_data.get('data')
             chart_html = crime_by_date_range_chart(data)
@@ -170,10 +276,11 @@ def test_crime_by_date_range():
         else:
             return f"API Error: {api_data.get('msg')}"
     else:
-        return f"Failed to fetch data: {response.status_code}"
+        return f"Failed to fetch data: {status_code}"
 
 
 
+@cached_chart
 def crime_comparison_chart(data):
     df = pd.DataFrame(data)
     pivot_df = df.pivot_table(index=['City', 'DateYear'], columns='Crime_Category', values='Crime_Count', aggfunc='sum', fill_value=0)
@@ -182,7 +289,7 @@ def crime_comparison_chart(data):
     color_palette = px.colors.qualitative.Set3 
     for i, category in enumerate(pivot_df.columns[2:]):  
         fig.add_trace(go.Bar(
-            x=[f"{city} - {year}" for city, year in zip(pivot_df['City'], pivot_df['DateYear'])], 
+            x=pivot_df['City'] + " - " + pivot_df['DateYear'].astype(str), 
             y=pivot_df[category], 
             name=category,
             marker=dict(color=color_palette[i % len(color_palette)]) 
@@ -200,14 +307,13 @@ def crime_comparison_chart(data):
         xaxis=dict(title_font=dict(color='black')),
         yaxis=dict(title_font=dict(color='black')),
     )
-    return fig.to_html(full_html=False)
+    return fig.to_html(full_html=False, include_plotlyjs=False)
 
 
 @app.route("/visualize_crime_comparison")
 def test_crime_comparison():
-    response = requests.get(f"{API_BASE_URL}/crime_comparison_per_year?key=123")
-    if response.status_code == 200:
-        api_data = response.json()
+    status_code, api_data = api_get("/crime_comparison_per_year?key=123&orient=columns")
+    if status_code == 200:
         if api_data.get('code') == 1:
             data = api_data.get('data')
             chart_html = crime_comparison_chart(data)
@@ -215,12 +321,13 @@ def test_crime_comparison():
         else:
             return f"API Error: {api_data.get('msg')}"
     else:
-        return f"Failed to fetch data: {response.status_code}"
+        return f"Failed to fetch data: {status_code}"
     
 
+@cached_chart
 def crime_statistics_by_category_chart(data):
-    categories = [row['Crime_Category'] for row in data]
-    crime_counts = [row['Crime_Count'] for row in data]
+    categories = data['Crime_Category']
+    crime_counts = data['Crime_Count']
     color_palette = px.colors.qualitative.Set3 
     fig = go.Figure()
     fig.add_trace(go.Bar(
@@ -240,13 +347,12 @@ def crime_statistics_by_category_chart(data):
         xaxis=dict(title_font=dict(color='black'), tickangle=45),  
         yaxis=dict(title_font=dict(color='black')),
     )
-    return fig.to_html(full_html=False)
+    return fig.to_html(full_html=False, include_plotlyjs=False)
 
 @app.route("/visualize_crime_statistics_by_category")
 def test_crime_statistics_by_category():
-    response = requests.get(f"{API_BASE_URL}/crime_statistics_by_category?key=123")
-    if response.status_code == 200:
-        api_data = response.json()
+    status_code, api_data = api_get("/crime_statistics_by_category?key=123&orient=columns")
+    if status_code == 200:
         if api_data.get('code') == 1:
             data = api_data.get('data')
             chart_html = crime_statistics_by_category_chart(data)
@@ -254,9 +360,10 @@ def test_crime_statistics_by_category():
         else:
             return f"API Error: {api_data.get('msg')}"
     else:
-        return f"Failed to fetch data: {response.status_code}"
+        return f"Failed to fetch data: {status_code}"
 
 
+@cached_chart
 def crime_count_by_day_of_week_chart(data):
     data = pd.DataFrame(data)
     day_mapping = {
@@ -279,13 +386,12 @@ def crime_count_by_day_of_week_chart(data):
         yaxis=dict(title_font=dict(size=12)),
         template='plotly',
     )
-    return fig.to_html(full_html=False)
+    return fig.to_html(full_html=False, include_plotlyjs=False)
 
 @app.route("/visualize_crime_count_by_day_of_week")
 def test_crime_count_by_day_of_week():
-    response = requests.get(f"{API_BASE_URL}/crime_by_day_of_week?key=123")
-    if response.status_code == 200:
-        api_data = response.json()
+    status_code, api_data = api_get("/crime_by_day_of_week?key=123&orient=columns")
+    if status_code == 200:
         if api_data.get('code') == 1:
             data = api_data.get('data')
             chart_html = crime_count_by_day_of_week_chart(data)
@@ -293,9 +399,10 @@ def test_crime_count_by_day_of_week():
         else:
             return f"API Error: {api_data.get('msg')}"
     else:
-        return f"Failed to fetch data: {response.status_code}"
+        return f"Failed to fetch data: {status_code}"
 
 
+@cached_chart
 def crime_details_by_city_category_chart(data):
     df = pd.DataFrame(data)
     fig = px.bar(
@@ -314,14 +421,13 @@ def crime_details_by_city_category_chart(data):
         yaxis=dict(title='Crime Sub-Category', title_font=dict(size=12)),
         legend_title_text='Sub-Category'
     )
-    return fig.to_html(full_html=False)
+    return fig.to_html(full_html=False, include_plotlyjs=False)
 
 
 @app.route("/visualize_crime_details_by_city_category")
 def test_crime_details_by_city_category():
-    response = requests.get(f"{API_BASE_URL}/crime_details_by_city_category?key=123&city=Seattle&category=Theft")
-    if response.status_code == 200:
-        api_data = response.json()
+    status_code, api_data = api_get("/crime_details_by_city_category?key=123&city=Seattle&category=Theft&orient=columns")
+    if status_code == 200:
         if api_data.get('code') == 1:
             data = api_data.get('data')
             chart_html = crime_details_by_city_category_chart(data)
@@ -329,53 +435,71 @@ def test_crime_details_by_city_category():
         else:
             return f"API Error: {api_data.get('msg')}"
     else:
-        return f"Failed to fetch data: {response.status_code}"
+        return f"Failed to fetch data: {status_code}"
 
 
-def crime_location_density_by_city_chart(data):
-    df = pd.DataFrame(data)
-    df = df[(df['Latitude'] != 0.0) | (df['Longitude'] != 0.0)]
-    Q1_lat, Q3_lat = np.percentile(df['Latitude'], 25), np.percentile(df['Latitude'], 75)
-    Q1_lon, Q3_lon = np.percentile(df['Longitude'], 25), np.percentile(df['Longitude'], 75)
-    IQR_lat, IQR_lon = Q3_lat - Q1_lat, Q3_lon - Q1_lon
-    df = df[
-        (df['Latitude'] >= Q1_lat - 1.5 * IQR_lat) & (df['Latitude'] <= Q3_lat + 1.5 * IQR_lat) &
-        (df['Longitude'] >= Q1_lon - 1.5 * IQR_lon) & (df['Longitude'] <= Q3_lon + 1.5 * IQR_lon)
-    ]
-    lat_bin_size = 0.01
-    lon_bin_size = 0.01
-    df['lat_bin'] = np.floor(df['Latitude'] / lat_bin_size) * lat_bin_size
-    df['lon_bin'] = np.floor(df['Longitude'] / lon_bin_size) * lon_bin_size
-    bin_counts = df.groupby(['lat_bin', 'lon_bin']).size().reset_index(name='count')
+@cached_chart
+def crime_location_density_by_city_chart(data, center):
+    # Outlier trimming and binning happen server-side (mode=bins)
+    bin_counts = pd.DataFrame(data)
     fig = px.density_mapbox(
         bin_counts,
         lat='lat_bin',
         lon='lon_bin',
         z='count',
         radius=10,
-        center=dict(lat=df['Latitude'].mean(), lon=df['Longitude'].mean()),
+        center=center,
         zoom=10,
         mapbox_style="carto-positron",
         title="Crime Location Density"
     )
-    return fig.to_html(full_html=False)
+    return fig.to_html(full_html=False, include_plotlyjs=False)
 
 
 @app.route("/visualize_crime_location_density_by_city")
 def test_crime_location_density_by_city():
-    response = requests.get(f"{API_BASE_URL}/crime_location_density_by_city?key=123&city=Chicago")
-    if response.status_code == 200:
-        api_data = response.json()
+    status_code, api_data = api_get("/crime_location_density_by_city?key=123&city=Chicago&mode=bins&orient=columns")
+    if status_code == 200:
         if api_data.get('code') == 1:
             data = api_data.get('data')
-            chart_html = crime_location_density_by_city_chart(data)
+            chart_html = crime_location_density_by_city_chart(data, api_data.get('center'))
             return render_template("main.html", chart_html=chart_html)
         else:
             return f"API Error: {api_data.get('msg')}"
     else:
-        return f"Failed to fetch data: {response.status_code}"
+        return f"Failed to fetch data: {status_code}"
     
 
+@cached_chart
+def crime_points_chart(points):
+    fig = go.Figure(go.Densitymapbox(
+        lat=points['Latitude'],
+        lon=points['Longitude'],
+        radius=4,
+    ))
+    fig.update_layout(
+        title="Crime Points (Chicago, Assault)",
+        mapbox_style="carto-positron",
+        mapbox_center=dict(lat=float(np.median(points['Latitude'])), lon=float(np.median(points['Longitude']))),
+        mapbox_zoom=10,
+    )
+    return fig.to_html(full_html=False, include_plotlyjs=False)
+
+
+@app.route("/visualize_crime_points")
+def test_crime_points():
+    response = api_session.get(f"{API_BASE_URL}/geocode_points?key=123&city=Chicago&sub_category=Assault&format=npy&dtype=float32")
+    if response.status_code == 200:
+        if response.headers['Content-Type'].startswith('application/json'):
+            return f"API Error: {response.json().get('msg')}"
+        points = load_point_columns(response)
+        chart_html = crime_points_chart(points)
+        return render_template("main.html", chart_html=chart_html)
+    else:
+        return f"Failed to fetch data: {response.status_code}"
+
+
+@cached_chart
 def geocode_location(latitude, longitude, address):
     data = pd.DataFrame({
         'Latitude': [latitude],
@@ -391,14 +515,13 @@ def geocode_location(latitude, longitude, address):
         mapbox_style="carto-positron",
         title="Geocoded Crime Location"
     )
-    return fig.to_html(full_html=False)
+    return fig.to_html(full_html=False, include_plotlyjs=False)
 
 
 @app.route('/visualize_geocode', methods=['GET'])
 def visualize_geocode():
-    response = requests.get(f"{API_BASE_URL}/geocode?key=123&city=Chicago&sub_category=Assault" )
-    if response.status_code == 200:
-        geocode_data = response.json()
+    status_code, geocode_data = api_get("/geocode?key=123&city=Chicago&sub_category=Assault")
+    if status_code == 200:
         if 'latitude' in geocode_data and 'longitude' in geocode_data:
             latitude = geocode_data['latitude']
             longitude = geocode_data['longitude']
@@ -408,7 +531,61 @@ def visualize_geocode():
         else:
             return f"Geocode Error: {geocode_data.get('error', 'Unknown error')}", 404
     else:
-        return f"Failed to fetch geocode data: {response.status_code}", 500
+        return f"Failed to fetch geocode data: {status_code}", 500
+
+
+# Views on the combined dashboard: (title, API path, chart builder taking the API response)
+DASHBOARD_VIEWS = [
+    ("Crime Category Per City", "/crime_category_per_city?key=123&orient=columns",
+     lambda api_data: crimecount_chart(api_data['data'])),
+    ("Crime Over Years", "/crime_over_years?key=123&orient=columns",
+     lambda api_data: crimeyears_chart(api_data['data'])),
+    ("Crime Per Month (Seattle)", "/crime_per_month?key=123&city=Seattle&orient=columns",
+     lambda api_data: crime_per_month_chart(api_data['data'])),
+    ("Crime By Date Range", "/crime_by_date_range?key=123&start_date=2020-01-01&end_date=2024-01-31&orient=columns",
+     lambda api_data: crime_by_date_range_chart(api_data['data'])),
+    ("Crime Comparison By City and Year", "/crime_comparison_per_year?key=123&orient=columns",
+     lambda api_data: crime_comparison_chart(api_data['data'])),
+    ("Crime Statistics By Category", "/crime_statistics_by_category?key=123&orient=columns",
+     lambda api_data: crime_statistics_by_category_chart(api_data['data'])),
+    ("Crime Count By Day Of Week", "/crime_by_day_of_week?key=123&orient=columns",
+     lambda api_data: crime_count_by_day_of_week_chart(api_data['data'])),
+    ("Crime Details By City Sub-Category (Seattle, Theft)", "/crime_details_by_city_category?key=123&city=Seattle&category=Theft&orient=columns",
+     lambda api_data: crime_details_by_city_category_chart(api_data['data'])),
+    ("Crime Location Density (Chicago)", "/crime_location_density_by_city?key=123&city=Chicago&mode=bins&orient=columns",
+     lambda api_data: crime_location_density_by_city_chart(api_data['data'], api_data.get('center'))),
+    ("Reverse Geocode (Chicago, Assault)", "/geocode?key=123&city=Chicago&sub_category=Assault",
+     lambda api_data: geocode_location(api_data['latitude'], api_data['longitude'], api_data['address'])),
+]
+DASHBOARD_TIMEOUT = 15
+dashboard_executor = ThreadPoolExecutor(max_workers=len(DASHBOARD_VIEWS))
+
+
+def render_panel(title, path, build):
+    # Fetch and chart one view; failures become an error panel instead of
+    # failing the whole page.
+    try:
+        status_code, api_data = api_get(path, timeout=DASHBOARD_TIMEOUT)
+        if status_code != 200 or api_data.get('code') == 0 or 'error' in api_data:
+            raise RuntimeError(api_data.get('msg') or api_data.get('error') or f"HTTP {status_code}")
+        return {'title': title, 'chart_html': build(api_data), 'error': None}
+    except Exception as e:
+        return {'title': title, 'chart_html': None, 'error': str(e)}
+
+
+@app.route("/visualize_all")
+def visualize_all():
+    # All views are fetched and rendered concurrently, so the page takes about
+    # as long as the slowest endpoint rather than the sum of all of them.
+    deadline = time.monotonic() + DASHBOARD_TIMEOUT + 5
+    futures = [dashboard_executor.submit(render_panel, *view) for view in DASHBOARD_VIEWS]
+    panels = []
+    for (title, _, _), future in zip(DASHBOARD_VIEWS, futures):
+        try:
+            panels.append(future.result(timeout=max(0, deadline - time.monotonic())))
+        except FutureTimeout:
+            panels.append({'title': title, 'chart_html': None, 'error': 'Timed out'})
+    return render_template("all.html", panels=panels)
 
 
 if __name__ == "__main__":
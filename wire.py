@@ -0,0 +1,53 @@
+import io
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+JSON_MIMETYPE = 'application/json'
+NPY_MIMETYPE = 'application/x-npy'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+FORMATS = {'json': JSON_MIMETYPE, 'npy': NPY_MIMETYPE, 'arrow': ARROW_MIMETYPE}
+DTYPES = {'float32': np.float32, 'float64': np.float64}
+
+
+def negotiate(format_param, accept_mimetypes):
+    # An explicit format= wins; otherwise honour the Accept header, with JSON
+    # as the default for browsers and anything that sends */*.
+    if format_param:
+        if format_param not in FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+        fmt = format_param
+    else:
+        best = accept_mimetypes.best_match([JSON_MIMETYPE, NPY_MIMETYPE, ARROW_MIMETYPE], default=JSON_MIMETYPE)
+        fmt = {mimetype: name for name, mimetype in FORMATS.items()}[best]
+    if fmt == 'arrow' and pa is None:
+        raise LookupError("Arrow output needs pyarrow installed on the server")
+    return fmt
+
+
+def encode_npy(columns, dtype):
+    # One (n_columns, n_rows) C-ordered array: each column is a contiguous
+    # buffer the client can view without copying.
+    array = np.ascontiguousarray(np.stack(columns).astype(dtype, copy=False))
+    buf = io.BytesIO()
+    np.lib.format.write_array(buf, array, allow_pickle=False)
+    return buf.getvalue()
+
+
+def encode_arrow(columns, names, dtype):
+    table = pa.table({name: pa.array(column.astype(dtype, copy=False)) for name, column in zip(names, columns)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode(fmt, columns, names, dtype):
+    if fmt == 'npy':
+        return encode_npy(columns, dtype)
+    return encode_arrow(columns, names, dtype)
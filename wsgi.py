@@ -0,0 +1,3 @@
+# Production entry point for the threaded Flask app:
+#   gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:5000 wsgi:app
+from app import app